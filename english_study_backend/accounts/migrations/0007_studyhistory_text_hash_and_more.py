@@ -0,0 +1,58 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:00
+
+import hashlib
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def hash_study_text(text):
+    # Frozen copy of accounts.models.hash_study_text
+    normalized = ' '.join(unicodedata.normalize('NFC', text).split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def backfill_text_hash(apps, schema_editor):
+    """Hash existing rows and merge duplicates into the newest row per text"""
+    StudyHistory = apps.get_model('accounts', 'StudyHistory')
+    kept = {}
+    duplicates = []
+    rows = StudyHistory.objects.order_by('-created_at', '-id').only('id', 'user_id', 'english_text', 'accessed_count')
+    for item in rows.iterator(chunk_size=2000):
+        item.text_hash = hash_study_text(item.english_text)
+        key = (item.user_id, item.text_hash)
+        if key in kept:
+            kept[key].accessed_count += item.accessed_count
+            duplicates.append(item.id)
+        else:
+            kept[key] = item
+    StudyHistory.objects.bulk_update(list(kept.values()), ['text_hash', 'accessed_count'], batch_size=2000)
+    for start in range(0, len(duplicates), 500):
+        StudyHistory.objects.filter(id__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_studyhistory_source_language'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studyhistory',
+            name='text_hash',
+            field=models.CharField(default='', editable=False, max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_text_hash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='studyhistory',
+            index=models.Index(fields=['user', '-created_at'], name='study_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='studyhistory',
+            constraint=models.UniqueConstraint(fields=('user', 'text_hash'), name='unique_study_text_per_user'),
+        ),
+    ]
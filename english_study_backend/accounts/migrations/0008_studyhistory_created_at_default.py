@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_studyhistory_text_hash_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='studyhistory',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
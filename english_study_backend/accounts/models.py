@@ -1,6 +1,11 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
 from django.contrib.auth.models import User
+from django.utils import timezone
+import datetime
+import hashlib
+import unicodedata
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -65,15 +70,154 @@ class UserProfile(models.Model):
         """Reset daily usage counter if it's a new day"""
         from datetime import date
         if self.last_usage_date < date.today():
+            # Only the two columns, and only if no concurrent request rolled it over first
+            UserProfile.objects.filter(pk=self.pk, last_usage_date__lt=date.today()).update(
+                daily_character_usage=0, last_usage_date=date.today()
+            )
             self.daily_character_usage = 0
             self.last_usage_date = date.today()
-            self.save()
+
+def hash_study_text(text):
+    """Return the de-duplication hash of a study text (NFC, whitespace collapsed)"""
+    normalized = ' '.join(unicodedata.normalize('NFC', text).split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+# Item ids at or above this are JS millisecond timestamps sent by older clients
+LEGACY_ITEM_ID_MIN = 10 ** 12
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Legacy timestamp ranges OR'd into one DELETE, below SQLite's expression depth limit
+LEGACY_DELETE_BATCH = 200
+
+class StudyHistoryManager(models.Manager):
+    def delete_selected(self, user_id, item_ids):
+        """Delete a user's items by primary key with one DELETE inside a transaction
+        
+        Millisecond-timestamp ids from older clients are still accepted and
+        matched to the exact millisecond of created_at, LEGACY_DELETE_BATCH
+        per extra DELETE. Ids that are not
+        integers are ignored. Returns the number of rows deleted.
+        """
+        primary_keys = []
+        timestamps = []
+        for item_id in item_ids:
+            try:
+                item_id = int(item_id)
+            except (TypeError, ValueError):
+                continue
+            if item_id >= LEGACY_ITEM_ID_MIN:
+                timestamps.append(EPOCH + datetime.timedelta(milliseconds=item_id))
+            elif item_id > 0:
+                primary_keys.append(item_id)
+        
+        one_ms = datetime.timedelta(milliseconds=1)
+        conditions = []
+        if primary_keys:
+            conditions.append(Q(id__in=primary_keys))
+        for start in range(0, len(timestamps), LEGACY_DELETE_BATCH):
+            legacy = Q()
+            for timestamp in timestamps[start:start + LEGACY_DELETE_BATCH]:
+                legacy |= Q(created_at__gte=timestamp, created_at__lt=timestamp + one_ms)
+            conditions.append(legacy)
+        
+        deleted_count = 0
+        with transaction.atomic():
+            for condition in conditions:
+                count, _ = self.filter(condition, user_id=user_id).delete()
+                deleted_count += count
+        return deleted_count
+    
+    def import_items(self, user_id, items, batch_size=500):
+        """Merge many items into a user's history in one transaction
+        
+        items are dicts of StudyHistory fields including english_text,
+        newest first. Items repeating a text, in the batch or already in
+        the history, are merged into one row whose accessed_count grows by
+        the number of repeats; the rest are inserted with bulk_create in
+        batch_size chunks, oldest first so history order is kept. Texts a
+        concurrent save inserts first are merged the same way.
+        Returns (inserted, merged, repeated): new rows, texts merged into
+        rows already in the history, and items repeating an earlier item
+        of the same batch.
+        """
+        repeats = {}
+        unique_items = {}
+        for item in items:
+            text_hash = hash_study_text(item['english_text'])
+            repeats[text_hash] = repeats.get(text_hash, 0) + 1
+            unique_items.setdefault(text_hash, item)
+        
+        hashes = list(unique_items)
+        now = timezone.now()
+        with transaction.atomic():
+            existing = set()
+            for start in range(0, len(hashes), batch_size):
+                existing.update(self.filter(
+                    user_id=user_id, text_hash__in=hashes[start:start + batch_size]
+                ).values_list('text_hash', flat=True))
+            self._add_repeats(user_id, existing, repeats, now, batch_size)
+            
+            new_hashes = [text_hash for text_hash in reversed(hashes) if text_hash not in existing]
+            inserted = 0
+            for start in range(0, len(new_hashes), batch_size):
+                chunk = new_hashes[start:start + batch_size]
+                while chunk:
+                    try:
+                        with transaction.atomic():
+                            self.bulk_create([
+                                self.model(user_id=user_id, text_hash=text_hash, accessed_count=repeats[text_hash],
+                                           **unique_items[text_hash])
+                                for text_hash in chunk
+                            ])
+                        inserted += len(chunk)
+                        break
+                    except IntegrityError:
+                        # A concurrent save inserted some of these texts first: merge into its rows
+                        taken = set(self.filter(user_id=user_id, text_hash__in=chunk).values_list('text_hash', flat=True))
+                        if not taken:
+                            raise
+                        self._add_repeats(user_id, taken, repeats, now, batch_size)
+                        chunk = [text_hash for text_hash in chunk if text_hash not in taken]
+        return inserted, len(unique_items) - inserted, len(items) - len(unique_items)
+    
+    def _add_repeats(self, user_id, text_hashes, repeats, now, batch_size):
+        """Add each text's repeat count to its existing row, one UPDATE per chunk sharing an increment"""
+        by_increment = {}
+        for text_hash in text_hashes:
+            by_increment.setdefault(repeats[text_hash], []).append(text_hash)
+        for increment, increment_hashes in by_increment.items():
+            for start in range(0, len(increment_hashes), batch_size):
+                self.filter(user_id=user_id, text_hash__in=increment_hashes[start:start + batch_size]).update(
+                    accessed_count=F('accessed_count') + increment, last_accessed=now)
+    
+    def upsert(self, user, text, **fields):
+        """Insert a study item, or update the user's existing item for the same text
+        
+        An existing row gets the new fields and an atomic accessed_count
+        increment. Returns (id, created_at, created).
+        """
+        text_hash = hash_study_text(text)
+        existing = self.filter(user=user, text_hash=text_hash)
+        with transaction.atomic():
+            if existing.update(accessed_count=F('accessed_count') + 1, last_accessed=timezone.now(), **fields):
+                item_id, created_at = existing.values_list('id', 'created_at').get()
+                return item_id, created_at, False
+            try:
+                with transaction.atomic():
+                    item = self.create(user=user, english_text=text, text_hash=text_hash, **fields)
+                return item.id, item.created_at, True
+            except IntegrityError:
+                # Another request inserted the same text first
+                existing.update(accessed_count=F('accessed_count') + 1, last_accessed=timezone.now(), **fields)
+                item_id, created_at = existing.values_list('id', 'created_at').get()
+                return item_id, created_at, False
 
 class StudyHistory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='study_history')
     
     # Study content
     english_text = models.TextField()
+    text_hash = models.CharField(max_length=64, editable=False)  # hash_study_text(english_text)
     korean_translation = models.TextField(blank=True)
     target_language = models.CharField(max_length=10, default='ko')  # Language code
     source_language = models.CharField(max_length=10, default='auto')  # Source language code
@@ -83,12 +227,24 @@ class StudyHistory(models.Model):
     voice_speed_used = models.CharField(max_length=10, blank=True)
     
     # Metadata
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)  # Not auto_now_add: imports keep their own time
     accessed_count = models.IntegerField(default=1)
     last_accessed = models.DateTimeField(auto_now=True)
     
+    objects = StudyHistoryManager()
+    
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'text_hash'], name='unique_study_text_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='study_user_created_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.text_hash = hash_study_text(self.english_text)
+        super().save(*args, **kwargs)
         
     def __str__(self):
         return f"{self.user.username}: {self.english_text[:50]}..."
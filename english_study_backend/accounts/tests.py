@@ -1,3 +1,151 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
 from django.test import TestCase
+from django.utils import timezone
+
+from .models import StudyHistory, StudyHistoryManager, hash_study_text
+
+
+def study_item(text):
+    return {'english_text': text, 'korean_translation': f'{text} (ko)'}
+
+
+class ImportItemsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner')
+
+    def counts(self):
+        return dict(StudyHistory.objects.filter(user=self.user).values_list('english_text', 'accessed_count'))
+
+    def test_inserts_new_items_oldest_first(self):
+        result = StudyHistory.objects.import_items(self.user.id, [study_item('newest'), study_item('oldest')])
+        self.assertEqual(result, (2, 0, 0))
+        rows = StudyHistory.objects.filter(user=self.user).order_by('id').values_list('english_text', flat=True)
+        self.assertEqual(list(rows), ['oldest', 'newest'])
+
+    def test_merges_repeats_in_the_batch_and_the_history(self):
+        StudyHistory.objects.create(user=self.user, english_text='Hello  there')
+        items = [study_item('Hello there'), study_item('Bye'), study_item('Bye'), study_item('Hello there')]
+        # Bye is new and repeated in the batch; Hello there is merged into the existing row and repeated
+        self.assertEqual(StudyHistory.objects.import_items(self.user.id, items), (1, 1, 2))
+        self.assertEqual(self.counts(), {'Hello  there': 3, 'Bye': 2})
+
+    def test_small_batches(self):
+        items = [study_item(f'sentence {index}') for index in range(7)]
+        self.assertEqual(StudyHistory.objects.import_items(self.user.id, items, batch_size=3), (7, 0, 0))
+        self.assertEqual(StudyHistory.objects.filter(user=self.user).count(), 7)
+
+    def test_text_saved_concurrently_is_merged_not_dropped(self):
+        real_add_repeats = StudyHistoryManager._add_repeats
+        raced = []
+
+        def add_repeats(manager, *args):
+            if not raced:
+                # Another request saves one of the texts after the lookup, before the insert
+                raced.append(StudyHistory.objects.create(user=self.user, english_text='Second'))
+            return real_add_repeats(manager, *args)
+
+        items = [study_item('First'), study_item('Second'), study_item('Second'), study_item('Third')]
+        with mock.patch.object(StudyHistoryManager, '_add_repeats', autospec=True, side_effect=add_repeats):
+            result = StudyHistory.objects.import_items(self.user.id, items)
+        self.assertEqual(result, (2, 1, 1))
+        self.assertEqual(self.counts(), {'First': 1, 'Second': 3, 'Third': 1})
+
+    def test_other_users_are_untouched(self):
+        other = User.objects.create_user('other')
+        StudyHistory.objects.create(user=other, english_text='Shared')
+        self.assertEqual(StudyHistory.objects.import_items(self.user.id, [study_item('Shared')]), (1, 0, 0))
+        self.assertEqual(StudyHistory.objects.get(user=other).accessed_count, 1)
+
+    def test_keeps_given_creation_times(self):
+        saved = timezone.now() - datetime.timedelta(days=30)
+        StudyHistory.objects.import_items(self.user.id, [study_item('new'), dict(study_item('old'), created_at=saved)])
+        times = dict(StudyHistory.objects.filter(user=self.user).values_list('english_text', 'created_at'))
+        self.assertEqual(times['old'], saved)
+        self.assertGreater(times['new'], saved + datetime.timedelta(days=29))
+
+    def test_hash_ignores_whitespace_differences(self):
+        self.assertEqual(hash_study_text(' a  b\n'), hash_study_text('a b'))
+
+
+class UpsertTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner')
+
+    def test_creates_then_counts_repeats(self):
+        item_id, created_at, created = StudyHistory.objects.upsert(self.user, 'Good morning', korean_translation='좋은 아침')
+        self.assertTrue(created)
+        again_id, again_created_at, created = StudyHistory.objects.upsert(self.user, 'Good morning', voice_speed_used='0.8')
+        self.assertFalse(created)
+        self.assertEqual((again_id, again_created_at), (item_id, created_at))
+        item = StudyHistory.objects.get(pk=item_id)
+        self.assertEqual((item.accessed_count, item.korean_translation, item.voice_speed_used), (2, '좋은 아침', '0.8'))
+
+    def test_same_text_with_different_whitespace_is_one_item(self):
+        StudyHistory.objects.upsert(self.user, 'Good morning')
+        _, _, created = StudyHistory.objects.upsert(self.user, ' Good\n morning ')
+        self.assertFalse(created)
+        self.assertEqual(StudyHistory.objects.filter(user=self.user).count(), 1)
+
+    def test_increment_is_applied_in_the_database(self):
+        item_id, _, _ = StudyHistory.objects.upsert(self.user, 'Hello')
+        # A stale in-memory count must not overwrite increments made elsewhere
+        StudyHistory.objects.filter(pk=item_id).update(accessed_count=5)
+        StudyHistory.objects.upsert(self.user, 'Hello')
+        self.assertEqual(StudyHistory.objects.get(pk=item_id).accessed_count, 6)
+
+    def test_lost_insert_race_updates_the_winner(self):
+        winner = StudyHistory.objects.create(user=self.user, english_text='Hello')
+        real_update = QuerySet.update
+        raced = []
+
+        def update(queryset, **kwargs):
+            if not raced:
+                # The other request's row is not visible to the first update
+                raced.append(True)
+                return 0
+            return real_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update):
+            item_id, _, created = StudyHistory.objects.upsert(self.user, 'Hello')
+        self.assertFalse(created)
+        self.assertEqual(item_id, winner.id)
+        self.assertEqual(StudyHistory.objects.get(pk=winner.id).accessed_count, 2)
+
+
+class DeleteSelectedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner')
+        self.items = []
+        for index in range(3):
+            item = StudyHistory.objects.create(user=self.user, english_text=f'sentence {index}')
+            # Distinct milliseconds, as for items saved by separate requests
+            item.created_at = timezone.now() - datetime.timedelta(seconds=index)
+            StudyHistory.objects.filter(pk=item.pk).update(created_at=item.created_at)
+            self.items.append(item)
+
+    def remaining(self):
+        return set(StudyHistory.objects.filter(user=self.user).values_list('english_text', flat=True))
+
+    def test_deletes_by_primary_key(self):
+        deleted = StudyHistory.objects.delete_selected(self.user.id, [self.items[0].id, str(self.items[2].id)])
+        self.assertEqual(deleted, 2)
+        self.assertEqual(self.remaining(), {'sentence 1'})
+
+    def test_legacy_millisecond_ids_match_created_at(self):
+        legacy_id = int(self.items[1].created_at.timestamp() * 1000)
+        self.assertEqual(StudyHistory.objects.delete_selected(self.user.id, [legacy_id]), 1)
+        self.assertEqual(self.remaining(), {'sentence 0', 'sentence 2'})
+
+    def test_invalid_ids_are_ignored(self):
+        self.assertEqual(StudyHistory.objects.delete_selected(self.user.id, ['abc', None, -1, 0]), 0)
+        self.assertEqual(len(self.remaining()), 3)
 
-# Create your tests here.
+    def test_other_users_items_are_untouched(self):
+        other = User.objects.create_user('other')
+        theirs = StudyHistory.objects.create(user=other, english_text='sentence 0')
+        self.assertEqual(StudyHistory.objects.delete_selected(self.user.id, [theirs.id]), 0)
+        self.assertTrue(StudyHistory.objects.filter(pk=theirs.pk).exists())
@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import SynthesisJob
 
-# Register your models here.
+@admin.register(SynthesisJob)
+class SynthesisJobAdmin(admin.ModelAdmin):
+    list_display = ['user', 'speed', 'language', 'status', 'attempts', 'run_after', 'created_at']
+    list_filter = ['status', 'speed']
+    search_fields = ['user__username', 'text']
+    readonly_fields = ['text_hash', 'claim_token', 'created_at']
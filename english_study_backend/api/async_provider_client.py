@@ -0,0 +1,101 @@
+"""
+Async counterpart of provider_client for the ASGI request path.
+
+Uses one httpx.AsyncClient per event loop, sized and timed out from the
+same settings.PROVIDER_HTTP block, so a single ASGI worker can keep many
+upstream requests in flight without holding a thread for each one.
+"""
+import asyncio
+import time
+import weakref
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+
+from asgiref.sync import sync_to_async
+
+from . import circuit_breaker, provider_client
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+_clients = weakref.WeakKeyDictionary()
+
+
+class AsyncClientUnavailable(RuntimeError):
+    pass
+
+
+def _build_timeout(timeout):
+    if isinstance(timeout, (tuple, list)):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+def _build_client(config):
+    limits = httpx.Limits(
+        max_connections=config['ASYNC_MAX_CONNECTIONS'],
+        max_keepalive_connections=config['POOL_MAXSIZE'],
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=_build_timeout(config['DEFAULT_TIMEOUT']),
+        # Clients are shared by every user, so never carry cookies between calls
+        cookies=httpx.Cookies(CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))),
+        follow_redirects=True,
+    )
+
+
+def get_client(config=None):
+    """Return the AsyncClient bound to the running event loop"""
+    if httpx is None:
+        raise AsyncClientUnavailable('httpx is required for the async provider path')
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _build_client(config or provider_client.get_client_settings())
+        _clients[loop] = client
+    return client
+
+
+async def close_clients():
+    """Close the client for the running loop"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def _record_outcome(provider, outcome, api_key):
+    await sync_to_async(circuit_breaker.record_outcome, thread_sensitive=False)(provider, outcome, api_key)
+
+
+async def request(provider, method, url, breaker_scope=None, **kwargs):
+    """Send a request to a provider; mirrors provider_client.request"""
+    config = provider_client.get_client_settings()
+    url = provider_client.resolve_url(url, config)
+    timeout = kwargs.pop('timeout', None) or provider_client.get_timeout(provider, config)
+    client = get_client(config)
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, timeout=_build_timeout(timeout), **kwargs)
+    except httpx.TimeoutException:
+        provider_client.record_provider_call(provider, method, url, None, circuit_breaker.TIMEOUT, start)
+        await _record_outcome(provider, circuit_breaker.TIMEOUT, breaker_scope)
+        raise
+    except httpx.HTTPError:
+        provider_client.record_provider_call(provider, method, url, None, circuit_breaker.FAILURE, start)
+        await _record_outcome(provider, circuit_breaker.FAILURE, breaker_scope)
+        raise
+    outcome = circuit_breaker.classify_status(response.status_code)
+    provider_client.record_provider_call(provider, method, url, response.status_code, outcome, start)
+    await _record_outcome(provider, outcome, breaker_scope)
+    return response
+
+
+async def get(provider, url, **kwargs):
+    return await request(provider, 'GET', url, **kwargs)
+
+
+async def post(provider, url, **kwargs):
+    return await request(provider, 'POST', url, **kwargs)
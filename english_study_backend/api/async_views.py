@@ -0,0 +1,335 @@
+"""
+Async versions of the TTS and translation views for ASGI deployments.
+
+The provider fallback order, request parsing and response shapes are shared
+with api.views; only the transport differs. Upstream calls go through
+async_provider_client, so a slow provider parks a coroutine instead of a
+worker thread. ORM and file-cache access still run in threads via
+sync_to_async.
+"""
+import base64
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from . import async_provider_client, hedging, json_codec, language_detect, metrics, provider_client, translation_cache, usage
+from .audio_cache import get_audio_cache, make_cache_key
+from .json_codec import JsonResponse
+from .views import (
+    GOOGLE_TTS_HEADERS, GOOGLE_TTS_MIN_AUDIO_BYTES,
+    LANGUAGE_NAMES, OFFICIAL_GOOGLE_TRANSLATE_URL,
+    base64_decoded_size, build_elevenlabs_request, build_free_google_translate_url, build_google_cloud_tts_request,
+    build_google_tts_url, build_groq_translation_request, build_language_detect_url,
+    build_official_google_translate_params, get_basic_translation, get_request_profile,
+    get_translation_provider_chain, get_tts_provider_chain, parse_detected_language,
+    parse_free_google_translation, parse_translate_request, parse_tts_request, skip_open_circuits,
+)
+
+logger = logging.getLogger(__name__)
+# Request bodies and provider responses; enable with the api.payloads logger at DEBUG
+payload_logger = logging.getLogger('api.payloads')
+
+
+async def acall_elevenlabs_api(text, api_key, speed='normal'):
+    """Async call_elevenlabs_api"""
+    try:
+        url, headers, data = build_elevenlabs_request(text, api_key, speed)
+        response = await async_provider_client.post(provider_client.ELEVENLABS, url, json=data, headers=headers, breaker_scope=api_key)
+        if response.status_code == 200:
+            return base64.b64encode(response.content).decode('utf-8')
+        logger.warning("ElevenLabs API error: %s", response.status_code)
+        payload_logger.debug("ElevenLabs API error response: %s", response.text)
+    except Exception as e:
+        logger.warning("ElevenLabs API exception: %s", e)
+    return None
+
+
+async def acall_google_tts_api(text, speed='normal', language='en'):
+    """Async call_google_tts_api"""
+    try:
+        url = build_google_tts_url(text, speed, language)
+        response = await async_provider_client.get(provider_client.GOOGLE_TTS, url, headers=GOOGLE_TTS_HEADERS)
+        if response.status_code == 200 and len(response.content) > GOOGLE_TTS_MIN_AUDIO_BYTES:
+            return base64.b64encode(response.content).decode('utf-8')
+        logger.warning("Google TTS proxy error: %s - Content length: %s", response.status_code, len(response.content))
+    except Exception as e:
+        logger.warning("Google TTS proxy exception: %s", e)
+    return None
+
+
+async def acall_google_cloud_tts_api(text, api_key, speed='normal', language='en'):
+    """Async call_google_cloud_tts_api"""
+    try:
+        if not api_key:
+            return None
+        url, headers, data = build_google_cloud_tts_request(text, api_key, speed, language)
+        response = await async_provider_client.post(provider_client.GOOGLE_CLOUD_TTS, url, json=data, headers=headers, breaker_scope=api_key)
+        if response.status_code == 200:
+            return response.json().get('audioContent')
+        logger.warning("Google Cloud TTS API error: %s", response.status_code)
+        payload_logger.debug("Google Cloud TTS API error response: %s", response.text)
+    except Exception as e:
+        logger.warning("Google Cloud TTS API exception: %s", e)
+    return None
+
+
+async def acall_groq_tts_api(text, api_key, speed='normal'):
+    """Groq has no TTS API yet (see call_groq_tts_api)"""
+    return None
+
+
+async def acall_groq_translation_api(text, api_key, target_language='ko', source_language='auto'):
+    """Async call_groq_translation_api"""
+    try:
+        url, headers, data = build_groq_translation_request(text, api_key, target_language, source_language)
+        logger.debug("Calling Groq translation API to translate to %s...", LANGUAGE_NAMES.get(target_language, target_language))
+        response = await async_provider_client.post(provider_client.GROQ, url, json=data, headers=headers, breaker_scope=api_key)
+        if response.status_code == 200:
+            return response.json()['choices'][0]['message']['content'].strip()
+        logger.warning("Groq translation API error: %s", response.status_code)
+        payload_logger.debug("Groq translation API error response: %s", response.text)
+    except Exception as e:
+        logger.warning("Groq translation API exception: %s", e)
+    return None
+
+
+async def acall_official_google_translate_api(text, api_key, target_language='ko', source_language='auto'):
+    """Async call_official_google_translate_api"""
+    try:
+        if not api_key:
+            return None
+        params = build_official_google_translate_params(text, api_key, target_language, source_language)
+        # requests drops None parameters, httpx does not
+        params = {name: value for name, value in params.items() if value is not None}
+        response = await async_provider_client.get(provider_client.GOOGLE_TRANSLATE, OFFICIAL_GOOGLE_TRANSLATE_URL, params=params, breaker_scope=api_key)
+        if response.status_code == 200:
+            return response.json()['data']['translations'][0]['translatedText']
+        logger.warning("Official Google Translate API error: %s", response.status_code)
+        payload_logger.debug("Official Google Translate API error response: %s", response.text)
+    except Exception as e:
+        logger.warning("Official Google Translate API exception: %s", e)
+    return None
+
+
+async def ahandle_google_translation(text, target_language='ko', source_language='auto'):
+    """Async handle_google_translation"""
+    try:
+        response = await async_provider_client.get(
+            provider_client.GOOGLE_TRANSLATE_FREE,
+            build_free_google_translate_url(text, target_language, source_language)
+        )
+        if response.status_code == 200:
+            return parse_free_google_translation(response.json())
+    except Exception as e:
+        logger.warning("Free Google translation failed: %s", e)
+    return None
+
+
+async def adetect_text_language(text):
+    """Async detect_text_language"""
+    try:
+        response = await async_provider_client.get(provider_client.LANGUAGE_DETECT, build_language_detect_url(text))
+        if response.status_code == 200:
+            return parse_detected_language(response.json())
+    except Exception as e:
+        logger.warning("Language detection failed: %s", e)
+    return None
+
+
+async def adetect_source_language(text):
+    """Async detect_source_language"""
+    language, confident = language_detect.guess_language(text)
+    if not confident:
+        language = await adetect_text_language(text) or language
+    return language or 'en'
+
+
+def get_async_synthesizer(provider, text, speed):
+    """Return a coroutine function synthesizing audio for a TTS chain entry"""
+    if provider.get('chunked'):
+        # Long-text mode already runs its chunks concurrently on a thread pool
+        return sync_to_async(provider['synthesize'], thread_sensitive=False)
+    service = provider['service']
+    api_key = provider['api_key']
+    language = provider['language']
+    if service == 'elevenlabs':
+        return lambda: acall_elevenlabs_api(text, api_key, speed)
+    if service == 'google_cloud':
+        return lambda: acall_google_cloud_tts_api(text, api_key, speed, language)
+    if service == 'groq':
+        return lambda: acall_groq_tts_api(text, api_key, speed)
+    return lambda: acall_google_tts_api(text, speed, language)
+
+
+def get_async_translator(provider, text, target_language, source_language):
+    """Return a coroutine function translating text for a translation chain entry"""
+    service = provider['service']
+    api_key = provider['api_key']
+    if service == 'groq':
+        return lambda: acall_groq_translation_api(text, api_key, target_language, source_language)
+    if service == 'google_official':
+        return lambda: acall_official_google_translate_api(text, api_key, target_language, source_language)
+    return lambda: ahandle_google_translation(text, target_language, source_language)
+
+
+async def asynthesize_with_cache(service, text, language, speed, voice, synthesize):
+    """Async synthesize_with_cache; disk cache I/O runs in a worker thread"""
+    audio_cache = get_audio_cache()
+    cache_key = make_cache_key(text, language, speed, service, voice)
+
+    audio_bytes = await sync_to_async(audio_cache.get, thread_sensitive=False)(cache_key)
+    if audio_bytes is not None:
+        metrics.inc('api_cache_lookups_total', ('audio', 'hit'))
+        return base64.b64encode(audio_bytes).decode('utf-8'), True
+
+    metrics.inc('api_cache_lookups_total', ('audio', 'miss'))
+    audio_data = await synthesize()
+    if audio_data:
+        await sync_to_async(audio_cache.set, thread_sensitive=False)(cache_key, base64.b64decode(audio_data))
+    return audio_data, False
+
+
+def make_async_tts_attempt(provider, text, speed):
+    """Async make_tts_attempt"""
+    async def attempt():
+        audio_data, cached = await asynthesize_with_cache(
+            provider['service'], text, provider['language'], speed, provider['voice'],
+            get_async_synthesizer(provider, text, speed)
+        )
+        return (audio_data, cached) if audio_data else None
+    return attempt
+
+
+def make_async_translation_attempt(provider, text, target_language, source_language):
+    """Async make_translation_attempt"""
+    async def attempt():
+        translation, cache_status = await translation_cache.aget_or_translate(
+            provider['service'], text, source_language, target_language,
+            get_async_translator(provider, text, target_language, source_language),
+            api_key=provider['api_key']
+        )
+        return (translation, cache_status) if translation else None
+    return attempt
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def text_to_speech_async(request):
+    try:
+        text, speed, service, source_language = parse_tts_request(request)
+
+        if not text:
+            return JsonResponse({'error': 'Text is required'}, status=400)
+
+        if request.token_user_id is not None and not await sync_to_async(usage.consume)(request.token_user_id, len(text)):
+            return JsonResponse({'error': 'Daily character limit reached'}, status=429)
+
+        if source_language == 'auto':
+            source_language = await adetect_source_language(text)
+
+        logger.info("Async TTS Request - Language: %s, Service: %s, Speed: %s", source_language, service, speed)
+
+        user, profile = await sync_to_async(get_request_profile)(request)
+
+        chain = await sync_to_async(skip_open_circuits, thread_sensitive=False)(
+            get_tts_provider_chain(text, speed, service, source_language, profile)
+        )
+        hedging_settings = hedging.get_hedging_settings()
+        index, result = await hedging.arun_hedged(
+            [(provider['label'], make_async_tts_attempt(provider, text, speed)) for provider in chain],
+            hedge_delay=hedging.get_hedge_delay(hedging_settings),
+            no_hedge=hedging.paid_attempts(chain),
+            deadline=hedging_settings['TTS_DEADLINE']
+        )
+        if result:
+            provider = chain[index]
+            audio_data, cached = result
+            if cached and request.token_user_id is not None:
+                await sync_to_async(usage.refund)(request.token_user_id, len(text))
+            metrics.inc('api_fallback_depth_total', ('tts', index, provider['service']))
+            metrics.inc('api_audio_bytes_served_total', (provider['service'],), base64_decoded_size(audio_data))
+            return JsonResponse({
+                'success': True,
+                'service': provider['service'],
+                'audio_data': audio_data,
+                'cached': cached,
+                'message': provider['message']
+            })
+
+        if request.token_user_id is not None:
+            await sync_to_async(usage.refund)(request.token_user_id, len(text))
+        metrics.inc('api_fallback_depth_total', ('tts', len(chain), 'browser'))
+        return JsonResponse({
+            'success': True,
+            'service': 'browser',
+            'use_browser_tts': True,
+            'message': 'Use browser TTS fallback' if profile else 'Use browser TTS for guest'
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("Async TTS error")
+        return JsonResponse({'error': 'TTS failed'}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def translate_text_async(request):
+    try:
+        text, service, target_language, source_language = parse_translate_request(request)
+
+        if not text:
+            return JsonResponse({'error': 'Text is required'}, status=400)
+
+        if request.token_user_id is not None and not await sync_to_async(usage.consume)(request.token_user_id, len(text)):
+            return JsonResponse({'error': 'Daily character limit reached'}, status=429)
+
+        logger.info("Async translation request - From: %s, To: %s, Service: %s", source_language, target_language, service)
+
+        user, profile = await sync_to_async(get_request_profile)(request)
+
+        chain = await sync_to_async(skip_open_circuits, thread_sensitive=False)(
+            get_translation_provider_chain(text, service, target_language, source_language, profile)
+        )
+        hedging_settings = hedging.get_hedging_settings()
+        index, result = await hedging.arun_hedged(
+            [(provider['label'], make_async_translation_attempt(provider, text, target_language, source_language)) for provider in chain],
+            hedge_delay=hedging.get_hedge_delay(hedging_settings),
+            no_hedge=hedging.paid_attempts(chain),
+            deadline=hedging_settings['TRANSLATION_DEADLINE']
+        )
+        if result:
+            translation, cache_status = result
+            if cache_status != translation_cache.CACHE_MISS and request.token_user_id is not None:
+                await sync_to_async(usage.refund)(request.token_user_id, len(text))
+            metrics.inc('api_fallback_depth_total', ('translation', index, chain[index]['service']))
+            return JsonResponse({
+                'success': True,
+                'service': chain[index]['service'],
+                'translation': translation,
+                'cache': cache_status
+            })
+
+        if request.token_user_id is not None:
+            await sync_to_async(usage.refund)(request.token_user_id, len(text))
+        metrics.inc('api_fallback_depth_total', ('translation', len(chain), 'basic'))
+        return JsonResponse({
+            'success': True,
+            'service': 'basic',
+            'translation': get_basic_translation(text, target_language, source_language),
+            'message': 'Using basic translation dictionary'
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("Async translation error")
+        return JsonResponse({'error': 'Translation failed'}, status=500)
@@ -0,0 +1,365 @@
+"""
+Content-addressed cache for synthesized TTS audio.
+
+Audio is keyed on the normalized text plus every parameter that changes the
+generated waveform (language, speed, service and voice). Entries live in two
+tiers: a small in-memory LRU for hot replays and an on-disk directory with a
+byte budget. The disk tier uses file mtimes as its LRU clock so several
+worker processes can share one directory without extra coordination.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+AUDIO_FILE_SUFFIX = '.mp3'
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    'DIR': None,
+    'MAX_DISK_BYTES': 512 * 1024 * 1024,
+    'MAX_MEMORY_BYTES': 32 * 1024 * 1024,
+    'MAX_MEMORY_ITEM_BYTES': 1024 * 1024,
+    # Eviction trims the disk tier down to this fraction of the budget so
+    # that a full cache does not rescan the directory on every write.
+    'EVICT_TO_RATIO': 0.9,
+}
+
+
+def get_cache_settings():
+    """Return TTS_AUDIO_CACHE merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'TTS_AUDIO_CACHE', {}))
+    if not config['DIR']:
+        config['DIR'] = Path(settings.BASE_DIR) / 'audio_cache'
+    return config
+
+
+def normalize_text(text):
+    """Normalize text so trivially different inputs share one cache entry"""
+    text = unicodedata.normalize('NFC', text or '')
+    return ' '.join(text.split())
+
+
+def make_cache_key(text, language, speed, service, voice=''):
+    """Build the content address for one synthesized clip"""
+    parts = [
+        normalize_text(text),
+        (language or '').lower(),
+        (speed or 'normal').lower(),
+        (service or '').lower(),
+        voice or '',
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class MemoryLRU:
+    """Thread-safe LRU of bytes values bounded by total size"""
+
+    def __init__(self, max_bytes, max_item_bytes):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = len(value)
+        if size > self.max_item_bytes or size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._items[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self.current_bytes -= len(value)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskLRU:
+    """Directory of audio files with a byte budget and mtime-based LRU"""
+
+    def __init__(self, directory, max_bytes, evict_to_ratio=0.9):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.evict_to_ratio = evict_to_ratio
+        self._approx_bytes = None
+        self._lock = threading.Lock()
+
+    def path_for(self, key):
+        return self.directory / key[:2] / f"{key}{AUDIO_FILE_SUFFIX}"
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            # Touch the file so it becomes the most recently used entry
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def set(self, key, value):
+        writer = self.open_writer(key)
+        try:
+            writer.write(value)
+        except Exception:
+            writer.abort()
+            raise
+        writer.commit()
+
+    def open_writer(self, key):
+        """Return a DiskWriter that publishes key once committed"""
+        return DiskWriter(self, key)
+
+    def record_write(self, size):
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self.total_bytes()
+            else:
+                self._approx_bytes += size
+            over_budget = self._approx_bytes > self.max_bytes
+        if over_budget:
+            self.prune()
+
+    def delete(self, key):
+        try:
+            self.path_for(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """Yield (path, size, mtime) for every cached clip"""
+        if not self.directory.exists():
+            return
+        for path in self.directory.glob(f"*/*{AUDIO_FILE_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield path, stat.st_size, stat.st_mtime
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def prune(self, max_bytes=None, max_age_seconds=None):
+        """Evict least recently used clips until under budget
+
+        Returns a (removed_count, removed_bytes) tuple.
+        """
+        if max_bytes is None:
+            target_bytes = int(self.max_bytes * self.evict_to_ratio)
+        else:
+            target_bytes = max_bytes
+
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        cutoff = time.time() - max_age_seconds if max_age_seconds else None
+
+        removed_count = 0
+        removed_bytes = 0
+        for path, size, mtime in entries:
+            expired = cutoff is not None and mtime < cutoff
+            if total <= target_bytes and not expired:
+                if cutoff is None:
+                    break
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed_count += 1
+            removed_bytes += size
+
+        with self._lock:
+            self._approx_bytes = total
+        return removed_count, removed_bytes
+
+    def clear(self):
+        removed_count = 0
+        removed_bytes = 0
+        for path, size, _ in list(self.entries()):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            removed_count += 1
+            removed_bytes += size
+        with self._lock:
+            self._approx_bytes = 0
+        return removed_count, removed_bytes
+
+
+class DiskWriter:
+    """Incrementally write one clip to a temp file and publish it atomically
+
+    Writing to a temp file first means concurrent readers never see a
+    half-written clip, and an aborted upstream stream leaves nothing behind.
+    """
+
+    def __init__(self, disk, key):
+        self.disk = disk
+        self.path = disk.path_for(key)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+        self.size = 0
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        self.file.close()
+        if not self.size:
+            self.abort()
+            return
+        os.replace(self.tmp_path, self.path)
+        self.disk.record_write(self.size)
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.unlink(self.tmp_path)
+        except OSError:
+            pass
+
+
+class AudioCache:
+    """Two-tier (memory + disk) cache of synthesized audio bytes"""
+
+    def __init__(self, config=None):
+        config = config or get_cache_settings()
+        self.enabled = config['ENABLED']
+        self.memory = MemoryLRU(config['MAX_MEMORY_BYTES'], config['MAX_MEMORY_ITEM_BYTES'])
+        self.disk = DiskLRU(config['DIR'], config['MAX_DISK_BYTES'], config['EVICT_TO_RATIO'])
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return cached audio bytes for key, or None"""
+        if not self.enabled:
+            return None
+        data = self.memory.get(key)
+        if data is None:
+            try:
+                data = self.disk.get(key)
+            except OSError as e:
+                logger.warning("Audio cache read error: %s", e)
+                data = None
+            if data is not None:
+                self.memory.set(key, data)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def open(self, key):
+        """Look key up without loading disk entries into memory
+
+        Returns (bytes, None) for a memory hit, (None, path) for a disk hit
+        and (None, None) for a miss.
+        """
+        if not self.enabled:
+            return None, None
+        data = self.memory.get(key)
+        if data is not None:
+            self.hits += 1
+            return data, None
+        path = self.disk.path_for(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        return None, path
+
+    def open_writer(self, key):
+        """Return a writer for streaming a clip into the disk tier, or None"""
+        if not self.enabled:
+            return None
+        try:
+            return self.disk.open_writer(key)
+        except OSError as e:
+            logger.warning("Audio cache write error: %s", e)
+            return None
+
+    def set(self, key, data):
+        if not self.enabled or not data:
+            return
+        self.memory.set(key, data)
+        try:
+            self.disk.set(key, data)
+        except OSError as e:
+            logger.warning("Audio cache write error: %s", e)
+
+    def delete(self, key):
+        self.memory.delete(key)
+        self.disk.delete(key)
+
+    def stats(self):
+        entries = list(self.disk.entries())
+        return {
+            'enabled': self.enabled,
+            'directory': str(self.disk.directory),
+            'disk_entries': len(entries),
+            'disk_bytes': sum(size for _, size, _ in entries),
+            'disk_budget_bytes': self.disk.max_bytes,
+            'memory_entries': len(self.memory),
+            'memory_bytes': self.memory.current_bytes,
+            'memory_budget_bytes': self.memory.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+_audio_cache = None
+_audio_cache_lock = threading.Lock()
+
+
+def get_audio_cache():
+    """Return the process-wide AudioCache instance"""
+    global _audio_cache
+    if _audio_cache is None:
+        with _audio_cache_lock:
+            if _audio_cache is None:
+                _audio_cache = AudioCache()
+    return _audio_cache
@@ -0,0 +1,179 @@
+"""
+Helpers for serving TTS audio as binary HTTP responses.
+
+Audio either comes from the cache (size known, HTTP Range supported) or is
+passed through from an upstream provider chunk by chunk while being teed
+into the disk cache, so memory per request does not grow with clip length.
+"""
+import logging
+import re
+
+from django.http import HttpResponse, StreamingHttpResponse
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+AUDIO_CONTENT_TYPE = 'audio/mpeg'
+AUDIO_STREAM_CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(header, size):
+    """Return the (start, end) byte range requested, inclusive
+
+    Returns None when there is no usable single range (the full body should
+    be sent) and raises RangeNotSatisfiable when the range lies outside the
+    resource.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Multi-range and malformed headers are ignored, as RFC 9110 allows
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def iter_bytes_range(data, start, end, chunk_size=AUDIO_STREAM_CHUNK_SIZE):
+    view = memoryview(data)
+    for offset in range(start, end + 1, chunk_size):
+        yield bytes(view[offset:min(offset + chunk_size, end + 1)])
+
+
+def iter_file_range(path, start, end, chunk_size=AUDIO_STREAM_CHUNK_SIZE):
+    with open(path, 'rb') as audio_file:
+        audio_file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = audio_file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def tee_to_cache(chunks, writer):
+    """Yield chunks unchanged while copying them into a cache writer
+
+    The clip is only published to the cache if the upstream stream finishes;
+    a client disconnect or upstream error discards the partial file.
+    """
+    completed = False
+    try:
+        for chunk in chunks:
+            if writer is not None:
+                try:
+                    writer.write(chunk)
+                except OSError as e:
+                    logger.warning("Audio cache write error: %s", e)
+                    writer.abort()
+                    writer = None
+            yield chunk
+        completed = True
+    finally:
+        if writer is not None:
+            if completed:
+                try:
+                    writer.commit()
+                except OSError as e:
+                    logger.warning("Audio cache write error: %s", e)
+            else:
+                writer.abort()
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+
+def end_stream_on_error(chunks, label):
+    """Yield chunks unchanged, ending the stream quietly if the upstream raises
+
+    Headers have already been sent by then, so the error can only be logged;
+    the client sees a short body instead of a broken connection. Wrap this
+    around tee_to_cache so the partial clip is still discarded.
+    """
+    try:
+        yield from chunks
+    except Exception as e:
+        logger.error("%s stream failed after headers were sent: %s", label, e)
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+
+def count_served_bytes(chunks, service):
+    """Yield chunks unchanged, adding their total size to the audio bytes metric when done"""
+    served = 0
+    try:
+        for chunk in chunks:
+            served += len(chunk)
+            yield chunk
+    finally:
+        metrics.inc('api_audio_bytes_served_total', (service,), served)
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+
+def build_sized_audio_response(size, open_range, range_header, headers=None):
+    """Build a 200/206/416 response for audio whose size is known
+
+    open_range(start, end) must return an iterator over that inclusive byte
+    range.
+    """
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    if byte_range is None:
+        start, end = 0, size - 1
+        status = 200
+    else:
+        start, end = byte_range
+        status = 206
+
+    response = StreamingHttpResponse(open_range(start, end), status=status, content_type=AUDIO_CONTENT_TYPE)
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
+
+
+def build_streamed_audio_response(chunks, content_length=None, headers=None):
+    """Build a 200 response that passes upstream chunks straight through"""
+    response = StreamingHttpResponse(chunks, content_type=AUDIO_CONTENT_TYPE)
+    if content_length is not None:
+        response['Content-Length'] = str(content_length)
+    # Ranges become available once the clip is in the cache
+    response['Accept-Ranges'] = 'none'
+    for name, value in (headers or {}).items():
+        response[name] = value
+    return response
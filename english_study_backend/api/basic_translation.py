@@ -0,0 +1,155 @@
+"""
+Offline basic translation, the last tier of the translation fallback chain.
+
+Dictionaries are plain TSV files named ``<source>-<target>.tsv`` (for
+example ``en-ko.tsv``) holding one ``phrase<TAB>translation`` entry per
+line. Each file is read line by line and compiled once per process into a
+token trie. Translation then walks each sentence once, taking the longest
+dictionary phrase starting at every position, so multi-word phrases inside
+longer sentences are found as well as whole sentences and single words.
+Words with no entry are kept as written, and so is all text for a language
+pair with no dictionary.
+"""
+import logging
+import re
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    # Searched in order; later directories override earlier entries
+    'DIRS': [Path(__file__).resolve().parent / 'dictionaries'],
+    # Dictionary used when the source language is 'auto'
+    'DEFAULT_SOURCE_LANGUAGE': 'en',
+}
+
+SENTENCE_RE = re.compile(r'[.!?]+')
+WORD_RE = re.compile(r'\S+')
+PUNCTUATION_RE = re.compile(r'[.,!?;:()"]')
+
+# Marks the translation stored at a trie node; cannot collide with a token
+_VALUE = '\x00'
+
+_translators = {}
+_translators_lock = threading.Lock()
+
+
+def get_basic_translation_settings():
+    """Return BASIC_TRANSLATION merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'BASIC_TRANSLATION', {}))
+    return config
+
+
+def normalize_token(word):
+    return PUNCTUATION_RE.sub('', word.lower())
+
+
+def iter_dictionary_entries(path):
+    """Yield (phrase, translation) pairs from a TSV dictionary file"""
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            line = line.rstrip('\r\n')
+            if not line or line.startswith('#') or '\t' not in line:
+                continue
+            phrase, translation = line.split('\t', 1)
+            yield phrase, translation.strip()
+
+
+class BasicTranslator:
+    """Longest-phrase dictionary translator over a token trie"""
+
+    def __init__(self, entries=()):
+        self.trie = {}
+        self.size = 0
+        for phrase, translation in entries:
+            self.add(phrase, translation)
+
+    def add(self, phrase, translation):
+        tokens = [normalize_token(word) for word in phrase.split()]
+        tokens = [token for token in tokens if token]
+        if not tokens:
+            return
+        node = self.trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        if _VALUE not in node:
+            self.size += 1
+        node[_VALUE] = translation
+
+    def translate_sentence(self, sentence):
+        words = WORD_RE.findall(sentence)
+        tokens = [normalize_token(word) for word in words]
+        output = []
+        index = 0
+        while index < len(words):
+            node = self.trie
+            match_end = None
+            match = None
+            position = index
+            while position < len(tokens):
+                node = node.get(tokens[position])
+                if node is None:
+                    break
+                position += 1
+                if _VALUE in node:
+                    match_end = position
+                    match = node[_VALUE]
+            if match_end is None:
+                output.append(words[index])
+                index += 1
+            else:
+                if match:
+                    output.append(match)
+                index = match_end
+        return ' '.join(output)
+
+    def translate(self, text):
+        sentences = [sentence.strip() for sentence in SENTENCE_RE.split(text) if sentence.strip()]
+        if not sentences:
+            return text
+        return '. '.join(self.translate_sentence(sentence) for sentence in sentences)
+
+    def translate_many(self, texts):
+        return [self.translate(text) for text in texts]
+
+
+def load_translator(source_language, target_language, config=None):
+    """Compile the dictionaries for one language pair into a BasicTranslator"""
+    config = config or get_basic_translation_settings()
+    translator = BasicTranslator()
+    for directory in config['DIRS']:
+        path = Path(directory) / f"{source_language}-{target_language}.tsv"
+        if path.exists():
+            for phrase, translation in iter_dictionary_entries(path):
+                translator.add(phrase, translation)
+    logger.info("Loaded basic translation dictionary %s-%s: %s entries", source_language, target_language, translator.size)
+    return translator
+
+
+def get_translator(source_language='auto', target_language='ko'):
+    """Return the shared BasicTranslator for a language pair"""
+    config = get_basic_translation_settings()
+    if not source_language or source_language == 'auto':
+        source_language = config['DEFAULT_SOURCE_LANGUAGE']
+    key = (source_language, target_language)
+    translator = _translators.get(key)
+    if translator is None:
+        with _translators_lock:
+            translator = _translators.get(key)
+            if translator is None:
+                translator = _translators[key] = load_translator(source_language, target_language, config)
+    return translator
+
+
+def translate(text, target_language='ko', source_language='auto'):
+    """Translate text with the basic dictionary, keeping unknown words"""
+    return get_translator(source_language, target_language).translate(text)
+
+
+def translate_many(texts, target_language='ko', source_language='auto'):
+    """Batch translate; the dictionary lookup is shared across texts"""
+    return get_translator(source_language, target_language).translate_many(texts)
@@ -0,0 +1,291 @@
+"""
+Batch translation: many segments per request, few upstream calls.
+
+POST /api/translate/batch/ takes a list of segments. Duplicates are
+translated once, cached results are served from translation_cache, and the
+misses are packed into as few provider calls as each API allows:
+
+    google_official  many ``q`` parameters per v2 request
+    groq             one prompt with numbered [[n]] segments
+    google           newline-joined chunks for the free endpoint
+
+Chunks for one provider run concurrently. Segments a provider fails on move
+down the usual fallback chain, ending with the basic dictionary.
+"""
+import json
+import logging
+import re
+import urllib.parse
+
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from . import basic_translation, hedging, json_codec, provider_client, translation_cache, usage
+from .json_codec import JsonResponse
+from .views import (
+    LANGUAGE_NAMES, OFFICIAL_GOOGLE_TRANSLATE_URL,
+    build_free_google_translate_url, build_groq_translation_request,
+    get_request_profile, get_translation_providers, handle_google_translation,
+    parse_free_google_translation, skip_open_circuits,
+)
+
+logger = logging.getLogger(__name__)
+# Request bodies and provider responses; enable with the api.payloads logger at DEBUG
+payload_logger = logging.getLogger('api.payloads')
+
+DEFAULT_SETTINGS = {
+    'MAX_SEGMENTS': 1000,
+    'MAX_SEGMENT_CHARS': 5000,
+    # Google v2 accepts up to 128 q values per request
+    'GOOGLE_OFFICIAL_SEGMENTS': 128,
+    'GOOGLE_OFFICIAL_CHARS': 30000,
+    'GROQ_SEGMENTS': 40,
+    'GROQ_CHARS': 6000,
+    'GROQ_MAX_TOKENS': 4096,
+    # The free endpoint takes text in the URL, so chunks are limited by their
+    # percent-encoded length: one Korean character takes nine
+    'GOOGLE_FREE_ENCODED_CHARS': 6000,
+}
+
+GROQ_SEGMENT_RE = re.compile(r'\[\[(\d+)\]\]\s*(.*?)(?=\s*\[\[\d+\]\]|\Z)', re.DOTALL)
+
+
+def get_batch_settings():
+    """Return TRANSLATION_BATCH merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'TRANSLATION_BATCH', {}))
+    return config
+
+
+def normalize_segment(text):
+    """Collapse whitespace so segments differing only in spacing share one translation"""
+    return ' '.join(text.split())
+
+
+def chunk_segments(segments, max_segments, max_size, size_of=len):
+    """Split segments into consecutive chunks within both limits
+
+    size_of(segment) measures a segment against max_size; a segment larger
+    than max_size gets a chunk of its own.
+    """
+    chunk = []
+    size = 0
+    for segment in segments:
+        segment_size = size_of(segment)
+        if chunk and (len(chunk) >= max_segments or size + segment_size > max_size):
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(segment)
+        size += segment_size
+    if chunk:
+        yield chunk
+
+
+def free_google_encoded_size(segment):
+    """Length a segment adds to the free Google URL, including its newline separator"""
+    return len(urllib.parse.quote(segment)) + len('%0A')
+
+
+def translate_chunks(chunks, translate_chunk):
+    """Run translate_chunk over chunks concurrently and flatten the results in order"""
+    results = []
+    for chunk, translations in zip(chunks, hedging.get_executor().map(translate_chunk, chunks)):
+        results.extend(translations if translations else [None] * len(chunk))
+    return results
+
+
+def call_official_google_translate_batch(texts, api_key, target_language='ko', source_language='auto'):
+    """Translate one chunk with a single official Google Translate v2 request"""
+    try:
+        data = [('q', text) for text in texts] + [('target', target_language)]
+        if source_language != 'auto':
+            data.append(('source', source_language))
+        response = provider_client.post(
+            provider_client.GOOGLE_TRANSLATE, OFFICIAL_GOOGLE_TRANSLATE_URL,
+            params={'key': api_key}, data=data, breaker_scope=api_key
+        )
+        if response.status_code == 200:
+            translations = response.json()['data']['translations']
+            if len(translations) == len(texts):
+                return [item['translatedText'] for item in translations]
+            logger.info("Official Google Translate batch returned %s of %s segments", len(translations), len(texts))
+        else:
+            logger.warning("Official Google Translate batch error: %s", response.status_code)
+            payload_logger.debug("Official Google Translate batch error response: %s", response.text)
+    except Exception as e:
+        logger.warning("Official Google Translate batch exception: %s", e)
+    return None
+
+
+def build_groq_batch_request(texts, api_key, target_language='ko', source_language='auto', max_tokens=4096):
+    """Return the (url, headers, payload) for translating numbered segments in one Groq prompt"""
+    url, headers, data = build_groq_translation_request('', api_key, target_language, source_language)
+    target_lang_name = LANGUAGE_NAMES.get(target_language, target_language)
+    numbered = '\n'.join(f"[[{index}]] {text}" for index, text in enumerate(texts, 1))
+    data['messages'][0]['content'] = (
+        f"Translate each numbered segment below to {target_lang_name}. "
+        f"Return one line per segment in the form [[n]] translation, keeping every marker, "
+        f"and no other text:\n\n{numbered}"
+    )
+    data['max_tokens'] = max_tokens
+    return url, headers, data
+
+
+def parse_groq_batch_response(content, count):
+    """Return translations for [[1]]..[[count]], None where a marker is missing"""
+    translations = [None] * count
+    for number, translation in GROQ_SEGMENT_RE.findall(content):
+        index = int(number) - 1
+        if 0 <= index < count and translation.strip():
+            translations[index] = translation.strip()
+    return translations
+
+
+def call_groq_translation_batch(texts, api_key, target_language='ko', source_language='auto', max_tokens=4096):
+    """Translate one chunk with a single delimited Groq prompt"""
+    try:
+        url, headers, data = build_groq_batch_request(texts, api_key, target_language, source_language, max_tokens)
+        response = provider_client.post(provider_client.GROQ, url, json=data, headers=headers, breaker_scope=api_key)
+        if response.status_code == 200:
+            content = response.json()['choices'][0]['message']['content']
+            return parse_groq_batch_response(content, len(texts))
+        logger.warning("Groq translation batch error: %s", response.status_code)
+        payload_logger.debug("Groq translation batch error response: %s", response.text)
+    except Exception as e:
+        logger.warning("Groq translation batch exception: %s", e)
+    return None
+
+
+def handle_google_translation_batch(texts, target_language='ko', source_language='auto'):
+    """Translate one chunk with a single newline-joined free Google request
+
+    Falls back to one request per segment if the line count comes back wrong.
+    """
+    try:
+        response = provider_client.get(
+            provider_client.GOOGLE_TRANSLATE_FREE,
+            build_free_google_translate_url('\n'.join(texts), target_language, source_language)
+        )
+        if response.status_code == 200:
+            translation = parse_free_google_translation(response.json()) or ''
+            lines = [line.strip() for line in translation.split('\n')]
+            if len(lines) == len(texts):
+                return [line or None for line in lines]
+            logger.info("Free Google batch returned %s lines for %s segments, translating one by one", len(lines), len(texts))
+    except Exception as e:
+        logger.warning("Free Google batch translation failed: %s", e)
+    return [handle_google_translation(text, target_language, source_language) for text in texts]
+
+
+def get_batch_translator(provider, target_language, source_language, config):
+    """Return translate_many(texts) for a translation chain entry"""
+    service = provider['service']
+    api_key = provider['api_key']
+    size_of = len
+    if service == 'groq':
+        chunk_limits = (config['GROQ_SEGMENTS'], config['GROQ_CHARS'])
+        translate_chunk = lambda chunk: call_groq_translation_batch(
+            chunk, api_key, target_language, source_language, config['GROQ_MAX_TOKENS'])
+    elif service == 'google_official':
+        chunk_limits = (config['GOOGLE_OFFICIAL_SEGMENTS'], config['GOOGLE_OFFICIAL_CHARS'])
+        translate_chunk = lambda chunk: call_official_google_translate_batch(
+            chunk, api_key, target_language, source_language)
+    else:
+        chunk_limits = (config['MAX_SEGMENTS'], config['GOOGLE_FREE_ENCODED_CHARS'])
+        size_of = free_google_encoded_size
+        translate_chunk = lambda chunk: handle_google_translation_batch(chunk, target_language, source_language)
+
+    def translate_many(texts):
+        return translate_chunks(list(chunk_segments(texts, *chunk_limits, size_of=size_of)), translate_chunk)
+    return translate_many
+
+
+def translate_segments(segments, service, target_language, source_language, profile=None):
+    """Return {segment: (translation, service, cache_status)} for distinct segments"""
+    config = get_batch_settings()
+    results = {}
+    remaining = list(segments)
+    chain = skip_open_circuits(get_translation_providers(service, profile))
+    for provider in chain:
+        if not remaining:
+            break
+        found = translation_cache.get_many_or_translate(
+            provider['service'], remaining, source_language, target_language,
+            get_batch_translator(provider, target_language, source_language, config),
+            api_key=provider['api_key']
+        )
+        for text, (translation, cache_status) in found.items():
+            if translation:
+                results[text] = (translation, provider['service'], cache_status)
+        remaining = [text for text in remaining if text not in results]
+        if remaining:
+            logger.info("%s left %s segments untranslated", provider['label'], len(remaining))
+
+    for text, translation in zip(remaining, basic_translation.translate_many(remaining, target_language, source_language)):
+        results[text] = (translation, 'basic', None)
+    return results
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def translate_batch(request):
+    try:
+        # MAX_SEGMENTS segments of up to MAX_SEGMENT_CHARS each exceed the default body limit
+        data = json_codec.parse_json_body(request, max_bytes=settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+        segments = data.get('segments')
+        service = data.get('service', 'auto')
+        target_language = data.get('target_language', 'ko')
+        source_language = data.get('source_language', 'auto')
+
+        config = get_batch_settings()
+        if not isinstance(segments, list) or not segments:
+            return JsonResponse({'error': 'segments must be a non-empty list'}, status=400)
+        if len(segments) > config['MAX_SEGMENTS']:
+            return JsonResponse({'error': f"At most {config['MAX_SEGMENTS']} segments per request"}, status=400)
+        if not all(isinstance(segment, str) for segment in segments):
+            return JsonResponse({'error': 'Every segment must be a string'}, status=400)
+        if any(len(segment) > config['MAX_SEGMENT_CHARS'] for segment in segments):
+            return JsonResponse({'error': f"Segments are limited to {config['MAX_SEGMENT_CHARS']} characters"}, status=400)
+
+        normalized = [normalize_segment(segment) for segment in segments]
+        unique = list(dict.fromkeys(text for text in normalized if text))
+
+        characters = sum(len(text) for text in unique)
+        if request.token_user_id is not None and not usage.consume(request.token_user_id, characters):
+            return JsonResponse({'error': 'Daily character limit reached'}, status=429)
+
+        logger.info("Batch translation request - Segments: %s, Unique: %s, From: %s, To: %s, Service: %s",
+                    len(segments), len(unique), source_language, target_language, service)
+
+        user, profile = get_request_profile(request)
+        results = translate_segments(unique, service, target_language, source_language, profile)
+        # Segments served from the cache or the basic dictionary cost no upstream work
+        usage.refund(request.token_user_id, sum(
+            len(text) for text, (translation, used_service, cache_status) in results.items()
+            if used_service == 'basic' or cache_status in (translation_cache.CACHE_HIT, translation_cache.CACHE_STALE)
+        ))
+
+        translations = []
+        for text in normalized:
+            if not text:
+                translations.append({'translation': '', 'service': None, 'cache': None})
+                continue
+            translation, used_service, cache_status = results[text]
+            translations.append({'translation': translation, 'service': used_service, 'cache': cache_status})
+
+        return JsonResponse({
+            'success': True,
+            'count': len(segments),
+            'unique': len(unique),
+            'translations': translations
+        })
+
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("Batch translation error")
+        return JsonResponse({'error': 'Batch translation failed'}, status=500)
@@ -0,0 +1,249 @@
+"""
+Per-provider circuit breakers.
+
+provider_client records the outcome of every upstream call. A provider's
+breaker opens when its error rate or timeout count in the current window
+crosses the configured thresholds; while open, the TTS and translation
+chains skip that provider without calling it. After OPEN_SECONDS the
+breaker is half-open and lets a single probe request through: success
+closes it, failure opens it again.
+
+State and window counters are shared by every worker process when the
+``providers`` cache alias is Redis or Memcached (see api.shared_cache),
+whose incr() and add() are atomic, so exactly one worker wins the probe.
+Otherwise each process keeps its own breakers in a local-memory cache
+bounded by LOCAL_MAX_ENTRIES.
+
+Key-scoped breakers track 401/403/429 responses for one user's API key, so
+a revoked or rate-limited key is skipped without marking the whole provider
+unhealthy for everyone else.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import shared_cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'breaker'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+SUCCESS = 'success'
+FAILURE = 'failure'
+TIMEOUT = 'timeout'
+KEY_FAILURE = 'key_failure'
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'providers',
+    'WINDOW_SECONDS': 60,
+    # Error rate only trips the breaker once the window has this many calls
+    'MIN_REQUESTS': 5,
+    'ERROR_RATE_THRESHOLD': 0.5,
+    'TIMEOUT_THRESHOLD': 3,
+    'KEY_FAILURE_THRESHOLD': 3,
+    'OPEN_SECONDS': 30,
+    # Longer than any provider read timeout, so a hung probe cannot wedge
+    # the breaker in half-open
+    'PROBE_TIMEOUT': 35,
+    # Entries in the per-process cache used without a shared atomic one;
+    # least recently used entries are dropped beyond it
+    'LOCAL_MAX_ENTRIES': 10000,
+}
+
+_local_backend = None
+
+
+def get_breaker_settings():
+    """Return PROVIDER_CIRCUIT_BREAKER merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'PROVIDER_CIRCUIT_BREAKER', {}))
+    return config
+
+
+def get_backend(config=None):
+    """Return the shared breaker cache, or this process's own when none is configured"""
+    global _local_backend
+    config = config or get_breaker_settings()
+    backend = shared_cache.get_atomic_cache(config['CACHE_ALIAS'])
+    if backend is not None:
+        return backend
+    if _local_backend is None:
+        _local_backend = LocMemCache(KEY_PREFIX, {
+            'TIMEOUT': None,
+            'OPTIONS': {'MAX_ENTRIES': config['LOCAL_MAX_ENTRIES']},
+        })
+    return _local_backend
+
+
+def breaker_name(provider, api_key=None):
+    """Return the breaker name for a provider, optionally scoped to one API key"""
+    if not api_key:
+        return provider
+    return f"{provider}:key:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]}"
+
+
+def classify_status(status_code):
+    """Map an upstream HTTP status to a breaker outcome"""
+    if status_code in (401, 403, 429):
+        return KEY_FAILURE
+    if status_code >= 500:
+        return FAILURE
+    return SUCCESS
+
+
+def _state_key(name):
+    return f"{KEY_PREFIX}:{name}:state"
+
+
+def _probe_key(name):
+    return f"{KEY_PREFIX}:{name}:probe"
+
+
+def _counter_key(name, window, outcome):
+    return f"{KEY_PREFIX}:{name}:{window}:{outcome}"
+
+
+def _current_window(config):
+    return int(time.time() // config['WINDOW_SECONDS'])
+
+
+def _increment(backend, key, config):
+    try:
+        return backend.incr(key)
+    except ValueError:
+        # Counters outlive their window by one window so late readers see them
+        if backend.add(key, 1, timeout=config['WINDOW_SECONDS'] * 2):
+            return 1
+        return backend.incr(key)
+
+
+def _window_counts(backend, name, window):
+    outcomes = (SUCCESS, FAILURE, TIMEOUT, KEY_FAILURE)
+    keys = {outcome: _counter_key(name, window, outcome) for outcome in outcomes}
+    values = backend.get_many(list(keys.values()))
+    return {outcome: values.get(key, 0) for outcome, key in keys.items()}
+
+
+def _read_state(backend, name, config):
+    entry = backend.get(_state_key(name))
+    if not entry:
+        return CLOSED, None
+    if time.time() - entry['opened_at'] >= config['OPEN_SECONDS']:
+        return HALF_OPEN, entry
+    return OPEN, entry
+
+
+def _open(backend, name, reason):
+    logger.info("Circuit breaker opened for %s: %s", name, reason)
+    backend.set(_state_key(name), {'opened_at': time.time(), 'reason': reason}, timeout=None)
+    backend.delete(_probe_key(name))
+
+
+def _close(backend, name, config):
+    logger.info("Circuit breaker closed for %s", name)
+    window = _current_window(config)
+    backend.delete_many(
+        [_state_key(name), _probe_key(name)]
+        + [_counter_key(name, window, outcome) for outcome in (SUCCESS, FAILURE, TIMEOUT, KEY_FAILURE)]
+    )
+
+
+def allow_request(provider, api_key=None):
+    """Return whether a call to provider (with api_key) should be attempted
+
+    A half-open breaker admits exactly one caller, the probe.
+    """
+    config = get_breaker_settings()
+    if not config['ENABLED']:
+        return True
+    backend = get_backend(config)
+    names = [provider] + ([breaker_name(provider, api_key)] if api_key else [])
+    for name in names:
+        state, _ = _read_state(backend, name, config)
+        if state == OPEN:
+            return False
+        if state == HALF_OPEN and not backend.add(_probe_key(name), 1, timeout=config['PROBE_TIMEOUT']):
+            return False
+    return True
+
+
+def _record(backend, name, outcome, config):
+    state, _ = _read_state(backend, name, config)
+    if outcome == SUCCESS:
+        if state != CLOSED:
+            _close(backend, name, config)
+        else:
+            _increment(backend, _counter_key(name, _current_window(config), SUCCESS), config)
+        return
+
+    if state != CLOSED:
+        # The probe failed (or a straggler finished after the breaker opened)
+        _open(backend, name, f"{outcome} while {state}")
+        return
+
+    window = _current_window(config)
+    _increment(backend, _counter_key(name, window, outcome), config)
+    counts = _window_counts(backend, name, window)
+    total = counts[SUCCESS] + counts[FAILURE] + counts[TIMEOUT]
+    errors = counts[FAILURE] + counts[TIMEOUT]
+    if counts[TIMEOUT] >= config['TIMEOUT_THRESHOLD']:
+        _open(backend, name, f"{counts[TIMEOUT]} timeouts in window")
+    elif total >= config['MIN_REQUESTS'] and errors / total >= config['ERROR_RATE_THRESHOLD']:
+        _open(backend, name, f"error rate {errors}/{total} in window")
+    elif counts[KEY_FAILURE] >= config['KEY_FAILURE_THRESHOLD']:
+        _open(backend, name, f"{counts[KEY_FAILURE]} rejected API key responses in window")
+
+
+def record_outcome(provider, outcome, api_key=None):
+    """Record the outcome of one upstream call"""
+    config = get_breaker_settings()
+    if not config['ENABLED']:
+        return
+    backend = get_backend(config)
+    try:
+        if outcome == KEY_FAILURE:
+            # Rejected keys say nothing about the provider's own health
+            if api_key:
+                _record(backend, breaker_name(provider, api_key), outcome, config)
+            return
+        _record(backend, provider, outcome, config)
+        if api_key and outcome == SUCCESS:
+            _record(backend, breaker_name(provider, api_key), outcome, config)
+    except Exception as e:
+        # Breaker bookkeeping must never break the request itself
+        logger.warning("Circuit breaker error for %s: %s", provider, e)
+
+
+def get_health(providers):
+    """Return the breaker state and current window counts for each provider"""
+    config = get_breaker_settings()
+    backend = get_backend(config)
+    window = _current_window(config)
+    health = []
+    for provider in providers:
+        state, entry = _read_state(backend, provider, config)
+        counts = _window_counts(backend, provider, window)
+        total = counts[SUCCESS] + counts[FAILURE] + counts[TIMEOUT]
+        item = {
+            'provider': provider,
+            'state': state,
+            'window_seconds': config['WINDOW_SECONDS'],
+            'requests': total,
+            'failures': counts[FAILURE],
+            'timeouts': counts[TIMEOUT],
+            'error_rate': round((counts[FAILURE] + counts[TIMEOUT]) / total, 3) if total else 0.0,
+        }
+        if entry:
+            item['opened_at'] = entry['opened_at']
+            item['reason'] = entry.get('reason', '')
+            item['retry_in'] = max(round(entry['opened_at'] + config['OPEN_SECONDS'] - time.time(), 1), 0)
+        health.append(item)
+    return health
@@ -0,0 +1,122 @@
+"""
+Database router that sends study history reads to a read replica.
+
+Enabled by adding the DATABASE_REPLICA['ALIAS'] database (``replica`` by
+default) to DATABASES; without it every query goes to ``default`` as before.
+Reads of the models in DATABASE_REPLICA['MODELS'] go to the replica, except
+inside a transaction on ``default``, where a read must see the
+transaction's own writes (the upserts and imports in accounts.models read
+before they write). Writes and migrations always use ``default``.
+
+Replicas lag behind the primary, and the frontend reloads the history
+right after every save and delete. So that those reloads see the change,
+a request that writes one of these models pins its user to ``default`` for
+PIN_SECONDS: ReplicaPinningMiddleware records the pin in the
+PIN_CACHE_ALIAS cache and routes that user's reads to ``default`` while it
+lasts. Later reads in the writing request itself also use ``default``.
+Pins are only seen by every worker process when PIN_CACHE_ALIAS is a cache
+they share (Redis); with the local-memory default cache they are per
+process.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+DEFAULT_SETTINGS = {
+    'ALIAS': 'replica',
+    'MODELS': ['accounts.studyhistory'],
+    # Longer than the replica's usual lag
+    'PIN_SECONDS': 10,
+    'PIN_CACHE_ALIAS': 'replica_pins',
+}
+
+PIN_KEY_PREFIX = 'replica-pin'
+
+# {'pinned': bool, 'wrote': bool} for the current request, set by ReplicaPinningMiddleware
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+def get_replica_settings():
+    """Return DATABASE_REPLICA merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'DATABASE_REPLICA', {}))
+    return config
+
+
+def replica_enabled(config=None):
+    config = config or get_replica_settings()
+    return config['ALIAS'] in settings.DATABASES
+
+
+def get_pin_backend(config=None):
+    config = config or get_replica_settings()
+    try:
+        return caches[config['PIN_CACHE_ALIAS']]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def start_request(user_id, config=None):
+    """Route this request's reads to default if user_id wrote recently; return a token for finish_request"""
+    config = config or get_replica_settings()
+    pinned = get_pin_backend(config).get(f"{PIN_KEY_PREFIX}:{user_id}") is not None
+    return _request_state.set({'pinned': pinned, 'wrote': False})
+
+
+def finish_request(token, user_id, config=None):
+    """Pin user_id to default if the request wrote a replicated model"""
+    config = config or get_replica_settings()
+    state = _request_state.get()
+    _request_state.reset(token)
+    if state and state['wrote']:
+        get_pin_backend(config).set(f"{PIN_KEY_PREFIX}:{user_id}", 1, timeout=config['PIN_SECONDS'])
+
+
+async def astart_request(user_id, config=None):
+    """start_request() for async middleware; the pin is read with the cache's async API"""
+    config = config or get_replica_settings()
+    pinned = await get_pin_backend(config).aget(f"{PIN_KEY_PREFIX}:{user_id}") is not None
+    return _request_state.set({'pinned': pinned, 'wrote': False})
+
+
+async def afinish_request(token, user_id, config=None):
+    """finish_request() for async middleware"""
+    config = config or get_replica_settings()
+    state = _request_state.get()
+    _request_state.reset(token)
+    if state and state['wrote']:
+        await get_pin_backend(config).aset(f"{PIN_KEY_PREFIX}:{user_id}", 1, timeout=config['PIN_SECONDS'])
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        config = get_replica_settings()
+        if not replica_enabled(config) or model._meta.label_lower not in config['MODELS']:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        state = _request_state.get()
+        if state and (state['pinned'] or state['wrote']):
+            return DEFAULT_DB_ALIAS
+        return config['ALIAS']
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and model._meta.label_lower in get_replica_settings()['MODELS']:
+            # A dict, so the change is seen outside the sync_to_async context copy too
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        aliases = {DEFAULT_DB_ALIAS, get_replica_settings()['ALIAS']}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives schema changes through replication
+        return db != get_replica_settings()['ALIAS']
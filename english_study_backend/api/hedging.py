@@ -0,0 +1,221 @@
+"""
+Hedged execution of provider fallback chains.
+
+The chains in text_to_speech and translate_text used to run strictly one
+after another, so a hanging provider cost its full timeout before the next
+one was tried. run_hedged (threads) and arun_hedged (asyncio) run a chain
+under an overall deadline and return the first good result.
+
+Each attempt gets an equal share of the time left when it starts (the last
+one gets all of it). When an attempt fails, or is still running at the end
+of its share, the next provider starts; an overrunning attempt keeps
+running and can still win. So a hung paid provider, whose read timeout is
+longer than the whole deadline, cannot use up the budget before the free
+Google tier at the end of the chain is tried.
+
+Modes (settings.PROVIDER_HEDGING['MODE']):
+
+    sequential  no duplicate requests (the default)
+    hedged      an attempt still running after HEDGE_DELAY seconds is sent a
+                second time, and whichever copy answers first wins
+
+Only free attempts are hedged. Duplicating a call billed to the user's own
+API key would bill them twice for one result, and racing it against the
+free tier would bill them for calls whose result is thrown away.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SEQUENTIAL = 'sequential'
+HEDGED = 'hedged'
+
+DEFAULT_SETTINGS = {
+    'MODE': SEQUENTIAL,
+    'HEDGE_DELAY': 2.0,
+    'TTS_DEADLINE': 20.0,
+    'TRANSLATION_DEADLINE': 15.0,
+    # Threads shared by every sync request; abandoned attempts keep a thread
+    # until their own provider timeout expires
+    'MAX_WORKERS': 64,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hedging_settings():
+    """Return PROVIDER_HEDGING merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'PROVIDER_HEDGING', {}))
+    return config
+
+
+def get_hedge_delay(config=None):
+    """Return the delay before an attempt is sent a second time, or None to never hedge"""
+    config = config or get_hedging_settings()
+    if config['MODE'] == HEDGED:
+        return config['HEDGE_DELAY']
+    return None
+
+
+def get_executor(config=None):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = config or get_hedging_settings()
+                _executor = ThreadPoolExecutor(max_workers=config['MAX_WORKERS'], thread_name_prefix='provider-hedge')
+    return _executor
+
+
+def paid_attempts(chain):
+    """Return the indexes of provider chain entries that use the user's own API key"""
+    return {index for index, provider in enumerate(chain) if provider['api_key']}
+
+
+class _Schedule:
+    """When the next provider starts and when the current one is hedged
+
+    Shared by run_hedged and arun_hedged; times come from the caller's clock.
+    """
+
+    def __init__(self, attempts, hedge_delay, deadline, no_hedge, now):
+        self.attempts = attempts
+        self.hedge_delay = hedge_delay
+        self.no_hedge = no_hedge
+        self.end = now + deadline if deadline else None
+        self.next_index = 0
+        self.current = None
+        self.started_at = now
+        self.share_ends = None
+        self.hedged = False
+
+    def start_next(self, now):
+        """Return the index of the next provider to start"""
+        index = self.current = self.next_index
+        self.next_index += 1
+        self.started_at = now
+        self.hedged = False
+        remaining = len(self.attempts) - index
+        if self.end is not None and remaining > 1:
+            self.share_ends = now + (self.end - now) / remaining
+        else:
+            self.share_ends = None
+        return index
+
+    def may_hedge(self, running):
+        return (self.hedge_delay is not None and not self.hedged
+                and self.current in running and self.current not in self.no_hedge)
+
+    def timeout(self, running, now):
+        """Return how long to wait for a result before acting again, or None for as long as it takes"""
+        wakeups = [self.end] if self.end is not None else []
+        if self.share_ends is not None and self.next_index < len(self.attempts):
+            wakeups.append(self.share_ends)
+        if self.may_hedge(running):
+            wakeups.append(self.started_at + self.hedge_delay)
+        return max(min(wakeups) - now, 0) if wakeups else None
+
+    def expired(self, now):
+        return self.end is not None and now >= self.end
+
+    def actions(self, running, now):
+        """Return the attempt indexes to start now, given the indexes still running"""
+        if self.next_index < len(self.attempts) and (
+            self.current not in running or (self.share_ends is not None and now >= self.share_ends)
+        ):
+            if self.current in running:
+                logger.info("%s is still running after its share of the deadline; starting %s",
+                            self.attempts[self.current][0], self.attempts[self.next_index][0])
+            return [self.start_next(now)]
+        if self.may_hedge(running) and now >= self.started_at + self.hedge_delay:
+            logger.info("Hedging: sending %s again while the first request is still running", self.attempts[self.current][0])
+            self.hedged = True
+            return [self.current]
+        return []
+
+
+def run_hedged(attempts, hedge_delay=None, deadline=None, executor=None, no_hedge=()):
+    """Run (label, callable) attempts in threads and return the first good result
+
+    An attempt is good when its callable returns a truthy value. Returns
+    (index, result) for the winning attempt, or (None, None) if every
+    attempt failed or the deadline passed. Attempts still running are
+    abandoned; the ones not yet started are cancelled. Attempts whose index
+    is in no_hedge are never sent twice.
+    """
+    if not attempts:
+        return None, None
+    executor = executor or get_executor()
+    schedule = _Schedule(attempts, hedge_delay, deadline, no_hedge, time.monotonic())
+    futures = {}
+
+    def launch(index):
+        futures[executor.submit(attempts[index][1])] = index
+
+    launch(schedule.start_next(time.monotonic()))
+    try:
+        while futures:
+            if schedule.expired(time.monotonic()):
+                logger.warning("Provider deadline of %ss exceeded", deadline)
+                break
+            done, _ = wait(list(futures), timeout=schedule.timeout(set(futures.values()), time.monotonic()), return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning("%s error: %s", attempts[index][0], e)
+                    result = None
+                if result:
+                    return index, result
+            for index in schedule.actions(set(futures.values()), time.monotonic()):
+                launch(index)
+    finally:
+        for future in futures:
+            future.cancel()
+
+    return None, None
+
+
+async def arun_hedged(attempts, hedge_delay=None, deadline=None, no_hedge=()):
+    """Async run_hedged; callables return awaitables and losers are cancelled"""
+    if not attempts:
+        return None, None
+    loop = asyncio.get_running_loop()
+    schedule = _Schedule(attempts, hedge_delay, deadline, no_hedge, loop.time())
+    tasks = {}
+
+    def launch(index):
+        tasks[asyncio.ensure_future(attempts[index][1]())] = index
+
+    launch(schedule.start_next(loop.time()))
+    try:
+        while tasks:
+            if schedule.expired(loop.time()):
+                logger.warning("Provider deadline of %ss exceeded", deadline)
+                break
+            done, _ = await asyncio.wait(list(tasks), timeout=schedule.timeout(set(tasks.values()), loop.time()), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = tasks.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    logger.warning("%s error: %s", attempts[index][0], e)
+                    result = None
+                if result:
+                    return index, result
+            for index in schedule.actions(set(tasks.values()), loop.time()):
+                launch(index)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return None, None
@@ -0,0 +1,110 @@
+"""
+JSON encoding and decoding for API requests and responses.
+
+orjson is used when it is installed (JSON_CODEC['BACKEND'] 'auto' or
+'orjson'), the standard library json module otherwise. orjson encodes the
+large base64 strings of TTS responses and the rows of history pages
+several times faster and writes UTF-8 rather than \\u escapes.
+
+- JsonResponse is a drop-in for django.http.JsonResponse. Dates, times,
+  Decimals and other types the stdlib path handles with DjangoJSONEncoder
+  are encoded the same way; values orjson rejects (integers over 64 bits)
+  fall back to the stdlib encoder.
+- parse_json_body() decodes request.body after checking its size, using
+  Content-Length when present, so an oversized upload is refused before it
+  is read. Decode errors are json.JSONDecodeError with either backend.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.http import JsonResponse as DjangoJsonResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+DEFAULT_SETTINGS = {
+    # 'auto' (orjson when installed), 'orjson' or 'json'
+    'BACKEND': 'auto',
+    # Request bodies larger than this are rejected unless a view allows more
+    'MAX_BODY_BYTES': 256 * 1024,
+}
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+_django_encoder = DjangoJSONEncoder()
+
+
+class RequestBodyTooLarge(Exception):
+    def __init__(self, max_bytes):
+        super().__init__(f"Request body is larger than {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+def get_codec_settings():
+    """Return JSON_CODEC merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'JSON_CODEC', {}))
+    return config
+
+
+def use_orjson():
+    return orjson is not None and get_codec_settings()['BACKEND'] in ('auto', 'orjson')
+
+
+def dumps(data, encoder=DjangoJSONEncoder, **json_dumps_params):
+    """Encode data to JSON bytes"""
+    if use_orjson() and encoder is DjangoJSONEncoder and not json_dumps_params:
+        try:
+            return orjson.dumps(data, default=_django_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            pass  # e.g. an int beyond 64 bits; the stdlib encoder handles it
+    return json.dumps(data, cls=encoder, **json_dumps_params).encode('utf-8')
+
+
+def loads(data):
+    """Decode JSON from bytes or str; raises json.JSONDecodeError"""
+    if use_orjson():
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_json_body(request, max_bytes=None):
+    """Return the decoded JSON body of a request
+
+    Raises RequestBodyTooLarge when the body exceeds max_bytes (by default
+    JSON_CODEC['MAX_BODY_BYTES']) and json.JSONDecodeError when it is not
+    valid JSON.
+    """
+    if max_bytes is None:
+        max_bytes = get_codec_settings()['MAX_BODY_BYTES']
+    try:
+        declared = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        declared = 0
+    if declared > max_bytes:
+        raise RequestBodyTooLarge(max_bytes)
+    body = request.body
+    if len(body) > max_bytes:
+        raise RequestBodyTooLarge(max_bytes)
+    return loads(body)
+
+
+def too_large_response(error):
+    return JsonResponse({'error': f'Request body too large (limit {error.max_bytes} bytes)'}, status=413)
+
+
+class JsonResponse(DjangoJsonResponse):
+    """django.http.JsonResponse encoded with dumps()"""
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, json_dumps_params=None, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the safe parameter to False."
+            )
+        kwargs.setdefault('content_type', 'application/json')
+        # Skips DjangoJsonResponse.__init__, which would encode with json.dumps
+        HttpResponse.__init__(self, content=dumps(data, encoder, **(json_dumps_params or {})), **kwargs)
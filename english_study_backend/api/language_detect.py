@@ -0,0 +1,254 @@
+"""
+In-process language detection for the languages the app supports.
+
+Non-Latin scripts are identified from Unicode ranges alone (Hangul, Kana,
+Han, Thai, Arabic, Devanagari, Cyrillic). Latin-script text is scored
+against compact character-trigram profiles built once from short seed
+texts, with a prior towards English, which most Latin text in an English
+study app is. The profiles are too small to tell languages apart from a
+word or two, so the confidence of a guess from fewer than MIN_TRIGRAMS
+trigrams is scaled down. Results are memoized, and callers fall back to
+the remote Google detection when the returned confidence is low.
+"""
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    # Below this confidence the remote detector is consulted
+    'MIN_CONFIDENCE': 0.75,
+    'REMOTE_FALLBACK': True,
+}
+
+# Distinct texts whose detection result is memoized per process
+MEMO_SIZE = 4096
+
+# Latin-script guesses need this many trigrams (about two short words) to
+# keep their full confidence
+MIN_TRIGRAMS = 12
+
+# Prior probability of each Latin-script language; the rest share what is left
+LATIN_PRIORS = {'en': 0.9}
+
+# (language, [(first, last), ...]) in priority order
+SCRIPT_RANGES = [
+    ('ko', [(0x1100, 0x11FF), (0x3130, 0x318F), (0xA960, 0xA97F), (0xAC00, 0xD7AF), (0xD7B0, 0xD7FF)]),
+    ('kana', [(0x3040, 0x309F), (0x30A0, 0x30FF), (0x31F0, 0x31FF), (0xFF66, 0xFF9F)]),
+    ('han', [(0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF)]),
+    ('th', [(0x0E00, 0x0E7F)]),
+    ('ar', [(0x0600, 0x06FF), (0x0750, 0x077F), (0x08A0, 0x08FF), (0xFB50, 0xFDFF), (0xFE70, 0xFEFF)]),
+    ('hi', [(0x0900, 0x097F)]),
+    ('ru', [(0x0400, 0x04FF), (0x0500, 0x052F)]),
+]
+
+# Seed text for the Latin-script profiles. Short, everyday sentences of the
+# kind learners paste in; the trigram statistics matter, not the content.
+LATIN_SEEDS = {
+    'en': (
+        "the quick brown fox jumps over the lazy dog. hello, how are you today? i am fine, thank you. "
+        "what is your name and where do you live? i would like to learn english with my friends. "
+        "this is a good book that i have read many times. they were going to the store when it started to rain. "
+        "we should meet again next week because there is something important to discuss. "
+        "could you please tell me where the nearest station is? she thinks that the weather will be nice. "
+        "he doesn't know what they want, but he will help them anyway. it was the best day of my life. "
+        "the children are playing in the park with their new ball. which one do you prefer, this or that?"
+    ),
+    'es': (
+        "el rápido zorro marrón salta sobre el perro perezoso. hola, ¿cómo estás hoy? estoy bien, gracias. "
+        "¿cuál es tu nombre y dónde vives? me gustaría aprender español con mis amigos. "
+        "este es un buen libro que he leído muchas veces. ellos iban a la tienda cuando empezó a llover. "
+        "deberíamos vernos otra vez la próxima semana porque hay algo importante que discutir. "
+        "¿podrías decirme dónde está la estación más cercana? ella piensa que el tiempo será agradable. "
+        "él no sabe lo que quieren, pero los ayudará de todos modos. fue el mejor día de mi vida. "
+        "los niños están jugando en el parque con su pelota nueva. ¿cuál prefieres, este o ese? muy bien, señor."
+    ),
+    'fr': (
+        "le renard brun rapide saute par-dessus le chien paresseux. bonjour, comment allez-vous aujourd'hui? "
+        "je vais bien, merci. quel est votre nom et où habitez-vous? j'aimerais apprendre le français avec mes amis. "
+        "c'est un bon livre que j'ai lu plusieurs fois. ils allaient au magasin quand il a commencé à pleuvoir. "
+        "nous devrions nous revoir la semaine prochaine parce qu'il y a quelque chose d'important à discuter. "
+        "pourriez-vous me dire où se trouve la gare la plus proche? elle pense que le temps sera beau. "
+        "il ne sait pas ce qu'ils veulent, mais il les aidera quand même. c'était le plus beau jour de ma vie. "
+        "les enfants jouent dans le parc avec leur nouveau ballon. lequel préférez-vous, celui-ci ou celui-là?"
+    ),
+    'de': (
+        "der schnelle braune fuchs springt über den faulen hund. hallo, wie geht es dir heute? mir geht es gut, danke. "
+        "wie heißt du und wo wohnst du? ich möchte mit meinen freunden deutsch lernen. "
+        "das ist ein gutes buch, das ich schon oft gelesen habe. sie gingen zum laden, als es zu regnen begann. "
+        "wir sollten uns nächste woche wieder treffen, weil es etwas wichtiges zu besprechen gibt. "
+        "könnten sie mir bitte sagen, wo der nächste bahnhof ist? sie denkt, dass das wetter schön wird. "
+        "er weiß nicht, was sie wollen, aber er wird ihnen trotzdem helfen. es war der schönste tag meines lebens. "
+        "die kinder spielen mit ihrem neuen ball im park. welchen möchtest du lieber, diesen oder jenen? nicht schlecht."
+    ),
+    'it': (
+        "la veloce volpe marrone salta sopra il cane pigro. ciao, come stai oggi? sto bene, grazie. "
+        "come ti chiami e dove abiti? mi piacerebbe imparare l'italiano con i miei amici. "
+        "questo è un buon libro che ho letto molte volte. stavano andando al negozio quando ha cominciato a piovere. "
+        "dovremmo vederci di nuovo la prossima settimana perché c'è qualcosa di importante da discutere. "
+        "potresti dirmi dove si trova la stazione più vicina? lei pensa che il tempo sarà bello. "
+        "lui non sa cosa vogliono, ma li aiuterà comunque. è stato il giorno più bello della mia vita. "
+        "i bambini stanno giocando nel parco con la loro palla nuova. quale preferisci, questo o quello? molto bene."
+    ),
+    'pt': (
+        "a rápida raposa marrom pula sobre o cão preguiçoso. olá, como você está hoje? estou bem, obrigado. "
+        "qual é o seu nome e onde você mora? eu gostaria de aprender português com os meus amigos. "
+        "este é um bom livro que eu já li muitas vezes. eles estavam indo para a loja quando começou a chover. "
+        "nós deveríamos nos encontrar de novo na próxima semana porque há algo importante para discutir. "
+        "você poderia me dizer onde fica a estação mais próxima? ela acha que o tempo vai estar bom. "
+        "ele não sabe o que eles querem, mas vai ajudá-los mesmo assim. foi o melhor dia da minha vida. "
+        "as crianças estão brincando no parque com a sua bola nova. qual você prefere, este ou aquele? muito bem, não é?"
+    ),
+    'vi': (
+        "con cáo nâu nhanh nhẹn nhảy qua con chó lười biếng. xin chào, hôm nay bạn có khỏe không? tôi khỏe, cảm ơn. "
+        "bạn tên là gì và bạn sống ở đâu? tôi muốn học tiếng việt với bạn bè của tôi. "
+        "đây là một cuốn sách hay mà tôi đã đọc nhiều lần. họ đang đi đến cửa hàng thì trời bắt đầu mưa. "
+        "chúng ta nên gặp lại nhau vào tuần sau vì có một việc quan trọng cần thảo luận. "
+        "bạn có thể cho tôi biết nhà ga gần nhất ở đâu không? cô ấy nghĩ rằng thời tiết sẽ đẹp. "
+        "anh ấy không biết họ muốn gì, nhưng anh ấy vẫn sẽ giúp họ. đó là ngày đẹp nhất trong đời tôi. "
+        "những đứa trẻ đang chơi trong công viên với quả bóng mới. bạn thích cái nào hơn, cái này hay cái kia?"
+    ),
+}
+
+NON_LETTER_RE = re.compile(r"[^\w']+|[\d_]+")
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def get_detection_settings():
+    """Return LANGUAGE_DETECTION merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'LANGUAGE_DETECTION', {}))
+    return config
+
+
+def _script_of(char):
+    code = ord(char)
+    for name, ranges in SCRIPT_RANGES:
+        for first, last in ranges:
+            if first <= code <= last:
+                return name
+    return None
+
+
+def _trigrams(text):
+    """Yield character trigrams of each word padded with spaces"""
+    for word in NON_LETTER_RE.sub(' ', text).split():
+        padded = f' {word} '
+        for index in range(len(padded) - 2):
+            yield padded[index:index + 3]
+
+
+def _build_profiles():
+    profiles = {}
+    for language, seed in LATIN_SEEDS.items():
+        counts = Counter(_trigrams(unicodedata.normalize('NFC', seed.lower())))
+        total = sum(counts.values())
+        # Add-one smoothing over the union vocabulary size, fixed below
+        profiles[language] = (counts, total)
+    vocabulary = len(set().union(*(counts for counts, _ in profiles.values())))
+    others = [language for language in profiles if language not in LATIN_PRIORS]
+    other_prior = (1 - sum(LATIN_PRIORS.values())) / len(others)
+    return {
+        language: ({gram: math.log((count + 1) / (total + vocabulary)) for gram, count in counts.items()},
+                   math.log(1 / (total + vocabulary)),
+                   math.log(LATIN_PRIORS.get(language, other_prior)))
+        for language, (counts, total) in profiles.items()
+    }
+
+
+def get_profiles():
+    global _profiles
+    if _profiles is None:
+        with _profiles_lock:
+            if _profiles is None:
+                _profiles = _build_profiles()
+    return _profiles
+
+
+def _detect_script(text):
+    """Return (language, confidence) from Unicode scripts, or None for Latin text"""
+    counts = Counter()
+    letters = 0
+    for char in text:
+        if not char.isalpha():
+            continue
+        letters += 1
+        script = _script_of(char)
+        if script:
+            counts[script] += 1
+    if not letters:
+        return None, 0.0
+
+    # Kana anywhere means Japanese, whose sentences mix kana and kanji
+    if counts['kana']:
+        counts['ja'] = counts.pop('kana') + counts.pop('han', 0)
+    elif counts['han']:
+        counts['zh'] = counts.pop('han')
+    counts.pop('kana', None)
+    counts.pop('han', None)
+
+    if not counts:
+        return None, 0.0
+    language, count = counts.most_common(1)[0]
+    if count * 2 < letters:
+        # Mostly Latin letters with a few foreign characters
+        return None, 0.0
+    return language, count / letters
+
+
+def _detect_latin(text):
+    profiles = get_profiles()
+    grams = list(_trigrams(text))
+    if not grams:
+        return None, 0.0
+    scores = {}
+    for language, (log_probs, unseen, log_prior) in profiles.items():
+        scores[language] = log_prior + sum(log_probs.get(gram, unseen) for gram in grams)
+    best = max(scores.values())
+    weights = {language: math.exp(score - best) for language, score in scores.items()}
+    total = sum(weights.values())
+    language = max(weights, key=weights.get)
+    confidence = weights[language] / total
+    if len(grams) < MIN_TRIGRAMS:
+        # Too little text for the profiles to be trusted
+        confidence *= len(grams) / MIN_TRIGRAMS
+    return language, confidence
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _detect_normalized(text):
+    language, confidence = _detect_script(text)
+    if language:
+        return language, confidence
+    return _detect_latin(text)
+
+
+def detect_language_local(text):
+    """Return (language code, confidence between 0 and 1) without any network call
+
+    Returns (None, 0.0) when the text has no letters.
+    """
+    normalized = unicodedata.normalize('NFC', (text or '')[:500].lower())
+    return _detect_normalized(' '.join(normalized.split()))
+
+
+def guess_language(text):
+    """Return (language, confident) for text using the local detector
+
+    confident is False when the caller should ask the remote detector,
+    either because local detection is disabled or the score is too low.
+    """
+    config = get_detection_settings()
+    if not config['ENABLED']:
+        return None, False
+    language, confidence = detect_language_local(text)
+    if not config['REMOTE_FALLBACK']:
+        return language, True
+    return language, bool(language) and confidence >= config['MIN_CONFIDENCE']
@@ -0,0 +1,67 @@
+"""
+Structured logging for the API.
+
+JsonFormatter renders each record as one JSON object per line, including
+any fields passed with ``extra=``, so request and provider-call records
+can be filtered and aggregated without parsing messages.
+
+QueuedStreamHandler keeps I/O off request threads: records are formatted
+where they are logged (QueueHandler.prepare), put on a bounded in-memory
+queue, and written to the stream by a single listener thread. When the
+queue is full, records are dropped and counted instead of blocking the
+request.
+
+Both are wired up in settings.LOGGING.
+"""
+import datetime
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed with extra=
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class QueuedStreamHandler(QueueHandler):
+    """Write formatted records to a stream from a background listener thread"""
+
+    def __init__(self, stream=None, max_queue=10000):
+        super().__init__(queue.Queue(max_queue))
+        self.dropped = 0
+        target = logging.StreamHandler(stream or sys.stderr)
+        self.listener = QueueListener(self.queue, target)
+        self.listener.start()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # Called by logging.shutdown() at exit; stop() drains the queue first
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
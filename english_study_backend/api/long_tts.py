@@ -0,0 +1,187 @@
+"""
+Long-text mode for TTS providers with per-request length limits.
+
+Text longer than a provider's chunk limit is split at sentence boundaries,
+then clause boundaries, then spaces, and packed into chunks that fit. The
+chunks are synthesized on a bounded thread pool, a few at a time per
+request, and their MP3 frames are joined in order. stream_long yields the
+first chunk's audio as soon as it is ready, while later chunks are still
+being generated.
+"""
+import base64
+import logging
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    # Characters per upstream request; services not listed are never chunked
+    'CHUNK_CHARS': {
+        'google': 200,  # The free translate_tts endpoint rejects longer text
+        'elevenlabs': 1000,
+        'google_cloud': 1500,
+    },
+    # Chunks in flight for one request
+    'CONCURRENCY': 4,
+    # Threads shared by every long-text request
+    'MAX_WORKERS': 16,
+}
+
+SENTENCE_RE = re.compile(r'(?<=[.!?…])\s+|(?<=[。！？])|\n+')
+CLAUSE_RE = re.compile(r'(?<=[,;:，、；：])\s*|\s+[-–—]\s+')
+WHITESPACE_RE = re.compile(r'\s+')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_long_text_settings():
+    """Return LONG_TEXT_TTS merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'LONG_TEXT_TTS', {}))
+    return config
+
+
+def get_chunk_limit(service, config=None):
+    """Return the chunk size for a TTS service, or None if it is not chunked"""
+    config = config or get_long_text_settings()
+    if not config['ENABLED']:
+        return None
+    return config['CHUNK_CHARS'].get(service)
+
+
+def get_executor(config=None):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = config or get_long_text_settings()
+                _executor = ThreadPoolExecutor(max_workers=config['MAX_WORKERS'], thread_name_prefix='long-tts')
+    return _executor
+
+
+def _split_piece(piece, max_chars):
+    if len(piece) <= max_chars:
+        return [piece]
+    for pattern in (CLAUSE_RE, WHITESPACE_RE):
+        parts = [part.strip() for part in pattern.split(piece) if part.strip()]
+        if len(parts) > 1:
+            return [small for part in parts for small in _split_piece(part, max_chars)]
+    # A single word longer than the limit
+    return [piece[index:index + max_chars] for index in range(0, len(piece), max_chars)]
+
+
+def split_text(text, max_chars):
+    """Split text into chunks of at most max_chars at natural boundaries"""
+    pieces = []
+    for sentence in SENTENCE_RE.split(text):
+        sentence = sentence.strip()
+        if sentence:
+            pieces.extend(_split_piece(sentence, max_chars))
+
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def _id3v2_size(data):
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def strip_mp3_tags(data, keep_header=False, keep_trailer=False):
+    """Remove ID3 tags so MP3 clips can be concatenated frame to frame"""
+    if not keep_header:
+        data = data[_id3v2_size(data):]
+    if not keep_trailer and len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+    return data
+
+
+def iter_chunk_audio(chunks, synthesize_chunk, config=None):
+    """Yield the MP3 bytes for each chunk in order
+
+    synthesize_chunk(text) returns base64 audio or None. Up to CONCURRENCY
+    chunks are synthesized ahead of the one being yielded. Raises
+    RuntimeError if a chunk fails; pending chunks are cancelled when the
+    generator is closed early.
+    """
+    config = config or get_long_text_settings()
+    executor = get_executor(config)
+    pending = deque()
+    next_index = 0
+    last_index = len(chunks) - 1
+
+    def fill():
+        nonlocal next_index
+        while next_index < len(chunks) and len(pending) < config['CONCURRENCY']:
+            pending.append(executor.submit(synthesize_chunk, chunks[next_index]))
+            next_index += 1
+
+    try:
+        index = 0
+        fill()
+        while pending:
+            audio_data = pending.popleft().result()
+            fill()
+            if not audio_data:
+                raise RuntimeError(f"TTS chunk {index + 1} of {len(chunks)} failed")
+            yield strip_mp3_tags(
+                base64.b64decode(audio_data),
+                keep_header=index == 0,
+                keep_trailer=index == last_index,
+            )
+            index += 1
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def synthesize_long(text, max_chars, synthesize_chunk):
+    """Synthesize text chunk by chunk and return the joined audio as base64, or None"""
+    chunks = split_text(text, max_chars)
+    logger.info("Long-text TTS: %s characters in %s chunks", len(text), len(chunks))
+    try:
+        audio = b''.join(iter_chunk_audio(chunks, synthesize_chunk))
+    except RuntimeError as e:
+        logger.warning("Long-text TTS failed: %s", e)
+        return None
+    return base64.b64encode(audio).decode('utf-8')
+
+
+def stream_long(text, max_chars, synthesize_chunk):
+    """Return (chunk iterator, None) streaming text chunk by chunk, or None
+
+    The first chunk is synthesized before returning, so a provider that
+    fails outright is reported as None and the caller can fall back. A later
+    failure raises RuntimeError from the iterator; see
+    audio_stream.end_stream_on_error.
+    """
+    chunks = split_text(text, max_chars)
+    logger.info("Long-text TTS stream: %s characters in %s chunks", len(text), len(chunks))
+    audio = iter_chunk_audio(chunks, synthesize_chunk)
+    try:
+        first = next(audio)
+    except (RuntimeError, StopIteration) as e:
+        logger.warning("Long-text TTS stream failed: %s", e)
+        audio.close()
+        return None
+
+    def generate():
+        yield first
+        yield from audio
+
+    return generate(), None
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.audio_cache import get_audio_cache
+
+
+def format_bytes(size):
+    if size < 1024:
+        return f"{size} B"
+    for unit in ('KB', 'MB', 'GB'):
+        size /= 1024
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}"
+
+
+class Command(BaseCommand):
+    help = 'Inspect and prune the TTS audio cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['stats', 'prune', 'clear'],
+            help='stats: show cache usage, prune: evict least recently used clips, clear: remove every clip',
+        )
+        parser.add_argument(
+            '--max-bytes',
+            type=int,
+            help='Prune down to this many bytes instead of the configured budget',
+        )
+        parser.add_argument(
+            '--max-age-days',
+            type=float,
+            help='Also prune clips that have not been played for this many days',
+        )
+
+    def handle(self, *args, **options):
+        audio_cache = get_audio_cache()
+        action = options['action']
+
+        if action == 'stats':
+            stats = audio_cache.stats()
+            self.stdout.write(f"Directory:     {stats['directory']}")
+            self.stdout.write(f"Enabled:       {stats['enabled']}")
+            self.stdout.write(
+                f"Disk entries:  {stats['disk_entries']} "
+                f"({format_bytes(stats['disk_bytes'])} of {format_bytes(stats['disk_budget_bytes'])})"
+            )
+            return
+
+        if action == 'prune':
+            max_bytes = options['max_bytes']
+            if max_bytes is not None and max_bytes < 0:
+                raise CommandError('--max-bytes must not be negative')
+            max_age_days = options['max_age_days']
+            max_age_seconds = max_age_days * 86400 if max_age_days else None
+            removed_count, removed_bytes = audio_cache.disk.prune(
+                max_bytes=max_bytes, max_age_seconds=max_age_seconds
+            )
+        else:
+            audio_cache.memory.clear()
+            removed_count, removed_bytes = audio_cache.disk.clear()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed_count} clips ({format_bytes(removed_bytes)})"
+        ))
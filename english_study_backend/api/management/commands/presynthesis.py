@@ -0,0 +1,71 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import presynthesis
+from api.models import SynthesisJob
+
+
+class Command(BaseCommand):
+    help = 'Run and inspect the background audio pre-synthesis queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['work', 'status', 'retry', 'clear'],
+            help='work: run the workers, status: show queue counts, '
+                 'retry: requeue failed jobs, clear: remove failed jobs (every job with --all)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Jobs in flight at once instead of the configured CONCURRENCY',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when no jobs are due instead of waiting for more',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='With clear, also remove pending and running jobs',
+        )
+
+    def handle(self, *args, **options):
+        action = options['action']
+
+        if action == 'work':
+            concurrency = options['concurrency']
+            if concurrency is not None and concurrency < 1:
+                raise CommandError('--concurrency must be at least 1')
+            stop = threading.Event()
+            # Finish the jobs in flight on Ctrl+C or a deploy's SIGTERM
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *args: stop.set())
+            self.stdout.write(
+                f"Pre-synthesis workers running (concurrency {concurrency or presynthesis.get_presynthesis_settings()['CONCURRENCY']})"
+            )
+            succeeded, failed = presynthesis.work(concurrency, once=options['once'], stop=stop)
+            self.stdout.write(self.style.SUCCESS(f"Finished {succeeded} jobs, {failed} failed attempts"))
+            return
+
+        if action == 'status':
+            stats = presynthesis.queue_stats()
+            for status, count in stats['counts'].items():
+                self.stdout.write(f"{status.capitalize() + ':':<9} {count}")
+            oldest = stats['oldest_due_seconds']
+            self.stdout.write(f"Oldest due job: {f'{oldest:.0f} s ago' if oldest is not None else 'none'}")
+            return
+
+        if action == 'retry':
+            count = SynthesisJob.objects.filter(status=SynthesisJob.FAILED).update(
+                status=SynthesisJob.PENDING, attempts=0, last_error=''
+            )
+            self.stdout.write(self.style.SUCCESS(f"Requeued {count} failed jobs"))
+            return
+
+        jobs = SynthesisJob.objects.all() if options['all'] else SynthesisJob.objects.filter(status=SynthesisJob.FAILED)
+        count, _ = jobs.delete()
+        self.stdout.write(self.style.SUCCESS(f"Removed {count} jobs"))
@@ -0,0 +1,77 @@
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import profiling
+
+
+class Command(BaseCommand):
+    help = 'Issue profiling tokens and inspect profiles captured by ProfilingMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['token', 'list', 'show', 'clear'],
+            help='token: print an X-Profile-Token header value, list: show captured profiles, '
+                 'show: print one profile\'s statistics, clear: delete every profile',
+        )
+        parser.add_argument('profile_id', nargs='?', help='Profile to show (default: the newest)')
+        parser.add_argument('--memory', action='store_true', help='token: also trace allocations with tracemalloc')
+        parser.add_argument(
+            '--sort',
+            default='cumulative',
+            choices=['cumulative', 'tottime', 'calls'],
+            help='show: pstats sort order',
+        )
+        parser.add_argument('--limit', type=int, default=30, help='show: number of functions to print')
+
+    def handle(self, *args, **options):
+        config = profiling.get_profiling_settings()
+        action = options['action']
+
+        if action == 'token':
+            if not config['ENABLED']:
+                self.stderr.write(self.style.WARNING("REQUEST_PROFILING['ENABLED'] is off; the token will be ignored"))
+            self.stdout.write(f"{profiling.TOKEN_HEADER}: {profiling.issue_token(memory=options['memory'])}")
+            self.stdout.write(f"Valid for {config['TOKEN_MAX_AGE']} seconds")
+            return
+
+        if action == 'list':
+            summaries = profiling.list_profiles(config)
+            for summary in summaries:
+                self.stdout.write(
+                    f"{summary['id']}  {summary['status']}  {summary['duration_ms']:>9.1f} ms  "
+                    f"{summary['method']} {summary['path']}"
+                )
+            self.stdout.write(f"{len(summaries)} profiles in {config['DIRECTORY']}")
+            return
+
+        if action == 'clear':
+            summaries = profiling.list_profiles(config)
+            for summary in summaries:
+                profiling.delete_profile(summary['id'], config)
+            self.stdout.write(self.style.SUCCESS(f"Deleted {len(summaries)} profiles"))
+            return
+
+        profile_id = options['profile_id']
+        if not profile_id:
+            summaries = profiling.list_profiles(config)
+            if not summaries:
+                raise CommandError('No profiles captured yet')
+            profile_id = summaries[0]['id']
+        try:
+            summary, stats = profiling.load_profile(profile_id, config)
+        except FileNotFoundError:
+            raise CommandError(f"No profile {profile_id}")
+
+        self.stdout.write(f"{summary['method']} {summary['path']} -> {summary['status']} in {summary['duration_ms']} ms")
+        self.stdout.write(f"Load in other tools from {config['DIRECTORY']}/{profile_id}.prof")
+        if summary['memory']:
+            memory = summary['memory']
+            self.stdout.write(f"Peak traced memory: {memory['peak_bytes']} bytes, retained: {memory['retained_bytes']} bytes")
+            for line in memory['top_lines']:
+                self.stdout.write(f"  {line['bytes']:>10} B  {line['count']:>6}  {line['line']}")
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats(options['sort']).print_stats(options['limit'])
+        self.stdout.write(output.getvalue())
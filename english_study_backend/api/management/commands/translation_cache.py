@@ -0,0 +1,36 @@
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.core.management.base import BaseCommand, CommandError
+
+from api import translation_cache
+
+
+class Command(BaseCommand):
+    help = 'Inspect or clear the shared translation cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'action',
+            choices=['stats', 'clear'],
+            help='stats: show hit/miss counts since the workers started, clear: drop every cached translation',
+        )
+
+    def handle(self, *args, **options):
+        action = options['action']
+
+        if action == 'stats':
+            stats = translation_cache.get_stats()
+            self.stdout.write(f"Hits:      {stats['hit']}")
+            self.stdout.write(f"Stale:     {stats['stale']}")
+            self.stdout.write(f"Misses:    {stats['miss']}")
+            self.stdout.write(f"Hit ratio: {stats['hit_ratio']:.1%}")
+        else:
+            try:
+                deleted = translation_cache.clear()
+            except InvalidCacheBackendError as e:
+                raise CommandError(f"No translation cache to clear: {e}")
+            except translation_cache.ClearNotSupported as e:
+                raise CommandError(str(e))
+            if deleted is None:
+                self.stdout.write(self.style.SUCCESS('Translation cache cleared'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'Translation cache cleared ({deleted} keys deleted)'))
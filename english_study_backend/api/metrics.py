@@ -0,0 +1,221 @@
+"""
+In-process metrics, exported in the Prometheus text format.
+
+Each worker process keeps its counters and histograms in memory; recording
+a value is a dict update under a lock. A background thread writes the
+process's values to DIRECTORY every WRITE_INTERVAL seconds (one JSON file
+per process, replaced atomically), and GET /metrics sums the files of every
+process, so a scrape sees the whole server whichever worker answers it.
+
+Label values are kept to small fixed sets (URL names, provider names,
+status codes) so the number of series stays bounded.
+"""
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    'DIRECTORY': Path(tempfile.gettempdir()) / 'english_study_metrics',
+    'WRITE_INTERVAL': 5,
+    # Files of processes that stopped writing this long ago are removed
+    'STALE_SECONDS': 3600,
+    'LATENCY_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    # When set, GET /metrics requires "Authorization: Bearer <AUTH_TOKEN>"
+    'AUTH_TOKEN': None,
+}
+
+# name -> (type, help, label names)
+METRICS = {
+    'api_requests_total': (COUNTER, 'HTTP requests by endpoint and status', ('endpoint', 'method', 'status')),
+    'api_request_duration_seconds': (HISTOGRAM, 'HTTP request latency by endpoint', ('endpoint',)),
+    'api_provider_requests_total': (COUNTER, 'Upstream provider calls by status code or failure', ('provider', 'status')),
+    'api_provider_duration_seconds': (HISTOGRAM, 'Upstream provider call latency', ('provider',)),
+    'api_fallback_depth_total': (COUNTER, 'Responses by the fallback chain position that served them (0 is first choice)', ('kind', 'depth', 'service')),
+    'api_cache_lookups_total': (COUNTER, 'Translation and audio cache lookups by result', ('cache', 'result')),
+    'api_audio_bytes_served_total': (COUNTER, 'Bytes of audio sent to clients', ('service',)),
+    'api_presynthesis_jobs_total': (COUNTER, 'Background pre-synthesis jobs by outcome', ('outcome',)),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_writer = None
+
+
+def get_metrics_settings():
+    """Return METRICS merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'METRICS', {}))
+    return config
+
+
+def _enabled():
+    return get_metrics_settings()['ENABLED']
+
+
+def inc(name, labels=(), value=1):
+    """Add value to a counter; labels are values in the order of METRICS[name]"""
+    if not _enabled():
+        return
+    key = (name, tuple(str(label) for label in labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _start_writer()
+
+
+def observe(name, labels, seconds):
+    """Record one observation in a histogram"""
+    config = get_metrics_settings()
+    if not config['ENABLED']:
+        return
+    buckets = config['LATENCY_BUCKETS']
+    key = (name, tuple(str(label) for label in labels))
+    index = bisect.bisect_left(buckets, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            # Per-bucket (not cumulative) counts, then +Inf, sum and count
+            histogram = _histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+        histogram[index] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+    _start_writer()
+
+
+def snapshot():
+    """Return this process's values in the JSON form written to DIRECTORY"""
+    with _lock:
+        return {
+            'buckets': list(get_metrics_settings()['LATENCY_BUCKETS']),
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, list(labels), list(values)] for (name, labels), values in _histograms.items()],
+        }
+
+
+def write_snapshot(config=None):
+    """Atomically replace this process's file in DIRECTORY"""
+    config = config or get_metrics_settings()
+    directory = Path(config['DIRECTORY'])
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{os.getpid()}.json"
+    temp_path = directory / f".{os.getpid()}.tmp"
+    temp_path.write_text(json.dumps(snapshot()), encoding='utf-8')
+    os.replace(temp_path, path)
+
+
+def read_snapshots(config=None):
+    """Yield the snapshots of every live process, removing stale files"""
+    config = config or get_metrics_settings()
+    directory = Path(config['DIRECTORY'])
+    now = time.time()
+    for path in directory.glob('*.json'):
+        try:
+            if now - path.stat().st_mtime > config['STALE_SECONDS']:
+                path.unlink(missing_ok=True)
+                continue
+            yield json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping metrics file %s: %s", path.name, e)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def render(snapshots):
+    """Merge process snapshots and return the Prometheus text exposition"""
+    counters = {}
+    histograms = {}
+    buckets = None
+    for data in snapshots:
+        for name, labels, value in data['counters']:
+            key = (name, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+        if data['histograms'] and buckets is not None and data['buckets'] != buckets:
+            # Bucket layout changed between deploys; skip the old process's histograms
+            continue
+        buckets = buckets or data['buckets']
+        for name, labels, values in data['histograms']:
+            key = (name, tuple(labels))
+            merged = histograms.get(key)
+            histograms[key] = values if merged is None else [a + b for a, b in zip(merged, values)]
+
+    lines = []
+    for name, (metric_type, help_text, label_names) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type == COUNTER:
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f"{name}{_format_labels(label_names, labels)} {_format_number(value)}")
+            continue
+        for (series, labels), values in sorted(histograms.items()):
+            if series != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], values[:-2]):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_number(float(bound))
+                lines.append(f"{name}_bucket{_format_labels(label_names, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(label_names, labels)} {_format_number(values[-2])}")
+            lines.append(f"{name}_count{_format_labels(label_names, labels)} {values[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+def collect():
+    """Write this process's values, then render every process's"""
+    config = get_metrics_settings()
+    try:
+        write_snapshot(config)
+    except OSError as e:
+        logger.warning("Could not write metrics snapshot: %s", e)
+        return render([snapshot()])
+    return render(read_snapshots(config))
+
+
+def _write_forever(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_snapshot()
+        except Exception as e:
+            logger.warning("Metrics snapshot error: %s", e)
+
+
+def _start_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(
+                target=_write_forever, args=(get_metrics_settings()['WRITE_INTERVAL'],),
+                name='metrics-writer', daemon=True,
+            )
+            _writer.start()
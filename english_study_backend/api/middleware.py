@@ -1,25 +1,353 @@
+import gzip
+import logging
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
 from django.http import HttpResponse
+from django.middleware import http as http_middleware
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.functional import SimpleLazyObject
+
+from . import auth, db_router, metrics, profiling
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+request_logger = logging.getLogger('api.requests')
+
+DEFAULT_CORS_SETTINGS = {
+    'ALLOWED_ORIGINS': [],
+    'ALLOWED_ORIGIN_REGEXES': [],
+    'ALLOW_METHODS': ['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
+    'ALLOW_HEADERS': ['Content-Type', 'Authorization', 'X-Requested-With', 'Range'],
+    'EXPOSE_HEADERS': ['Content-Length', 'Content-Range', 'X-TTS-Service', 'X-TTS-Cache'],
+    # Seconds browsers may reuse a preflight (Chrome caps this at 7200)
+    'PREFLIGHT_MAX_AGE': 7200,
+}
+
+DEFAULT_COMPRESSION_SETTINGS = {
+    'ENABLED': True,
+    # Smaller bodies fit in a packet or two anyway
+    'MIN_BYTES': 1024,
+    'CONTENT_TYPES': ['application/json', 'text/'],
+    'GZIP_LEVEL': 6,
+    # 11 is the maximum but far slower; 4-5 is on par with gzip -6 in speed
+    'BROTLI_QUALITY': 5,
+}
+
+class HybridMiddleware:
+    """Base for middleware that runs natively under both WSGI and ASGI
+
+    Django passes a coroutine function as get_response when the rest of the
+    stack is async. The instance is then marked as a coroutine function and
+    subclasses hand the request to __acall__, so Django does not wrap them
+    in a sync_to_async thread hop on every request.
+    """
+
+    sync_capable = True
+    async_capable = True
 
-class CorsMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+
+class RequestLogMiddleware(HybridMiddleware):
+    """Log one structured record per request and count it in api.metrics
+
+    Streaming responses are timed to when their headers are ready. Place
+    first so the time spent in every other middleware is included.
+    """
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.log_request(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.log_request(request, response, time.perf_counter() - start)
+        return response
+
+    def log_request(self, request, response, duration):
+        duration_ms = round(duration * 1000, 2)
+        # URL names keep the endpoint label to a fixed set
+        match = request.resolver_match
+        endpoint = match.url_name or match.view_name if match else 'unmatched'
+        metrics.inc('api_requests_total', (endpoint, request.method, response.status_code))
+        metrics.observe('api_request_duration_seconds', (endpoint,), duration)
+        if request_logger.isEnabledFor(logging.INFO):
+            request_logger.info(
+                "%s %s %s", request.method, request.path, response.status_code,
+                extra={
+                    'method': request.method,
+                    'path': request.path,
+                    'status': response.status_code,
+                    'duration_ms': duration_ms,
+                    'user_id': getattr(request, 'token_user_id', None),
+                    'streaming': response.streaming,
+                },
+            )
+
+
+class CorsMiddleware(HybridMiddleware):
+    """Answer CORS preflights and add CORS headers for allowed origins
+
+    The request's Origin is echoed back when it is in CORS['ALLOWED_ORIGINS']
+    or matches one of CORS['ALLOWED_ORIGIN_REGEXES'] (credentials cannot be
+    combined with "*"); other origins get no Access-Control-Allow-Origin and
+    the browser blocks the response. Preflights carry Access-Control-Max-Age
+    so browsers stop repeating them before every JSON request.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = get_cors_settings()
+        self.allowed_origins = frozenset(config['ALLOWED_ORIGINS'])
+        self.origin_regexes = [re.compile(pattern) for pattern in config['ALLOWED_ORIGIN_REGEXES']]
+        # Built once; only Access-Control-Allow-Origin differs between responses
+        self.response_headers = {
+            'Access-Control-Allow-Credentials': 'true',
+            'Access-Control-Expose-Headers': ', '.join(config['EXPOSE_HEADERS']),
+        }
+        self.preflight_headers = {
+            'Access-Control-Allow-Credentials': 'true',
+            'Access-Control-Allow-Methods': ', '.join(config['ALLOW_METHODS']),
+            'Access-Control-Allow-Headers': ', '.join(config['ALLOW_HEADERS']),
+            'Access-Control-Max-Age': str(config['PREFLIGHT_MAX_AGE']),
+        }
+
+    def origin_allowed(self, origin):
+        return origin in self.allowed_origins or any(regex.match(origin) for regex in self.origin_regexes)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
         # Handle preflight OPTIONS requests
         if request.method == "OPTIONS":
-            response = HttpResponse()
-            response["Access-Control-Allow-Origin"] = "*"
-            response["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-            response["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Requested-With"
-            response["Access-Control-Allow-Credentials"] = "true"
+            return self.add_headers(request, HttpResponse(), self.preflight_headers)
+        return self.add_headers(request, self.get_response(request), self.response_headers)
+
+    async def __acall__(self, request):
+        if request.method == "OPTIONS":
+            return self.add_headers(request, HttpResponse(), self.preflight_headers)
+        return self.add_headers(request, await self.get_response(request), self.response_headers)
+
+    def add_headers(self, request, response, headers):
+        origin = request.headers.get('Origin')
+        if origin is not None and self.origin_allowed(origin):
+            response['Access-Control-Allow-Origin'] = origin
+            for name, value in headers.items():
+                response[name] = value
+        # The headers depend on the origin, so caches must key on it
+        patch_vary_headers(response, ('Origin',))
+        return response
+
+
+def get_cors_settings():
+    """Return CORS merged over the defaults"""
+    config = dict(DEFAULT_CORS_SETTINGS)
+    config.update(getattr(settings, 'CORS', {}))
+    return config
+
+
+def accepted_encodings(header):
+    """Return the content codings an Accept-Encoding header allows, e.g. {'gzip', 'br'}"""
+    encodings = set()
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class CompressionMiddleware(HybridMiddleware):
+    """Compress JSON and text responses with brotli or gzip
+
+    Brotli is used when the brotli package is installed and the client
+    accepts it, gzip otherwise. Responses under MIN_BYTES, streamed
+    responses (audio) and partial content are left alone. Strong ETags are
+    made weak, as django.middleware.gzip does, since the bytes sent differ
+    from the ones the ETag was computed on. Place before (outside)
+    ConditionalGetMiddleware.
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        config = get_compression_settings()
+        if (
+            not config['ENABLED']
+            or response.streaming
+            or not 200 <= response.status_code < 300
+            or response.status_code in (204, 206)
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith(tuple(config['CONTENT_TYPES']))
+            or len(response.content) < config['MIN_BYTES']
+        ):
             return response
         
-        response = self.get_response(request)
-        
-        # Add CORS headers to all responses
-        response["Access-Control-Allow-Origin"] = "*"
-        response["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-        response["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Requested-With"
-        response["Access-Control-Allow-Credentials"] = "true"
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encodings = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        if brotli is not None and 'br' in encodings:
+            encoding = 'br'
+            compressed = brotli.compress(response.content, quality=config['BROTLI_QUALITY'])
+        elif 'gzip' in encodings:
+            encoding = 'gzip'
+            compressed = gzip.compress(response.content, compresslevel=config['GZIP_LEVEL'], mtime=0)
+        else:
+            return response
+        if len(compressed) >= len(response.content):
+            return response
         
-        return response
\ No newline at end of file
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+def get_compression_settings():
+    """Return RESPONSE_COMPRESSION merged over the defaults"""
+    config = dict(DEFAULT_COMPRESSION_SETTINGS)
+    config.update(getattr(settings, 'RESPONSE_COMPRESSION', {}))
+    return config
+
+
+class ConditionalGetMiddleware(http_middleware.ConditionalGetMiddleware):
+    """Add ETags to GET responses and answer a matching If-None-Match with 304
+
+    Django's ConditionalGetMiddleware, plus "Cache-Control: private, no-cache"
+    on successful GETs that set no Cache-Control of their own, so browsers
+    keep the response and revalidate it instead of downloading it again.
+    Views that compute their own ETag (study history) keep it. Django's
+    MiddlewareMixin already makes it async-capable.
+    """
+
+    def process_response(self, request, response):
+        if (
+            request.method == 'GET'
+            and response.status_code == 200
+            and not response.streaming
+            and not response.has_header('Cache-Control')
+        ):
+            patch_cache_control(response, private=True, no_cache=True)
+        return super().process_response(request, response)
+
+
+class TokenAuthMiddleware(HybridMiddleware):
+    """Authenticate API requests from a signed Authorization token
+
+    Sets request.token_user_id (verified without a query) and replaces
+    request.user with a lazy object, so the user and profile are only loaded
+    by views that use them. Place after AuthenticationMiddleware.
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        self.authenticate(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Verifying the signature needs no I/O, so it runs on the event loop
+        self.authenticate(request)
+        return await self.get_response(request)
+
+    def authenticate(self, request):
+        request.token_user_id = auth.get_token_user_id(request.headers.get('Authorization', ''))
+        if request.token_user_id is not None:
+            request.user = SimpleLazyObject(lambda: auth.get_request_user(request))
+
+
+class ReplicaPinningMiddleware(HybridMiddleware):
+    """Keep a user's reads on the primary database briefly after they write
+
+    Does nothing unless a read replica is configured; see api.db_router.
+    Place after TokenAuthMiddleware.
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        config = db_router.get_replica_settings()
+        user_id = getattr(request, 'token_user_id', None)
+        if user_id is None or not db_router.replica_enabled(config):
+            return self.get_response(request)
+        token = db_router.start_request(user_id, config)
+        try:
+            response = self.get_response(request)
+        finally:
+            db_router.finish_request(token, user_id, config)
+        return response
+
+    async def __acall__(self, request):
+        config = db_router.get_replica_settings()
+        user_id = getattr(request, 'token_user_id', None)
+        if user_id is None or not db_router.replica_enabled(config):
+            return await self.get_response(request)
+        token = await db_router.astart_request(user_id, config)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await db_router.afinish_request(token, user_id, config)
+        return response
+
+
+class ProfilingMiddleware(HybridMiddleware):
+    """Profile requests that carry a signed X-Profile-Token or are sampled
+
+    Does nothing unless REQUEST_PROFILING['ENABLED'] is set; see
+    api.profiling. Place after RequestLogMiddleware.
+    """
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        config = profiling.get_profiling_settings()
+        if not config['ENABLED']:
+            return self.get_response(request)
+        modes = profiling.get_requested_modes(request, config)
+        if not modes or not profiling.profile_lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return profiling.profile_request(self.get_response, request, modes, config)
+        finally:
+            profiling.profile_lock.release()
+
+    async def __acall__(self, request):
+        config = profiling.get_profiling_settings()
+        if not config['ENABLED']:
+            return await self.get_response(request)
+        modes = profiling.get_requested_modes(request, config)
+        if not modes or not profiling.profile_lock.acquire(blocking=False):
+            return await self.get_response(request)
+        try:
+            return await profiling.aprofile_request(self.get_response, request, modes, config)
+        finally:
+            profiling.profile_lock.release()
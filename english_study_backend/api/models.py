@@ -1,3 +1,92 @@
+import datetime
+import uuid
+
+from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+from accounts.models import hash_study_text
+
+
+class SynthesisJobManager(models.Manager):
+    def enqueue(self, user_id, text, language, speeds):
+        """Add one pending job per speed; jobs already queued for the same audio are left as they are"""
+        text_hash = hash_study_text(text)
+        jobs = [
+            self.model(user_id=user_id, text=text, text_hash=text_hash, language=language, speed=speed)
+            for speed in speeds
+        ]
+        # The unique constraint de-duplicates, including against other processes
+        self.bulk_create(jobs, ignore_conflicts=True)
+
+    def due(self, now=None):
+        """Pending jobs whose retry delay has passed and running jobs whose lease expired"""
+        now = now or timezone.now()
+        return self.filter(
+            status__in=[SynthesisJob.PENDING, SynthesisJob.RUNNING], run_after__lte=now
+        ).order_by('run_after', 'id')
+
+    def claim(self, limit, lease_seconds):
+        """Mark up to limit due jobs as running for this caller and return them
+
+        The UPDATE re-checks that each job is still due, so two workers
+        claiming at once never get the same job. While running, run_after
+        holds the lease expiry: a job whose worker died becomes due again.
+        """
+        if limit <= 0:
+            return []
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        self.filter(
+            id__in=self.due(now).values('id')[:limit],
+            status__in=[SynthesisJob.PENDING, SynthesisJob.RUNNING],
+            run_after__lte=now,
+        ).update(
+            status=SynthesisJob.RUNNING,
+            claim_token=token,
+            run_after=now + datetime.timedelta(seconds=lease_seconds),
+            attempts=F('attempts') + 1,
+        )
+        return list(self.filter(claim_token=token))
+
+
+class SynthesisJob(models.Model):
+    """Audio to pre-generate for a saved study item at one speed (see api.presynthesis)"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='synthesis_jobs')
+    text = models.TextField()
+    text_hash = models.CharField(max_length=64)
+    language = models.CharField(max_length=10, default='auto')  # As saved; 'auto' is detected by the worker
+    speed = models.CharField(max_length=10)
+
+    status = models.CharField(
+        max_length=10,
+        choices=[
+            (PENDING, 'Pending'),
+            (RUNNING, 'Running'),
+            (FAILED, 'Failed'),
+        ],
+        default=PENDING
+    )
+    attempts = models.IntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = SynthesisJobManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'text_hash', 'language', 'speed'], name='unique_synthesis_job'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='synthesis_job_due_idx'),
+        ]
 
-# Create your models here.
+    def __str__(self):
+        return f"{self.user_id}: {self.text[:50]} ({self.speed}, {self.status})"
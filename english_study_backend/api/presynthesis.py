@@ -0,0 +1,209 @@
+"""
+Background pre-synthesis of audio for saved study items.
+
+When save_study_item stores a new item, enqueue() adds a SynthesisJob per
+speed in SPEEDS (one INSERT, de-duplicated by a unique constraint).
+``manage.py presynthesis work`` runs up to CONCURRENCY jobs at a time: each
+builds the provider chain a replay from history would (the user's profile,
+service 'auto', the item's language) and synthesizes through
+synthesize_with_cache, so the clip is stored under exactly the key the
+replay looks up and the replay makes no upstream call.
+
+Jobs use free providers only unless PAID_PROVIDERS is on; a job whose
+replay would go to the user's paid provider first is then skipped, since
+a free clip would never be looked up. With PAID_PROVIDERS on, jobs are
+metered against the daily character limit like requests and skipped once
+it is reached.
+
+Finished jobs are deleted. Failed ones are retried after RETRY_DELAY
+seconds (times the attempt number) and kept as 'failed' after
+MAX_ATTEMPTS. Several worker processes can share the queue; a job whose
+worker dies is picked up again when its LEASE_SECONDS run out. The clips
+go to the shared disk cache, so the web workers find them there.
+"""
+import datetime
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Count
+from django.utils import timezone
+
+from . import metrics, usage
+from .models import SynthesisJob
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    'SPEEDS': ['slow', 'normal', 'fast'],
+    # Jobs synthesized at once per worker process
+    'CONCURRENCY': 4,
+    'POLL_INTERVAL': 2,
+    'LEASE_SECONDS': 300,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 60,
+    # Longer items are left to on-demand (chunked) synthesis
+    'MAX_TEXT_CHARS': 1000,
+    # Spend the user's paid provider quota (and daily limit) on jobs
+    'PAID_PROVIDERS': False,
+}
+
+
+class JobSkipped(Exception):
+    """The job should be dropped without synthesizing anything"""
+
+
+def get_presynthesis_settings():
+    """Return PRESYNTHESIS merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'PRESYNTHESIS', {}))
+    return config
+
+
+def enqueue(user_id, text, language):
+    """Queue audio for a newly saved item; never raises, so saving cannot fail because of it"""
+    config = get_presynthesis_settings()
+    if not config['ENABLED'] or not text.strip() or len(text) > config['MAX_TEXT_CHARS']:
+        return
+    try:
+        SynthesisJob.objects.enqueue(user_id, text, language or 'auto', config['SPEEDS'])
+    except DatabaseError as e:
+        logger.warning("Could not queue pre-synthesis for user %s: %s", user_id, e)
+
+
+def synthesize_job(job, config=None):
+    """Synthesize a job's audio into the cache; return (service, already cached) or None if every provider failed
+
+    Raises JobSkipped when the job may not use the provider its replay
+    would, or the user is over the daily limit.
+    """
+    from accounts.models import UserProfile
+    from . import views  # Imported here; views imports this module
+
+    config = config or get_presynthesis_settings()
+    profile = UserProfile.objects.filter(user_id=job.user_id).first()
+    if profile is None:
+        return None
+    language = job.language
+    if language == 'auto':
+        language = views.detect_source_language(job.text)
+    chain = views.get_tts_provider_chain(job.text, job.speed, 'auto', language, profile)
+    if not config['PAID_PROVIDERS']:
+        if chain and chain[0]['api_key']:
+            raise JobSkipped('replays use a paid provider')
+        chain = [provider for provider in chain if not provider['api_key']]
+    elif not usage.consume(job.user_id, len(job.text)):
+        raise JobSkipped('daily character limit reached')
+
+    for provider in views.skip_open_circuits(chain):
+        result = views.make_tts_attempt(provider, job.text, job.speed)()
+        if result:
+            if result[1] and config['PAID_PROVIDERS']:
+                usage.refund(job.user_id, len(job.text))
+            return provider['service'], result[1]
+    if config['PAID_PROVIDERS']:
+        usage.refund(job.user_id, len(job.text))
+    return None
+
+
+def process_job(job, config):
+    """Run one claimed job and record the outcome in the queue"""
+    close_old_connections()
+    try:
+        skipped = None
+        try:
+            outcome = synthesize_job(job, config)
+            error = '' if outcome else 'Every TTS provider failed'
+        except JobSkipped as e:
+            outcome, skipped = None, str(e)
+        except Exception as e:
+            logger.exception("Pre-synthesis job %s error", job.id)
+            outcome, error = None, str(e)
+
+        # claim_token guards against updating a job another worker re-claimed after our lease ran out
+        mine = SynthesisJob.objects.filter(pk=job.pk, claim_token=job.claim_token)
+        try:
+            if skipped:
+                mine.delete()
+                metrics.inc('api_presynthesis_jobs_total', ('skipped',))
+                logger.info("Skipped pre-synthesis job %s: %s", job.id, skipped)
+                return True
+
+            if outcome:
+                service, cached = outcome
+                mine.delete()
+                metrics.inc('api_presynthesis_jobs_total', ('cached' if cached else 'synthesized',))
+                logger.info("Pre-synthesized job %s (%s, %s)%s", job.id, service, job.speed, ' - already cached' if cached else '')
+                return True
+
+            if job.attempts >= config['MAX_ATTEMPTS']:
+                mine.update(status=SynthesisJob.FAILED, last_error=error[:1000])
+                metrics.inc('api_presynthesis_jobs_total', ('failed',))
+                logger.warning("Pre-synthesis job %s failed after %s attempts: %s", job.id, job.attempts, error)
+            else:
+                retry_at = timezone.now() + datetime.timedelta(seconds=config['RETRY_DELAY'] * job.attempts)
+                mine.update(status=SynthesisJob.PENDING, run_after=retry_at, last_error=error[:1000])
+                metrics.inc('api_presynthesis_jobs_total', ('retried',))
+        except DatabaseError as e:
+            # The lease runs out and the job is picked up again
+            logger.warning("Could not record pre-synthesis job %s: %s", job.id, e)
+        return False
+    finally:
+        close_old_connections()
+
+
+def work(concurrency=None, once=False, stop=None):
+    """Claim and run jobs with at most concurrency in flight until stop is set
+
+    With once=True, returns when the queue has no due jobs left. Returns
+    (succeeded, failed) counts.
+    """
+    config = get_presynthesis_settings()
+    concurrency = concurrency or config['CONCURRENCY']
+    stop = stop or threading.Event()
+    succeeded = failed = 0
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='presynthesis') as executor:
+        while not stop.is_set():
+            try:
+                jobs = SynthesisJob.objects.claim(concurrency - len(in_flight), config['LEASE_SECONDS'])
+            except DatabaseError as e:
+                logger.warning("Could not claim pre-synthesis jobs: %s", e)
+                jobs = []
+            for job in jobs:
+                in_flight.add(executor.submit(process_job, job, config))
+
+            if not in_flight:
+                if once:
+                    break
+                stop.wait(config['POLL_INTERVAL'])
+                continue
+            # Wake when a slot frees up, or poll for new jobs while all are busy
+            done, in_flight = wait(in_flight, timeout=config['POLL_INTERVAL'], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.result():
+                    succeeded += 1
+                else:
+                    failed += 1
+
+        # Let claimed jobs finish rather than waiting for their leases to expire
+        for future in in_flight:
+            if future.result():
+                succeeded += 1
+            else:
+                failed += 1
+    return succeeded, failed
+
+
+def queue_stats():
+    """Return job counts by status and the age in seconds of the oldest due job"""
+    counts = dict(SynthesisJob.objects.values_list('status').annotate(count=Count('id')).order_by())
+    oldest = SynthesisJob.objects.due().values_list('run_after', flat=True).first()
+    return {
+        'counts': {status: counts.get(status, 0) for status in (SynthesisJob.PENDING, SynthesisJob.RUNNING, SynthesisJob.FAILED)},
+        'oldest_due_seconds': round(time.time() - oldest.timestamp(), 1) if oldest else None,
+    }
@@ -0,0 +1,220 @@
+"""
+On-demand profiling of single requests.
+
+api.middleware.ProfilingMiddleware runs cProfile (and, when asked,
+tracemalloc) around a request that either carries a valid signed
+X-Profile-Token header or is picked by SAMPLE_RATE. The profile is written to DIRECTORY as
+``<id>.prof`` (pstats format) with a ``<id>.json`` summary, and the
+response gets X-Profile-Id and a short X-Profile-Summary header.
+
+Tokens are signed with SECRET_KEY and expire after TOKEN_MAX_AGE, so the
+header cannot be forged by clients; ``manage.py profiles token`` issues
+one. Only one request is profiled at a time per process: cProfile and
+tracemalloc are process-wide on recent Pythons, and others just run
+normally while one is being profiled. Work done in provider executor
+threads shows up as time waiting for those threads, and streaming
+responses are profiled until their headers are ready.
+"""
+import cProfile
+import datetime
+import io
+import json
+import logging
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = 'api.profiling.token'
+TOKEN_HEADER = 'X-Profile-Token'
+
+CPU = 'cpu'
+MEMORY = 'memory'
+
+DEFAULT_SETTINGS = {
+    'ENABLED': False,
+    'DIRECTORY': Path('profiles'),
+    # Fraction of requests profiled without a token
+    'SAMPLE_RATE': 0.0,
+    # Sampled requests also trace allocations
+    'SAMPLE_MEMORY': False,
+    'TOKEN_MAX_AGE': 3600,
+    # Oldest profiles beyond this are deleted
+    'MAX_PROFILES': 200,
+    'SUMMARY_FUNCTIONS': 5,
+    'MEMORY_TOP_LINES': 10,
+}
+
+# Held while a request is being profiled
+profile_lock = threading.Lock()
+
+
+def get_profiling_settings():
+    """Return REQUEST_PROFILING merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'REQUEST_PROFILING', {}))
+    return config
+
+
+def get_signer():
+    return signing.TimestampSigner(salt=TOKEN_SALT)
+
+
+def issue_token(memory=False):
+    """Return an X-Profile-Token value; memory=True also traces allocations"""
+    return get_signer().sign(f"{CPU},{MEMORY}" if memory else CPU)
+
+
+def get_requested_modes(request, config):
+    """Return the set of modes to profile this request with, empty for none"""
+    token = request.headers.get(TOKEN_HEADER)
+    if token:
+        try:
+            return set(get_signer().unsign(token, max_age=config['TOKEN_MAX_AGE']).split(','))
+        except signing.BadSignature:
+            logger.warning("Ignoring invalid or expired %s header", TOKEN_HEADER)
+            return set()
+    if config['SAMPLE_RATE'] and random.random() < config['SAMPLE_RATE']:
+        return {CPU, MEMORY} if config['SAMPLE_MEMORY'] else {CPU}
+    return set()
+
+
+def summarize_stats(profiler, limit):
+    """Return [(function, own_ms, cumulative_ms, calls)] for the functions with the most own time
+
+    Own time points at where the request actually spent it (a socket read,
+    JSON encoding, a query); cumulative time is mostly the wrappers above.
+    """
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (calls, total_calls, own_time, cumulative, callers) in stats.stats.items():
+        if filename == '~':
+            function = name  # Built-ins, e.g. <method 'recv_into' of '_socket.socket' objects>
+        else:
+            function = f"{Path(filename).name}:{line}({name})"
+        rows.append((function, round(own_time * 1000, 3), round(cumulative * 1000, 3), total_calls))
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return rows[:limit]
+
+
+def _start_profilers(modes):
+    trace_memory = MEMORY in modes and not tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    return profiler, trace_memory, started
+
+
+def _stop_profilers(profiler, trace_memory, started, config):
+    """Stop the profilers; return (duration_ms, memory summary or None)"""
+    profiler.disable()
+    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    if not trace_memory:
+        return duration_ms, None
+    current, peak = tracemalloc.get_traced_memory()
+    top_lines = tracemalloc.take_snapshot().statistics('lineno')[:config['MEMORY_TOP_LINES']]
+    tracemalloc.stop()
+    return duration_ms, {
+        'peak_bytes': peak,
+        'retained_bytes': current,
+        'top_lines': [{'line': str(stat.traceback[0]), 'bytes': stat.size, 'count': stat.count} for stat in top_lines],
+    }
+
+
+def _record_profile(request, response, profiler, duration_ms, memory, config):
+    profile_id = f"{datetime.datetime.now(datetime.timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    summary = {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'duration_ms': duration_ms,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'functions': summarize_stats(profiler, max(config['SUMMARY_FUNCTIONS'], 20)),
+        'memory': memory,
+    }
+    try:
+        save_profile(profiler, summary, config)
+    except OSError as e:
+        logger.warning("Could not save profile %s: %s", profile_id, e)
+
+    response['X-Profile-Id'] = profile_id
+    response['X-Profile-Summary'] = '; '.join(
+        [f"total={duration_ms}ms"]
+        + [f"{function}={own_ms}ms" for function, own_ms, cumulative_ms, calls in summary['functions'][:config['SUMMARY_FUNCTIONS']]]
+        + ([f"peak_memory={memory['peak_bytes']}B"] if memory else [])
+    ).encode('ascii', 'replace').decode('ascii')
+    logger.info("Profiled %s %s in %sms as %s", request.method, request.path, duration_ms, profile_id)
+    return response
+
+
+def profile_request(get_response, request, modes, config):
+    """Call get_response(request) under the profilers and save the results"""
+    profiler, trace_memory, started = _start_profilers(modes)
+    try:
+        response = get_response(request)
+    finally:
+        duration_ms, memory = _stop_profilers(profiler, trace_memory, started, config)
+    return _record_profile(request, response, profiler, duration_ms, memory, config)
+
+
+async def aprofile_request(get_response, request, modes, config):
+    """Await get_response(request) under the profilers and save the results
+
+    The profilers see the whole event loop thread, so the profile also
+    includes other requests' coroutines that ran while this one awaited.
+    """
+    profiler, trace_memory, started = _start_profilers(modes)
+    try:
+        response = await get_response(request)
+    finally:
+        duration_ms, memory = _stop_profilers(profiler, trace_memory, started, config)
+    return _record_profile(request, response, profiler, duration_ms, memory, config)
+
+
+def save_profile(profiler, summary, config=None):
+    """Write <id>.prof and <id>.json to DIRECTORY and prune the oldest beyond MAX_PROFILES"""
+    config = config or get_profiling_settings()
+    directory = Path(config['DIRECTORY'])
+    directory.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(directory / f"{summary['id']}.prof")
+    (directory / f"{summary['id']}.json").write_text(json.dumps(summary, indent=2), encoding='utf-8')
+    for old in list_profiles(config)[config['MAX_PROFILES']:]:
+        delete_profile(old['id'], config)
+
+
+def list_profiles(config=None):
+    """Return saved profile summaries, newest first"""
+    config = config or get_profiling_settings()
+    summaries = []
+    for path in Path(config['DIRECTORY']).glob('*.json'):
+        try:
+            summaries.append(json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError):
+            continue
+    return sorted(summaries, key=lambda summary: summary['id'], reverse=True)
+
+
+def load_profile(profile_id, config=None):
+    """Return (summary, pstats.Stats) for a saved profile; raises FileNotFoundError"""
+    config = config or get_profiling_settings()
+    directory = Path(config['DIRECTORY'])
+    summary = json.loads((directory / f"{profile_id}.json").read_text(encoding='utf-8'))
+    return summary, pstats.Stats(str(directory / f"{profile_id}.prof"))
+
+
+def delete_profile(profile_id, config=None):
+    config = config or get_profiling_settings()
+    directory = Path(config['DIRECTORY'])
+    for suffix in ('.prof', '.json'):
+        (directory / f"{profile_id}{suffix}").unlink(missing_ok=True)
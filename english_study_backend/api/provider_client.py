@@ -0,0 +1,182 @@
+"""
+Shared HTTP client for upstream TTS and translation providers.
+
+Each upstream host gets one pooled requests.Session, so repeated calls reuse
+kept-alive TCP/TLS connections instead of handshaking every time. Timeouts
+are configured per provider in settings.PROVIDER_HTTP, and HOST_OVERRIDES
+can point any provider host at another base URL (e.g. a local stub server
+for benchmarks).
+"""
+import logging
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import circuit_breaker, metrics
+
+provider_logger = logging.getLogger('api.providers')
+
+# Provider names used for timeout lookup
+ELEVENLABS = 'elevenlabs'
+GOOGLE_CLOUD_TTS = 'google_cloud_tts'
+GOOGLE_TTS = 'google_tts'
+GROQ = 'groq'
+GOOGLE_TRANSLATE = 'google_translate'
+GOOGLE_TRANSLATE_FREE = 'google_translate_free'
+LANGUAGE_DETECT = 'language_detect'
+
+DEFAULT_SETTINGS = {
+    # Connection pools cached per session (one session per host)
+    'POOL_CONNECTIONS': 4,
+    # Kept-alive connections per host; size to the worker's thread count
+    'POOL_MAXSIZE': 32,
+    # In-flight upstream requests per ASGI worker (async_provider_client)
+    'ASYNC_MAX_CONNECTIONS': 500,
+    # (connect, read) timeouts in seconds
+    'DEFAULT_TIMEOUT': (5, 30),
+    'TIMEOUTS': {
+        ELEVENLABS: (5, 30),
+        GOOGLE_CLOUD_TTS: (5, 30),
+        GOOGLE_TTS: (5, 15),
+        GROQ: (5, 30),
+        GOOGLE_TRANSLATE: (5, 15),
+        GOOGLE_TRANSLATE_FREE: (5, 10),
+        LANGUAGE_DETECT: (3, 5),
+    },
+    # {'api.elevenlabs.io': 'http://127.0.0.1:8765'}
+    'HOST_OVERRIDES': {},
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_client_settings():
+    """Return PROVIDER_HTTP merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    user_config = getattr(settings, 'PROVIDER_HTTP', {})
+    config.update(user_config)
+    config['TIMEOUTS'] = {**DEFAULT_SETTINGS['TIMEOUTS'], **user_config.get('TIMEOUTS', {})}
+    return config
+
+
+def get_timeout(provider, config=None):
+    config = config or get_client_settings()
+    return config['TIMEOUTS'].get(provider, config['DEFAULT_TIMEOUT'])
+
+
+def resolve_url(url, config=None):
+    """Apply HOST_OVERRIDES to url"""
+    config = config or get_client_settings()
+    overrides = config['HOST_OVERRIDES']
+    if not overrides:
+        return url
+    parts = urlsplit(url)
+    base_url = overrides.get(parts.netloc)
+    if not base_url:
+        return url
+    base = urlsplit(base_url)
+    path = base.path.rstrip('/') + parts.path
+    return urlunsplit((base.scheme, base.netloc, path, parts.query, parts.fragment))
+
+
+def _build_session(config):
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=config['POOL_CONNECTIONS'],
+        pool_maxsize=config['POOL_MAXSIZE'],
+        max_retries=0,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Sessions are shared by every user, so never carry cookies between calls
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def get_session(url, config=None):
+    """Return the pooled session for url's scheme and host"""
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _build_session(config or get_client_settings())
+                _sessions[key] = session
+    return session
+
+
+def close_sessions():
+    """Close every pooled session (tests, benchmarks and shutdown hooks)"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def request(provider, method, url, breaker_scope=None, **kwargs):
+    """Send a request to a provider over its pooled session
+
+    Accepts the same keyword arguments as requests.request; timeout defaults
+    to the provider's configured value. The outcome is recorded with the
+    provider's circuit breaker, and with the key-scoped breaker when
+    breaker_scope (the user's API key) is given.
+    """
+    config = get_client_settings()
+    url = resolve_url(url, config)
+    kwargs.setdefault('timeout', get_timeout(provider, config))
+    start = time.perf_counter()
+    try:
+        response = get_session(url, config).request(method, url, **kwargs)
+    except requests.Timeout:
+        record_provider_call(provider, method, url, None, circuit_breaker.TIMEOUT, start)
+        circuit_breaker.record_outcome(provider, circuit_breaker.TIMEOUT, breaker_scope)
+        raise
+    except requests.RequestException:
+        record_provider_call(provider, method, url, None, circuit_breaker.FAILURE, start)
+        circuit_breaker.record_outcome(provider, circuit_breaker.FAILURE, breaker_scope)
+        raise
+    outcome = circuit_breaker.classify_status(response.status_code)
+    record_provider_call(provider, method, url, response.status_code, outcome, start)
+    circuit_breaker.record_outcome(provider, outcome, breaker_scope)
+    return response
+
+
+def record_provider_call(provider, method, url, status, outcome, start):
+    """Count an upstream call in api.metrics and log a structured record
+
+    The URL's query string (which can carry API keys) is never logged.
+    """
+    duration = time.perf_counter() - start
+    metrics.inc('api_provider_requests_total', (provider, status if status is not None else outcome))
+    metrics.observe('api_provider_duration_seconds', (provider,), duration)
+    if not provider_logger.isEnabledFor(logging.INFO):
+        return
+    duration_ms = round(duration * 1000, 2)
+    level = logging.INFO if outcome == circuit_breaker.SUCCESS else logging.WARNING
+    provider_logger.log(
+        level, "%s %s %s", provider, method, status if status is not None else outcome,
+        extra={
+            'provider': provider,
+            'method': method,
+            'host': urlsplit(url).netloc,
+            'status': status,
+            'outcome': outcome,
+            'duration_ms': duration_ms,
+        },
+    )
+
+
+def get(provider, url, **kwargs):
+    return request(provider, 'GET', url, **kwargs)
+
+
+def post(provider, url, **kwargs):
+    return request(provider, 'POST', url, **kwargs)
@@ -0,0 +1,30 @@
+"""
+Cache aliases that hold counters and locks shared by every worker process.
+
+Counters and single-flight locks need incr() and add() to be atomic across
+processes. Redis and Memcached provide that; the file-based cache does a
+read followed by a write (and incr() drops the entry's expiry), and the
+local-memory cache is private to one process. get_atomic_cache() returns
+the alias only when its backend is one of the atomic ones, so callers can
+fall back to the database or to per-process state otherwise.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+
+ATOMIC_BACKENDS = (RedisCache, BaseMemcachedCache)
+
+
+def is_atomic(backend):
+    """Return whether a cache backend's incr() and add() are atomic across processes"""
+    return isinstance(backend, ATOMIC_BACKENDS)
+
+
+def get_atomic_cache(alias):
+    """Return the cache for alias if it is configured with an atomic backend, otherwise None"""
+    try:
+        backend = caches[alias]
+    except InvalidCacheBackendError:
+        return None
+    return backend if is_atomic(backend) else None
@@ -0,0 +1,19 @@
+"""
+Test runner that keeps log records out of the test report.
+
+settings.LOGGING writes every record to stderr as JSON, which buries test
+output. While tests run, the root logger's handlers are swapped for a
+NullHandler; tests that check logging use assertLogs, which attaches its
+own handler, so they are unaffected.
+"""
+import logging
+
+from django.test.runner import DiscoverRunner
+
+
+class QuietLoggingRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        # Not restored afterwards: exit-time hooks (usage.flush) would log
+        # about the test database that was just destroyed
+        logging.getLogger().handlers = [logging.NullHandler()]
@@ -1,3 +1,1147 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import StudyHistory, UserProfile
+
+from . import audio_cache, basic_translation, batch_views, circuit_breaker, db_router, hedging, json_codec, language_detect, metrics, middleware, presynthesis, profiling, provider_client, shared_cache, translation_cache, usage, views
+from .audio_stream import RangeNotSatisfiable, end_stream_on_error, parse_range_header, tee_to_cache
+from .auth import get_token_user_id, issue_token, verify_token
+from .basic_translation import BasicTranslator
+from .log import JsonFormatter
+from .long_tts import split_text
+from .models import SynthesisJob
+
+
+class LanguageDetectionTests(SimpleTestCase):
+    ENGLISH_WORDS = [
+        'apple', 'school', 'question', 'sister', 'garden',
+        'morning', 'evening', 'music', 'orange', 'water', 'teacher', 'pronunciation',
+    ]
+
+    def test_single_english_words_are_not_confidently_foreign(self):
+        for word in self.ENGLISH_WORDS:
+            with self.subTest(word=word):
+                language, confident = language_detect.guess_language(word)
+                self.assertFalse(confident and language != 'en', f"{word} detected as {language}")
+
+    def test_single_words_go_to_the_remote_detector(self):
+        for word in ['apple', 'school', 'bonjour', 'gracias']:
+            with self.subTest(word=word):
+                self.assertFalse(language_detect.guess_language(word)[1])
+
+    def test_single_word_uses_remote_result(self):
+        with mock.patch.object(views, 'detect_text_language', return_value='en') as remote:
+            self.assertEqual(views.detect_source_language('question'), 'en')
+        remote.assert_called_once_with('question')
+
+    def test_single_word_prefers_english_when_remote_fails(self):
+        with mock.patch.object(views, 'detect_text_language', return_value=None):
+            for word in ['apple', 'morning', 'music', 'orange']:
+                with self.subTest(word=word):
+                    self.assertEqual(views.detect_source_language(word), 'en')
+
+    def test_sentences_are_detected_locally(self):
+        sentences = {
+            'en': 'Where is the nearest station?',
+            'es': '¿Dónde está la estación más cercana?',
+            'fr': "Il fait beau aujourd'hui",
+            'de': 'Ich habe heute keinen Hunger',
+            'it': 'Come stai oggi, amico mio?',
+            'pt': 'Você poderia me ajudar com isso?',
+            'vi': 'Hôm nay bạn có khỏe không?',
+        }
+        for expected, sentence in sentences.items():
+            with self.subTest(language=expected):
+                self.assertEqual(language_detect.guess_language(sentence), (expected, True))
+
+    def test_non_latin_scripts(self):
+        for expected, text in {'ko': '안녕하세요', 'ja': 'こんにちは', 'zh': '你好', 'ru': 'привет'}.items():
+            with self.subTest(language=expected):
+                self.assertEqual(language_detect.guess_language(text), (expected, True))
+
+    @override_settings(LANGUAGE_DETECTION={'REMOTE_FALLBACK': False})
+    def test_without_remote_fallback_short_input_is_trusted(self):
+        self.assertEqual(language_detect.guess_language('morning'), ('en', True))
+
+
+class HedgingTests(SimpleTestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown, wait=True)
+        self.started = []
+
+    def attempt(self, label, result, seconds=0.0):
+        def call():
+            self.started.append((label, time.monotonic()))
+            time.sleep(seconds)
+            return result
+        return (label, call)
+
+    def test_sequential_moves_on_after_a_failure(self):
+        attempts = [self.attempt('first', None), self.attempt('second', 'ok')]
+        self.assertEqual(hedging.run_hedged(attempts, executor=self.executor), (1, 'ok'))
+
+    def test_sequential_does_not_start_the_next_attempt_early(self):
+        attempts = [self.attempt('first', 'slow', 0.2), self.attempt('second', 'fast')]
+        self.assertEqual(hedging.run_hedged(attempts, executor=self.executor), (0, 'slow'))
+        self.assertEqual([label for label, _ in self.started], ['first'])
+
+    def test_hedged_sends_a_slow_free_request_again(self):
+        calls = []
+
+        def call():
+            calls.append(time.monotonic())
+            # The first copy is stuck behind a slow connection, the second is not
+            time.sleep(0.5 if len(calls) == 1 else 0)
+            return f'copy {len(calls)}'
+
+        with self.assertLogs('api.hedging', 'INFO'):
+            result = hedging.run_hedged([('free', call)], hedge_delay=0.05, executor=self.executor)
+        self.assertEqual(result, (0, 'copy 2'))
+        self.assertEqual(len(calls), 2)
+
+    def test_hedging_sends_a_request_at_most_twice(self):
+        attempts = [self.attempt('free', 'slow', 0.3)]
+        self.assertEqual(hedging.run_hedged(attempts, hedge_delay=0.01, executor=self.executor), (0, 'slow'))
+        self.assertEqual(len(self.started), 2)
+
+    def test_paid_attempt_is_not_hedged(self):
+        attempts = [self.attempt('paid', 'paid audio', 0.2), self.attempt('free', 'free audio')]
+        result = hedging.run_hedged(attempts, hedge_delay=0.01, executor=self.executor, no_hedge={0})
+        self.assertEqual(result, (0, 'paid audio'))
+        self.assertEqual([label for label, _ in self.started], ['paid'])
+
+    def test_hung_attempt_leaves_the_rest_of_the_deadline_to_the_next(self):
+        stop = threading.Event()
+        self.addCleanup(stop.set)
+        attempts = [('hung paid', lambda: stop.wait(5) and None), self.attempt('free', 'free audio')]
+        started = time.monotonic()
+        result = hedging.run_hedged(attempts, deadline=0.4, executor=self.executor, no_hedge={0})
+        self.assertEqual(result, (1, 'free audio'))
+        (_, free_start), = self.started
+        self.assertAlmostEqual(free_start - started, 0.2, delta=0.1)
+
+    def test_overrunning_attempt_can_still_win(self):
+        attempts = [self.attempt('slow', 'slow result', 0.15), self.attempt('slower', 'slower result', 1)]
+        result = hedging.run_hedged(attempts, deadline=0.2, executor=self.executor)
+        self.assertEqual(result, (0, 'slow result'))
+        self.assertEqual([label for label, _ in self.started], ['slow', 'slower'])
+
+    def test_deadline_gives_up(self):
+        stop = threading.Event()
+        attempts = [('hung', lambda: stop.wait(1))]
+        self.addCleanup(stop.set)
+        self.assertEqual(hedging.run_hedged(attempts, deadline=0.05, executor=self.executor), (None, None))
+
+    def test_async_hung_attempt_falls_through(self):
+        started = []
+
+        def attempt(label, result, seconds):
+            async def call():
+                started.append(label)
+                await asyncio.sleep(seconds)
+                return result
+            return (label, call)
+
+        attempts = [attempt('hung paid', 'paid audio', 5), attempt('free', 'free audio', 0)]
+        result = asyncio.run(hedging.arun_hedged(attempts, hedge_delay=0.01, deadline=0.2, no_hedge={0}))
+        self.assertEqual(result, (1, 'free audio'))
+        self.assertEqual(started, ['hung paid', 'free'])
+
+    def test_paid_attempts_are_the_ones_with_an_api_key(self):
+        chain = [{'api_key': 'key'}, {'api_key': None}, {'api_key': ''}]
+        self.assertEqual(hedging.paid_attempts(chain), {0})
+
+    def test_ships_sequential(self):
+        self.assertEqual(settings.PROVIDER_HEDGING['MODE'], hedging.SEQUENTIAL)
+
+
+@override_settings(USAGE_METERING={'DAILY_CHARACTER_LIMIT': 100, 'FLUSH_INTERVAL': 3600})
+class UsageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner')
+        UserProfile.objects.create(user=self.user)
+        patcher = mock.patch.object(usage, '_pending', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        usage.get_backend().clear()
+        self.client = self.client_class(HTTP_AUTHORIZATION=f'Token {issue_token(self.user)}')
+
+    def profile(self):
+        return UserProfile.objects.get(user=self.user)
+
+    def test_local_counters_enforce_the_limit(self):
+        self.assertTrue(usage.consume(self.user.id, 60))
+        self.assertFalse(usage.consume(self.user.id, 60))
+        self.assertTrue(usage.consume(self.user.id, 40))
+        self.assertEqual(usage.get_daily_usage(self.user.id), 100)
+        self.assertEqual(self.profile().daily_character_usage, 0)
+        usage.flush()
+        profile = self.profile()
+        self.assertEqual((profile.daily_character_usage, profile.total_characters_used), (100, 100))
+
+    def test_metering_stays_off_the_database(self):
+        usage.consume(self.user.id, 10)
+        with self.assertNumQueries(0):
+            self.assertTrue(usage.consume(self.user.id, 10))
+            usage.refund(self.user.id, 5)
+            self.assertEqual(usage.get_daily_usage(self.user.id), 15)
+
+    def test_expired_counter_picks_up_other_workers_usage(self):
+        usage.consume(self.user.id, 30)
+        # Another worker flushed 60 characters for today
+        UserProfile.objects.filter(user=self.user).update(daily_character_usage=60, last_usage_date=datetime.date.today())
+        usage.get_backend().clear()
+        self.assertEqual(usage.get_daily_usage(self.user.id), 90)
+        self.assertFalse(usage.consume(self.user.id, 20))
+        self.assertTrue(usage.consume(self.user.id, 10))
+
+    def test_refund_gives_characters_back(self):
+        usage.consume(self.user.id, 60)
+        usage.refund(self.user.id, 60)
+        self.assertEqual(usage.get_daily_usage(self.user.id), 0)
+        self.assertTrue(usage.consume(self.user.id, 100))
+
+    def test_users_without_a_profile_are_not_limited(self):
+        other = User.objects.create_user('guest-like')
+        self.assertTrue(usage.consume(other.id, 50))
+
+    def test_file_cache_is_not_used_for_counters(self):
+        with self.settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'usage': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/usage-test'},
+        }):
+            self.assertIsInstance(usage.get_backend(), LocMemCache)
+
+    def test_atomic_cache_counters(self):
+        backend = LocMemCache('usage-tests', {})
+        with mock.patch.object(shared_cache, 'ATOMIC_BACKENDS', (LocMemCache,)), \
+                mock.patch.object(usage, 'get_backend', return_value=backend):
+            self.assertTrue(usage.consume(self.user.id, 60))
+            self.assertFalse(usage.consume(self.user.id, 60))
+            usage.refund(self.user.id, 20)
+            self.assertEqual(usage.get_daily_usage(self.user.id), 40)
+            usage.flush()
+        self.assertEqual(self.profile().daily_character_usage, 40)
+
+    def test_browser_tts_fallback_is_not_charged(self):
+        with mock.patch.object(views, 'get_tts_provider_chain', return_value=[]):
+            response = self.client.post('/api/text-to-speech/', {'text': 'Hello there', 'source_language': 'en'},
+                                        content_type='application/json')
+        self.assertEqual(response.json()['service'], 'browser')
+        self.assertEqual(usage.get_daily_usage(self.user.id), 0)
+
+    def test_basic_translation_fallback_is_not_charged(self):
+        with mock.patch.object(views, 'get_translation_provider_chain', return_value=[]):
+            response = self.client.post('/api/translate/', {'text': 'Hello', 'source_language': 'en'},
+                                        content_type='application/json')
+        self.assertEqual(response.json()['service'], 'basic')
+        self.assertEqual(usage.get_daily_usage(self.user.id), 0)
+
+    def test_cached_audio_is_not_charged(self):
+        with mock.patch.object(views, 'synthesize_with_cache', return_value=('YXVkaW8=', True)):
+            response = self.client.post('/api/text-to-speech/', {'text': 'Hello there', 'source_language': 'en'},
+                                        content_type='application/json')
+        self.assertTrue(response.json()['cached'])
+        self.assertEqual(usage.get_daily_usage(self.user.id), 0)
+
+    def test_cached_translation_is_not_charged(self):
+        for cache_status, charged in ((translation_cache.CACHE_HIT, 0), (translation_cache.CACHE_MISS, 5)):
+            with self.subTest(cache_status=cache_status):
+                usage.get_backend().clear()
+                with mock.patch.object(views.translation_cache, 'get_or_translate', return_value=('안녕', cache_status)):
+                    response = self.client.post('/api/translate/', {'text': 'Hello', 'source_language': 'en'},
+                                                content_type='application/json')
+                self.assertEqual(response.json()['cache'], cache_status)
+                self.assertEqual(usage.get_daily_usage(self.user.id), charged)
+
+
+@override_settings(
+    DATABASE_REPLICA={'ALIAS': 'replica', 'PIN_CACHE_ALIAS': 'default'},
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'replica-tests'}},
+)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(db_router, 'replica_enabled', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = db_router.ReplicaRouter()
+        db_router.get_pin_backend().clear()
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.router.db_for_read(StudyHistory), 'replica')
+        self.assertIsNone(self.router.db_for_read(UserProfile))
+
+    def test_reads_after_a_write_in_the_same_request_use_default(self):
+        token = db_router.start_request(1)
+        try:
+            self.assertEqual(self.router.db_for_read(StudyHistory), 'replica')
+            self.assertEqual(self.router.db_for_write(StudyHistory), 'default')
+            self.assertEqual(self.router.db_for_read(StudyHistory), 'default')
+        finally:
+            db_router.finish_request(token, 1)
+
+    def test_a_write_pins_the_user_for_later_requests(self):
+        token = db_router.start_request(1)
+        self.router.db_for_write(StudyHistory)
+        db_router.finish_request(token, 1)
+
+        for user_id, expected in ((1, 'default'), (2, 'replica')):
+            with self.subTest(user_id=user_id):
+                token = db_router.start_request(user_id)
+                try:
+                    self.assertEqual(self.router.db_for_read(StudyHistory), expected)
+                finally:
+                    db_router.finish_request(token, user_id)
+
+    def test_other_writes_do_not_pin(self):
+        token = db_router.start_request(1)
+        self.router.db_for_write(UserProfile)
+        db_router.finish_request(token, 1)
+        token = db_router.start_request(1)
+        try:
+            self.assertEqual(self.router.db_for_read(StudyHistory), 'replica')
+        finally:
+            db_router.finish_request(token, 1)
+
+    def test_pin_expires(self):
+        with self.settings(DATABASE_REPLICA={'ALIAS': 'replica', 'PIN_CACHE_ALIAS': 'default', 'PIN_SECONDS': 0.05}):
+            token = db_router.start_request(1)
+            self.router.db_for_write(StudyHistory)
+            db_router.finish_request(token, 1)
+            time.sleep(0.1)
+            token = db_router.start_request(1)
+            try:
+                self.assertEqual(self.router.db_for_read(StudyHistory), 'replica')
+            finally:
+                db_router.finish_request(token, 1)
+
+
+class TokenTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner')
+
+    def test_round_trip(self):
+        token = issue_token(self.user)
+        self.assertEqual(verify_token(token), self.user.id)
+        self.assertEqual(get_token_user_id(f'Token {token}'), self.user.id)
+
+    def test_tampered_token_is_rejected(self):
+        token = issue_token(self.user)
+        user_id, rest = token.split(':', 1)
+        self.assertIsNone(verify_token(f'{user_id}1:{rest}'))
+        self.assertIsNone(verify_token('not-a-token'))
+
+    @override_settings(TOKEN_AUTH={'MAX_AGE': -1})
+    def test_expired_token_is_rejected(self):
+        with self.assertLogs('api.auth', 'INFO'):
+            self.assertIsNone(verify_token(issue_token(self.user)))
+
+    def test_other_schemes_are_ignored(self):
+        token = issue_token(self.user)
+        for header in ['', f'Bearer {token}', 'Token ', token]:
+            with self.subTest(header=header):
+                self.assertIsNone(get_token_user_id(header))
+
+
+class RangeHeaderTests(SimpleTestCase):
+    def test_ranges(self):
+        cases = {
+            'bytes=0-99': (0, 99),
+            'bytes=100-': (100, 999),
+            'bytes=-100': (900, 999),
+            'bytes=-5000': (0, 999),
+            'bytes=900-5000': (900, 999),
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(parse_range_header(header, 1000), expected)
+
+    def test_unusable_headers_mean_the_full_body(self):
+        for header in ['', None, 'bytes=-', 'bytes=0-1,5-9', 'items=0-9', 'bytes=a-b']:
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range_header(header, 1000))
+
+    def test_unsatisfiable_ranges(self):
+        for header in ['bytes=1000-', 'bytes=50-10', 'bytes=-0']:
+            with self.subTest(header=header):
+                with self.assertRaises(RangeNotSatisfiable):
+                    parse_range_header(header, 1000)
+
+
+class StreamErrorTests(TestCase):
+    def test_upstream_error_ends_the_stream_and_discards_the_clip(self):
+        def upstream():
+            yield b'first'
+            raise RuntimeError('TTS chunk 2 of 2 failed')
+        writer = mock.Mock()
+        with self.assertLogs('api.audio_stream', 'ERROR'):
+            chunks = list(end_stream_on_error(tee_to_cache(upstream(), writer), 'Google TTS proxy'))
+        self.assertEqual(chunks, [b'first'])
+        writer.abort.assert_called_once()
+        writer.commit.assert_not_called()
+
+    def test_long_text_failure_after_headers_gives_a_short_clean_body(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        cache = audio_cache.AudioCache(dict(audio_cache.get_cache_settings(), DIR=Path(cache_dir.name)))
+        text = 'First sentence here. Second sentence here.'
+        with mock.patch.object(views, 'get_audio_cache', return_value=cache), \
+                mock.patch.object(views.long_tts, 'get_chunk_limit', return_value=25), \
+                mock.patch.object(views, 'call_google_tts_api', side_effect=lambda chunk, *args: 'Zmlyc3Q=' if chunk.startswith('First') else None):
+            response = self.client.post(
+                '/api/text-to-speech/stream/', {'text': text, 'source_language': 'en'},
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+            with self.assertLogs('api.audio_stream', 'ERROR'):
+                body = b''.join(response.streaming_content)
+        self.assertEqual(body, b'first')
+        self.assertEqual(cache.open(views.make_cache_key(text, 'en', 'normal', 'google', '')), (None, None))
+
+
+class DiskLRUTests(SimpleTestCase):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.disk = audio_cache.DiskLRU(cache_dir.name, max_bytes=100, evict_to_ratio=0.7)
+
+    def test_eviction_removes_least_recently_used_clips(self):
+        for age, key in enumerate(['aa1', 'bb2', 'cc3']):
+            self.disk.set(key, b'x' * 30)
+            os.utime(self.disk.path_for(key), (1000 + age, 1000 + age))
+        self.assertEqual(self.disk.get('aa1'), b'x' * 30)
+        self.disk.set('dd4', b'x' * 30)
+        self.assertEqual([key for key in ['aa1', 'bb2', 'cc3', 'dd4'] if self.disk.get(key)], ['aa1', 'dd4'])
+        self.assertEqual(self.disk.total_bytes(), 60)
+
+    def test_writer_publishes_only_on_commit(self):
+        writer = self.disk.open_writer('aa1')
+        writer.write(b'half')
+        self.assertIsNone(self.disk.get('aa1'))
+        writer.write(b' done')
+        writer.commit()
+        self.assertEqual(self.disk.get('aa1'), b'half done')
+
+    def test_aborted_and_empty_writes_leave_nothing_behind(self):
+        writer = self.disk.open_writer('aa1')
+        writer.write(b'partial')
+        writer.abort()
+        self.disk.open_writer('bb2').commit()
+        self.assertEqual([path for path in Path(self.disk.directory).rglob('*') if path.is_file()], [])
+
+
+class ProviderClientTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(provider_client, '_sessions', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        circuit_breaker.get_backend().clear()
+
+    def test_one_session_per_scheme_and_host(self):
+        session = provider_client.get_session('https://api.groq.com/openai/v1/chat')
+        self.assertIs(provider_client.get_session('https://api.groq.com/other'), session)
+        self.assertIsNot(provider_client.get_session('http://api.groq.com/openai/v1/chat'), session)
+        self.assertIsNot(provider_client.get_session('https://api.elevenlabs.io/v1'), session)
+
+    @override_settings(PROVIDER_HTTP={'HOST_OVERRIDES': {'api.elevenlabs.io': 'http://127.0.0.1:8765/stub/'}})
+    def test_host_overrides_rewrite_only_their_host(self):
+        self.assertEqual(
+            provider_client.resolve_url('https://api.elevenlabs.io/v1/text-to-speech/abc?format=mp3'),
+            'http://127.0.0.1:8765/stub/v1/text-to-speech/abc?format=mp3',
+        )
+        self.assertEqual(provider_client.resolve_url('https://api.groq.com/v1'), 'https://api.groq.com/v1')
+
+    @override_settings(PROVIDER_HTTP={'HOST_OVERRIDES': {'api.groq.com': 'http://127.0.0.1:8765'}})
+    def test_requests_go_to_the_override_with_the_provider_timeout(self):
+        session = mock.Mock()
+        session.request.return_value = mock.Mock(status_code=200)
+        with mock.patch.object(provider_client, 'get_session', return_value=session) as get_session:
+            provider_client.post(provider_client.GROQ, 'https://api.groq.com/v1/chat', json={})
+        get_session.assert_called_once_with('http://127.0.0.1:8765/v1/chat', mock.ANY)
+        session.request.assert_called_once_with('POST', 'http://127.0.0.1:8765/v1/chat', json={}, timeout=(5, 30))
+
+
+class JsonFormatterTests(SimpleTestCase):
+    def format(self, *args, **kwargs):
+        logger = logging.getLogger('api.tests.json')
+        record = logger.makeRecord(logger.name, logging.WARNING, __file__, 1, *args, **kwargs)
+        return json.loads(JsonFormatter().format(record))
+
+    def test_one_object_with_extra_fields(self):
+        entry = self.format('%s %s', ('GET', '한국어'), None, extra={'status': 200, 'path': Path('/x')})
+        self.assertEqual(entry['level'], 'WARNING')
+        self.assertEqual(entry['logger'], 'api.tests.json')
+        self.assertEqual(entry['message'], 'GET 한국어')
+        self.assertEqual((entry['status'], entry['path']), (200, '/x'))
+        self.assertNotIn('args', entry)
+        self.assertTrue(entry['time'].endswith('+00:00'))
+
+    def test_exceptions_are_included(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            entry = self.format('failed', (), sys.exc_info())
+        self.assertIn('ValueError: boom', entry['exc'])
+        self.assertNotIn('\n', JsonFormatter().format(logging.makeLogRecord({'msg': 'a\nb'})))
+
+
+class MetricsRenderTests(SimpleTestCase):
+    def snapshot(self, counters=(), histograms=(), buckets=(0.1, 1)):
+        return {'buckets': list(buckets), 'counters': list(counters), 'histograms': list(histograms)}
+
+    def test_counters_from_every_process_are_summed(self):
+        text = metrics.render([
+            self.snapshot(counters=[['api_requests_total', ['translate', 'POST', '200'], 3]]),
+            self.snapshot(counters=[['api_requests_total', ['translate', 'POST', '200'], 4],
+                                    ['api_audio_bytes_served_total', ['go"ogle'], 10]]),
+        ])
+        self.assertIn('api_requests_total{endpoint="translate",method="POST",status="200"} 7\n', text)
+        self.assertIn('api_audio_bytes_served_total{service="go\\"ogle"} 10\n', text)
+        self.assertIn('# TYPE api_request_duration_seconds histogram\n', text)
+
+    def test_histogram_buckets_are_merged_and_cumulative(self):
+        text = metrics.render([
+            self.snapshot(histograms=[['api_provider_duration_seconds', ['groq'], [1, 0, 0, 0.05, 1]]]),
+            self.snapshot(histograms=[['api_provider_duration_seconds', ['groq'], [0, 2, 1, 3.5, 3]]]),
+            # A process from a deploy with other buckets is left out
+            self.snapshot(histograms=[['api_provider_duration_seconds', ['groq'], [9, 9, 18.0, 18]]], buckets=(0.5,)),
+        ])
+        lines = [line for line in text.splitlines() if line.startswith('api_provider_duration_seconds')]
+        self.assertEqual(lines, [
+            'api_provider_duration_seconds_bucket{provider="groq",le="0.1"} 1',
+            'api_provider_duration_seconds_bucket{provider="groq",le="1.0"} 3',
+            'api_provider_duration_seconds_bucket{provider="groq",le="+Inf"} 4',
+            'api_provider_duration_seconds_sum{provider="groq"} 3.55',
+            'api_provider_duration_seconds_count{provider="groq"} 4',
+        ])
+
+    @override_settings(METRICS={'LATENCY_BUCKETS': (0.1, 1)})
+    def test_observations_land_in_their_bucket(self):
+        with mock.patch.object(metrics, '_histograms', {}), mock.patch.object(metrics, '_start_writer'):
+            for seconds in [0.05, 0.1, 0.5, 7]:
+                metrics.observe('api_provider_duration_seconds', ('groq',), seconds)
+            histogram, = metrics.snapshot()['histograms']
+        self.assertEqual(histogram[2][:3], [2, 1, 1])
+        self.assertEqual(histogram[2][-1], 4)
+
+
+class ProfilingTokenTests(SimpleTestCase):
+    def modes(self, token):
+        request = RequestFactory().get('/', headers={profiling.TOKEN_HEADER: token})
+        return profiling.get_requested_modes(request, profiling.get_profiling_settings())
+
+    def test_signed_tokens_pick_the_modes(self):
+        self.assertEqual(self.modes(profiling.issue_token()), {profiling.CPU})
+        self.assertEqual(self.modes(profiling.issue_token(memory=True)), {profiling.CPU, profiling.MEMORY})
+
+    def test_forged_and_expired_tokens_are_ignored(self):
+        with mock.patch('django.core.signing.time.time', return_value=time.time() - 7200):
+            expired = profiling.issue_token()
+        for token in ['cpu', 'cpu,memory:1abc:forged', profiling.issue_token().replace('cpu', 'cpu,memory'), expired]:
+            with self.subTest(token=token):
+                with self.assertLogs('api.profiling', 'WARNING'):
+                    self.assertEqual(self.modes(token), set())
+
+    def test_only_token_requests_are_profiled(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with override_settings(REQUEST_PROFILING={'ENABLED': True, 'DIRECTORY': Path(directory.name)}):
+            profiled = self.client.get('/api/providers/health/', headers={profiling.TOKEN_HEADER: profiling.issue_token()})
+            plain = self.client.get('/api/providers/health/', headers={profiling.TOKEN_HEADER: 'cpu'})
+        self.assertTrue((Path(directory.name) / f"{profiled['X-Profile-Id']}.prof").exists())
+        self.assertNotIn('X-Profile-Id', plain)
+
+
+@override_settings(CORS={
+    'ALLOWED_ORIGINS': ['http://localhost:8000'],
+    'ALLOWED_ORIGIN_REGEXES': [r'^http://192\.168\.\d{1,3}\.\d{1,3}(:\d+)?$'],
+    'PREFLIGHT_MAX_AGE': 600,
+})
+class CorsMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.get_response = mock.Mock(return_value=HttpResponse('ok'))
+        self.middleware = middleware.CorsMiddleware(self.get_response)
+
+    def call(self, method, origin):
+        return self.middleware(getattr(RequestFactory(), method)('/api/translate/', headers={'Origin': origin}))
+
+    def test_allowed_origins_are_echoed(self):
+        for origin in ['http://localhost:8000', 'http://192.168.0.12:3000']:
+            with self.subTest(origin=origin):
+                response = self.call('get', origin)
+                self.assertEqual(response['Access-Control-Allow-Origin'], origin)
+                self.assertEqual(response['Access-Control-Allow-Credentials'], 'true')
+                self.assertIn('X-TTS-Cache', response['Access-Control-Expose-Headers'])
+                self.assertEqual(response['Vary'], 'Origin')
+
+    def test_other_origins_get_no_cors_headers(self):
+        for origin in ['http://evil.example', 'http://192.168.0.12.evil.example', 'http://localhost:8000.evil.example']:
+            with self.subTest(origin=origin):
+                response = self.call('get', origin)
+                self.assertNotIn('Access-Control-Allow-Origin', response)
+                self.assertNotIn('Access-Control-Allow-Credentials', response)
+                self.assertEqual(response['Vary'], 'Origin')
+
+    def test_preflight_is_answered_without_running_the_view(self):
+        response = self.call('options', 'http://localhost:8000')
+        self.get_response.assert_not_called()
+        self.assertEqual(response['Access-Control-Max-Age'], '600')
+        self.assertIn('Authorization', response['Access-Control-Allow-Headers'])
+        self.assertIn('POST', response['Access-Control-Allow-Methods'])
+
+
+@override_settings(RESPONSE_COMPRESSION={'MIN_BYTES': 100})
+class CompressionMiddlewareTests(SimpleTestCase):
+    def call(self, response, accept_encoding='gzip'):
+        compression = middleware.CompressionMiddleware(lambda request: response)
+        return compression(RequestFactory().get('/', headers={'Accept-Encoding': accept_encoding}))
+
+    def json_response(self, size):
+        response = HttpResponse(json.dumps({'text': 'a' * size}), content_type='application/json')
+        response['ETag'] = '"abc"'
+        return response
+
+    def test_large_responses_are_gzipped_with_a_weak_etag(self):
+        response = self.call(self.json_response(500))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), {'text': 'a' * 500})
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_small_streamed_and_unaccepted_responses_are_left_alone(self):
+        cases = {
+            'small': (self.json_response(10), 'gzip'),
+            'streamed': (StreamingHttpResponse([b'a' * 500], content_type='text/plain'), 'gzip'),
+            'audio': (HttpResponse(b'a' * 500, content_type='audio/mpeg'), 'gzip'),
+            'identity': (self.json_response(500), 'identity'),
+        }
+        for name, (response, accept_encoding) in cases.items():
+            with self.subTest(name):
+                self.assertNotIn('Content-Encoding', self.call(response, accept_encoding))
+
+    def test_conditional_get_answers_a_matching_etag_with_304(self):
+        conditional = middleware.ConditionalGetMiddleware(lambda request: HttpResponse('{"a": 1}', content_type='application/json'))
+        response = conditional(RequestFactory().get('/'))
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        revalidated = conditional(RequestFactory().get('/', headers={'If-None-Match': response['ETag']}))
+        self.assertEqual(revalidated.status_code, 304)
+
+
+class JsonBodyTests(SimpleTestCase):
+    def request(self, body, content_length=None):
+        request = HttpRequest()
+        request._body = body
+        if content_length is not None:
+            request.META['CONTENT_LENGTH'] = str(content_length)
+        return request
+
+    def test_body_within_the_limit_is_decoded(self):
+        self.assertEqual(json_codec.parse_json_body(self.request(b'{"text": "hi"}'), max_bytes=20), {'text': 'hi'})
+        with self.assertRaises(json.JSONDecodeError):
+            json_codec.parse_json_body(self.request(b'{"text"'), max_bytes=20)
+
+    def test_declared_length_is_checked_before_reading(self):
+        request = self.request(b'', content_length=21)
+        with mock.patch.object(HttpRequest, 'body', new_callable=mock.PropertyMock) as body:
+            with self.assertRaises(json_codec.RequestBodyTooLarge):
+                json_codec.parse_json_body(request, max_bytes=20)
+        body.assert_not_called()
+
+    def test_body_longer_than_declared_is_rejected(self):
+        with self.assertRaises(json_codec.RequestBodyTooLarge):
+            json_codec.parse_json_body(self.request(b'{"text": "' + b'a' * 20 + b'"}', content_length=10), max_bytes=20)
+
+    @override_settings(JSON_CODEC={'MAX_BODY_BYTES': 50})
+    def test_views_answer_413(self):
+        response = self.client.post('/api/translate/', {'text': 'a' * 100}, content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json(), {'error': 'Request body too large (limit 50 bytes)'})
+
+
+class SplitTextTests(SimpleTestCase):
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(split_text('Hello there. How are you?', 100), ['Hello there. How are you?'])
+
+    def test_splits_at_sentences_and_packs_chunks(self):
+        text = 'One two. Three four. Five six seven eight nine.'
+        chunks = split_text(text, 20)
+        self.assertEqual(chunks, ['One two. Three four.', 'Five six seven eight', 'nine.'])
+
+    def test_chunks_respect_the_limit(self):
+        text = 'A fairly long sentence, with a clause or two, and then some more words at the end. ' * 5
+        chunks = split_text(text, 30)
+        self.assertTrue(all(len(chunk) <= 30 for chunk in chunks))
+        self.assertEqual(' '.join(chunks).split(), text.split())
+
+    def test_long_word_is_hard_split(self):
+        self.assertEqual(split_text('a' * 25, 10), ['a' * 10, 'a' * 10, 'a' * 5])
+
+    def test_blank_text(self):
+        self.assertEqual(split_text('   ', 10), [])
+
+
+class BasicTranslatorTests(SimpleTestCase):
+    def setUp(self):
+        self.translator = BasicTranslator([
+            ('hello', '안녕'),
+            ('hello world', '안녕, 세상'),
+            ('good morning', '좋은 아침'),
+            ('the', ''),
+        ])
+
+    def test_longest_phrase_wins(self):
+        self.assertEqual(self.translator.translate_sentence('Hello world'), '안녕, 세상')
+        self.assertEqual(self.translator.translate_sentence('Hello there'), '안녕 there')
+
+    def test_matching_ignores_case_and_punctuation(self):
+        self.assertEqual(self.translator.translate_sentence('GOOD, morning!'), '좋은 아침')
+
+    def test_empty_translation_drops_the_phrase(self):
+        self.assertEqual(self.translator.translate_sentence('the world'), 'world')
+
+    def test_sentences_are_translated_separately(self):
+        self.assertEqual(self.translator.translate('Hello. Good morning.'), '안녕. 좋은 아침')
+
+    def test_later_entries_replace_earlier_ones(self):
+        self.translator.add('Hello', '여보세요')
+        self.assertEqual(self.translator.translate_sentence('hello'), '여보세요')
+        self.assertEqual(self.translator.size, 4)
+
+
+class BasicDictionaryTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        Path(directory.name, 'en-ko.tsv').write_text('# phrase\ttranslation\n\nhello\t안녕\r\nno tab here\ngood morning\t좋은 아침\n', encoding='utf-8')
+        patcher = mock.patch.object(basic_translation, '_translators', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        dictionaries = override_settings(BASIC_TRANSLATION={'DIRS': [Path(directory.name)]})
+        dictionaries.enable()
+        self.addCleanup(dictionaries.disable)
+
+    def test_dictionary_file_is_loaded(self):
+        with self.assertLogs('api.basic_translation', 'INFO'):
+            self.assertEqual(basic_translation.translate('Hello. Good morning!'), '안녕. 좋은 아침')
+        self.assertEqual(basic_translation.get_translator().size, 2)
+
+    def test_pairs_without_a_dictionary_keep_the_text(self):
+        # The old built-in dictionary answered in Korean whatever the target
+        with self.assertLogs('api.basic_translation', 'INFO'):
+            self.assertEqual(basic_translation.translate('Hello', target_language='ja'), 'Hello')
+
+
+@override_settings(PROVIDER_CIRCUIT_BREAKER={'CACHE_ALIAS': 'breaker-tests', 'MIN_REQUESTS': 4, 'TIMEOUT_THRESHOLD': 2})
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        # Without an atomic alias the breakers live in this process's own cache
+        circuit_breaker.get_backend().clear()
+
+    def record(self, *outcomes, api_key=None):
+        for outcome in outcomes:
+            circuit_breaker.record_outcome('elevenlabs', outcome, api_key=api_key)
+
+    def state(self):
+        return circuit_breaker.get_health(['elevenlabs'])[0]['state']
+
+    def test_opens_on_error_rate(self):
+        self.record(circuit_breaker.SUCCESS, circuit_breaker.FAILURE, circuit_breaker.SUCCESS)
+        self.assertEqual(self.state(), circuit_breaker.CLOSED)
+        self.record(circuit_breaker.FAILURE)
+        self.assertEqual(self.state(), circuit_breaker.OPEN)
+        self.assertFalse(circuit_breaker.allow_request('elevenlabs'))
+
+    def test_opens_on_timeouts(self):
+        self.record(circuit_breaker.TIMEOUT, circuit_breaker.TIMEOUT)
+        self.assertEqual(self.state(), circuit_breaker.OPEN)
+
+    def test_half_open_admits_one_probe(self):
+        with self.settings(PROVIDER_CIRCUIT_BREAKER={'CACHE_ALIAS': 'breaker-tests', 'OPEN_SECONDS': 0}):
+            self.record(circuit_breaker.TIMEOUT, circuit_breaker.TIMEOUT, circuit_breaker.TIMEOUT)
+            self.assertEqual(self.state(), circuit_breaker.HALF_OPEN)
+            self.assertTrue(circuit_breaker.allow_request('elevenlabs'))
+            self.assertFalse(circuit_breaker.allow_request('elevenlabs'))
+
+    def test_probe_success_closes(self):
+        with self.settings(PROVIDER_CIRCUIT_BREAKER={'CACHE_ALIAS': 'breaker-tests', 'OPEN_SECONDS': 0}):
+            self.record(circuit_breaker.TIMEOUT, circuit_breaker.TIMEOUT, circuit_breaker.TIMEOUT)
+            self.assertTrue(circuit_breaker.allow_request('elevenlabs'))
+            self.record(circuit_breaker.SUCCESS)
+            self.assertEqual(self.state(), circuit_breaker.CLOSED)
+            self.assertTrue(circuit_breaker.allow_request('elevenlabs'))
+            self.assertEqual(circuit_breaker.get_health(['elevenlabs'])[0]['requests'], 0)
+
+    def test_probe_failure_reopens(self):
+        self.record(circuit_breaker.TIMEOUT, circuit_breaker.TIMEOUT)
+        with mock.patch.object(circuit_breaker.time, 'time', return_value=time.time() + 60):
+            self.assertTrue(circuit_breaker.allow_request('elevenlabs'))
+            self.record(circuit_breaker.FAILURE)
+        self.assertEqual(self.state(), circuit_breaker.OPEN)
+        self.assertFalse(circuit_breaker.allow_request('elevenlabs'))
+
+    def test_rejected_keys_only_open_their_own_breaker(self):
+        self.record(*[circuit_breaker.KEY_FAILURE] * 3, api_key='revoked')
+        self.assertFalse(circuit_breaker.allow_request('elevenlabs', api_key='revoked'))
+        self.assertTrue(circuit_breaker.allow_request('elevenlabs', api_key='other'))
+        self.assertTrue(circuit_breaker.allow_request('elevenlabs'))
+        self.assertEqual(self.state(), circuit_breaker.CLOSED)
+
+    def test_status_classification(self):
+        cases = {200: circuit_breaker.SUCCESS, 404: circuit_breaker.SUCCESS, 429: circuit_breaker.KEY_FAILURE,
+                 401: circuit_breaker.KEY_FAILURE, 503: circuit_breaker.FAILURE}
+        for status, expected in cases.items():
+            with self.subTest(status=status):
+                self.assertEqual(circuit_breaker.classify_status(status), expected)
+
+
+class StudyHistoryViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner')
+        self.client = self.client_class(HTTP_AUTHORIZATION=f'Token {issue_token(self.user)}')
+        for index in range(5):
+            StudyHistory.objects.create(user=self.user, english_text=f'sentence {index}', korean_translation=f'문장 {index}')
+
+    def get(self, **params):
+        return self.client.get('/api/study/history/', params)
+
+    def test_requires_a_token(self):
+        self.assertEqual(self.client_class().get('/api/study/history/').status_code, 401)
+
+    def test_cursor_pages_cover_every_item_once(self):
+        texts = []
+        cursor = None
+        while True:
+            data = self.get(limit=2, **({'cursor': cursor} if cursor else {})).json()
+            texts.extend(item['text'] for item in data['history'])
+            self.assertLessEqual(len(data['history']), 2)
+            if not data['has_more']:
+                self.assertIsNone(data['next_cursor'])
+                break
+            cursor = data['next_cursor']
+        self.assertEqual(texts, [f'sentence {index}' for index in reversed(range(5))])
+
+    def test_cursor_round_trip(self):
+        item = StudyHistory.objects.first()
+        cursor = views.encode_history_cursor(item.created_at, item.id)
+        self.assertEqual(views.decode_history_cursor(cursor), (item.created_at, item.id))
+
+    def test_invalid_cursor(self):
+        for cursor in ['%%%', 'bm90LWEtY3Vyc29y']:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get(cursor=cursor).status_code, 400)
+
+    def test_fields_limit_the_columns(self):
+        item = self.get(fields='text,accessed_count').json()['history'][0]
+        self.assertEqual(set(item), {'id', 'created_at', 'text', 'accessed_count'})
+        self.assertEqual(self.get(fields='text,password').status_code, 400)
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.get()
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/study/history/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        StudyHistory.objects.upsert(self.user, 'sentence 0')
+        response = self.client.get('/api/study/history/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_import_keeps_guest_save_times(self):
+        saved = datetime.datetime(2026, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+        items = [
+            {'id': int(saved.timestamp() * 1000), 'text': 'from id'},
+            {'created_at': '2026-02-03T04:05:06+09:00', 'text': 'from created_at'},
+            {'id': (time.time() + 86400) * 1000, 'text': 'in the future'},
+            {'id': 5, 'created_at': '2026-02-03 04:05', 'text': 'no usable time'},
+            {'text': 'from id'},
+            {'text': 'sentence 1'},
+        ]
+        response = self.client.post('/api/study/import/', {'items': items}, content_type='application/json')
+        self.assertEqual(
+            {key: response.json()[key] for key in ('inserted', 'merged', 'repeated', 'skipped')},
+            {'inserted': 4, 'merged': 1, 'repeated': 1, 'skipped': 0},
+        )
+        times = dict(StudyHistory.objects.filter(user=self.user).values_list('english_text', 'created_at'))
+        self.assertEqual(times['from id'], saved)
+        self.assertEqual(times['from created_at'], datetime.datetime(2026, 2, 2, 19, 5, 6, tzinfo=datetime.timezone.utc))
+        for text in ['in the future', 'no usable time']:
+            self.assertGreater(times[text], timezone.now() - datetime.timedelta(minutes=1))
+
+    def test_delete_selected(self):
+        item_ids = list(StudyHistory.objects.values_list('id', flat=True)[:2])
+        response = self.client.delete('/api/study/delete-selected/', {'item_ids': item_ids}, content_type='application/json')
+        self.assertEqual(response.json()['deleted_count'], 2)
+        self.assertEqual(StudyHistory.objects.filter(user=self.user).count(), 3)
+
+
+@override_settings(CORS={'ALLOWED_ORIGINS': ['http://localhost:8000']})
+class AsyncMiddlewareTests(TestCase):
+    API_MIDDLEWARE = [path.rsplit('.', 1)[1] for path in settings.MIDDLEWARE if path.startswith('api.middleware.')]
+
+    def test_every_middleware_stays_async_under_asgi(self):
+        async def get_response(request):
+            return None
+
+        for name in self.API_MIDDLEWARE:
+            with self.subTest(middleware=name):
+                self.assertTrue(iscoroutinefunction(getattr(middleware, name)(get_response)))
+
+    def test_sync_stack_is_unchanged(self):
+        for name in self.API_MIDDLEWARE:
+            with self.subTest(middleware=name):
+                self.assertFalse(iscoroutinefunction(getattr(middleware, name)(lambda request: None)))
+
+    async def test_request_through_the_async_stack(self):
+        user = await User.objects.acreate(username='learner')
+        await StudyHistory.objects.acreate(user=user, english_text='Hello there')
+        authorization = f'Token {issue_token(user)}'
+        response = await self.async_client.get(
+            '/api/study/history/', headers={'Authorization': authorization, 'Origin': 'http://localhost:8000'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Access-Control-Allow-Origin'], 'http://localhost:8000')
+        self.assertEqual(response.json()['history'][0]['text'], 'Hello there')
+
+        response = await self.async_client.get(
+            '/api/study/history/', headers={'Authorization': authorization, 'If-None-Match': response['ETag']},
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_preflight_is_answered_without_the_view(self):
+        response = await self.async_client.options('/api/translate/', headers={'Origin': 'http://localhost:8000'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Access-Control-Max-Age', response)
+
+
+@override_settings(PROVIDER_HEDGING={'MODE': 'sequential', 'TTS_DEADLINE': 0.6})
+class ProviderDeadlineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner')
+        UserProfile.objects.create(user=self.user, elevenlabs_api_key='paid-key')
+        self.client = self.client_class(HTTP_AUTHORIZATION=f'Token {issue_token(self.user)}')
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        disabled = audio_cache.AudioCache(dict(audio_cache.get_cache_settings(), ENABLED=False, DIR=Path(cache_dir.name)))
+        patcher = mock.patch.object(views, 'get_audio_cache', return_value=disabled)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        circuit_breaker.get_backend().clear()
+
+    def test_hung_paid_provider_falls_through_to_free_google(self):
+        stop = threading.Event()
+        self.addCleanup(stop.set)
+        with mock.patch.object(views, 'call_elevenlabs_api', side_effect=lambda *args: stop.wait(5) and None), \
+                mock.patch.object(views, 'call_google_tts_api', return_value='YXVkaW8=') as google:
+            started = time.monotonic()
+            with self.assertLogs('api.hedging', 'INFO'):
+                response = self.client.post(
+                    '/api/text-to-speech/', {'text': 'Hello there', 'source_language': 'en', 'service': 'elevenlabs'},
+                    content_type='application/json',
+                )
+            elapsed = time.monotonic() - started
+        self.assertEqual(response.json()['service'], 'google')
+        google.assert_called_once()
+        self.assertLess(elapsed, 0.6)
+
+
+class TranslationCacheClearTests(SimpleTestCase):
+    def test_redis_deletes_only_translation_keys(self):
+        backend = RedisCache('redis://127.0.0.1:6379/0', {'KEY_PREFIX': 'translations'})
+        client = mock.Mock()
+        client.scan_iter.return_value = iter([b'translations:1:translation:google:a', b'translations:1:translation:google:b'])
+        client.delete.side_effect = lambda *keys: len(keys)
+        backend.__dict__['_cache'] = mock.Mock(get_client=mock.Mock(return_value=client))
+        with mock.patch.object(translation_cache, 'caches', {'translations': backend}):
+            self.assertEqual(translation_cache.clear(), 2)
+        client.scan_iter.assert_called_once_with(match='translations:1:translation:*', count=translation_cache.CLEAR_BATCH_SIZE)
+        client.flushdb.assert_not_called()
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'clear-default'},
+        'translations': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'clear-translations'},
+    })
+    def test_command_clears_the_translations_alias(self):
+        caches['default'].set('usage:1', 5)
+        caches['translations'].set('translation:google:a', 'x')
+        call_command('translation_cache', 'clear', stdout=io.StringIO())
+        self.assertIsNone(caches['translations'].get('translation:google:a'))
+        self.assertEqual(caches['default'].get('usage:1'), 5)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'clear-only-default'}})
+    def test_command_never_clears_the_default_cache(self):
+        caches['default'].set('usage:1', 5)
+        with self.assertRaises(CommandError):
+            call_command('translation_cache', 'clear', stdout=io.StringIO())
+        self.assertEqual(caches['default'].get('usage:1'), 5)
+
+
+@override_settings(
+    PRESYNTHESIS={'SPEEDS': ['slow', 'normal'], 'RETRY_DELAY': 60, 'MAX_ATTEMPTS': 2},
+    USAGE_METERING={'DAILY_CHARACTER_LIMIT': 100, 'FLUSH_INTERVAL': 3600},
+)
+class PresynthesisTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner')
+        self.profile = UserProfile.objects.create(user=self.user)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        cache = audio_cache.AudioCache(dict(audio_cache.get_cache_settings(), DIR=Path(cache_dir.name)))
+        for patcher in [mock.patch.object(views, 'get_audio_cache', return_value=cache), mock.patch.object(usage, '_pending', {})]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        usage.get_backend().clear()
+        circuit_breaker.get_backend().clear()
+
+    def run_job(self):
+        job, = SynthesisJob.objects.claim(1, 300)
+        return job, presynthesis.process_job(job, presynthesis.get_presynthesis_settings())
+
+    def test_enqueue_is_deduplicated(self):
+        presynthesis.enqueue(self.user.id, 'Hello there', 'en')
+        presynthesis.enqueue(self.user.id, 'Hello there', 'en')
+        presynthesis.enqueue(self.user.id, 'x' * 5000, 'en')
+        self.assertEqual(sorted(SynthesisJob.objects.values_list('speed', flat=True)), ['normal', 'slow'])
+
+    def test_claim_hands_each_job_to_one_caller_until_its_lease_expires(self):
+        presynthesis.enqueue(self.user.id, 'Hello there', 'en')
+        first = SynthesisJob.objects.claim(1, 300)
+        second = SynthesisJob.objects.claim(5, 300)
+        self.assertEqual((len(first), len(second)), (1, 1))
+        self.assertNotEqual(first[0].claim_token, second[0].claim_token)
+        self.assertEqual(SynthesisJob.objects.claim(5, 300), [])
+
+        SynthesisJob.objects.filter(pk=first[0].pk).update(run_after=first[0].run_after - datetime.timedelta(seconds=301))
+        reclaimed, = SynthesisJob.objects.claim(5, 300)
+        self.assertEqual(reclaimed.pk, first[0].pk)
+        self.assertEqual(reclaimed.attempts, 2)
+        self.assertNotEqual(reclaimed.claim_token, first[0].claim_token)
+
+    def test_failed_job_is_retried_then_kept_as_failed(self):
+        SynthesisJob.objects.enqueue(self.user.id, 'Hello there', 'en', ['normal'])
+        with mock.patch.object(views, 'call_google_tts_api', return_value=None):
+            job, succeeded = self.run_job()
+            self.assertFalse(succeeded)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.last_error), (SynthesisJob.PENDING, 'Every TTS provider failed'))
+            self.assertGreater(job.run_after, timezone.now() + datetime.timedelta(seconds=50))
+
+            SynthesisJob.objects.update(run_after=timezone.now())
+            with self.assertLogs('api.presynthesis', 'WARNING'):
+                job, succeeded = self.run_job()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (SynthesisJob.FAILED, 2))
+
+    def test_stale_worker_cannot_update_a_reclaimed_job(self):
+        SynthesisJob.objects.enqueue(self.user.id, 'Hello there', 'en', ['normal'])
+        job, = SynthesisJob.objects.claim(1, 300)
+        SynthesisJob.objects.update(claim_token='someone-else')
+        with mock.patch.object(views, 'call_google_tts_api', return_value=None):
+            presynthesis.process_job(job, presynthesis.get_presynthesis_settings())
+        self.assertEqual(SynthesisJob.objects.get().status, SynthesisJob.RUNNING)
+
+    def test_free_jobs_are_synthesized_without_metering(self):
+        SynthesisJob.objects.enqueue(self.user.id, 'Hello there', 'en', ['normal'])
+        with mock.patch.object(views, 'call_google_tts_api', return_value='YXVkaW8=') as google:
+            job, succeeded = self.run_job()
+        self.assertTrue(succeeded)
+        google.assert_called_once()
+        self.assertFalse(SynthesisJob.objects.exists())
+        self.assertEqual(usage.get_daily_usage(self.user.id), 0)
+
+    def test_paid_jobs_are_skipped_by_default(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(elevenlabs_api_key='paid-key', preferred_tts_service='elevenlabs')
+        SynthesisJob.objects.enqueue(self.user.id, 'Hello there', 'en', ['normal'])
+        with mock.patch.object(views, 'call_elevenlabs_api') as elevenlabs, \
+                mock.patch.object(views, 'call_google_tts_api') as google:
+            job, succeeded = self.run_job()
+        self.assertTrue(succeeded)
+        elevenlabs.assert_not_called()
+        google.assert_not_called()
+        self.assertFalse(SynthesisJob.objects.exists())
+
+    def test_paid_jobs_are_metered_when_enabled(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(elevenlabs_api_key='paid-key', preferred_tts_service='elevenlabs')
+        SynthesisJob.objects.enqueue(self.user.id, 'Hello there', 'en', ['slow', 'normal'])
+        with override_settings(PRESYNTHESIS={'PAID_PROVIDERS': True}), \
+                mock.patch.object(views, 'call_elevenlabs_api', return_value='YXVkaW8=') as elevenlabs:
+            usage.consume(self.user.id, 85)
+            self.run_job()
+            self.run_job()
+        elevenlabs.assert_called_once()
+        self.assertEqual(usage.get_daily_usage(self.user.id), 96)
+        self.assertFalse(SynthesisJob.objects.exists())
+
+
+class BatchTranslationTests(SimpleTestCase):
+    def setUp(self):
+        translation_cache.get_backend().clear()
+        circuit_breaker.get_backend().clear()
+
+    def test_chunks_respect_both_limits(self):
+        segments = ['aaaa', 'bb', 'cc', 'dddddddddd', 'e', 'f', 'g']
+        self.assertEqual(
+            list(batch_views.chunk_segments(segments, 3, 8)),
+            [['aaaa', 'bb', 'cc'], ['dddddddddd'], ['e', 'f', 'g']],
+        )
+
+    def test_free_google_chunks_are_limited_by_encoded_length(self):
+        size_of = batch_views.free_google_encoded_size
+        korean = ['안녕하세요' * 60] * 6  # 300 characters, 2700 once encoded
+        self.assertEqual([len(chunk) for chunk in batch_views.chunk_segments(korean, 1000, 6000, size_of)], [2, 2, 2])
+        self.assertEqual([len(chunk) for chunk in batch_views.chunk_segments(['hello'] * 6, 1000, 6000, size_of)], [6])
+
+    def test_groq_markers_are_parsed_in_any_order(self):
+        content = '[[2]] Zwei\n[[1]] Eins\nstill one\n[[4]] Vier\n[[9]] Neun\n[[3]]   '
+        self.assertEqual(
+            batch_views.parse_groq_batch_response(content, 4),
+            ['Eins\nstill one', 'Zwei', None, 'Vier'],
+        )
+
+    def test_duplicates_are_translated_once_and_order_is_kept(self):
+        calls = []
+        def translate_chunk(texts, target_language, source_language):
+            calls.append(texts)
+            return [text.upper() for text in texts]
+        with mock.patch.object(batch_views, 'handle_google_translation_batch', side_effect=translate_chunk):
+            response = self.client.post(
+                '/api/translate/batch/',
+                {'segments': ['hello  world', 'bye', '', ' hello world ', 'bye'], 'source_language': 'en'},
+                content_type='application/json',
+            )
+        data = response.json()
+        self.assertEqual(calls, [['hello world', 'bye']])
+        self.assertEqual((data['count'], data['unique']), (5, 2))
+        self.assertEqual([item['translation'] for item in data['translations']], ['HELLO WORLD', 'BYE', '', 'HELLO WORLD', 'BYE'])
+
+    @override_settings(TRANSLATION_BATCH={'MAX_SEGMENTS': 2, 'MAX_SEGMENT_CHARS': 5})
+    def test_invalid_segments_are_rejected(self):
+        for segments in [None, 'hello', [], ['a', 'b', 'c'], ['a', 1], ['toolong']]:
+            with self.subTest(segments=segments):
+                response = self.client.post('/api/translate/batch/', {'segments': segments}, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
@@ -0,0 +1,360 @@
+"""
+Shared cache of translation results.
+
+Results are stored in a Django cache backend (the ``translations`` alias
+when configured) so every worker process sees the same entries. Each entry
+records when it was stored: after TTL seconds it is stale and served while a
+single background refresh fetches a new value, and after STALE_TTL more
+seconds it expires entirely.
+
+Only one caller refreshes a stale entry. When the alias is Redis or
+Memcached the refresh lock is a cache add(), which is atomic there, so the
+refresh is single-flight across every worker; with other backends add() is
+not atomic and the lock is kept per process instead. Hit, stale and miss
+counts are recorded as metrics (api_cache_lookups_total) and nowhere else,
+so a hit costs one cache read.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+
+from . import metrics, shared_cache
+from .audio_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'translation'
+
+CACHE_HIT = 'hit'
+CACHE_STALE = 'stale'
+CACHE_MISS = 'miss'
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'translations',
+    'TTL': 7 * 24 * 3600,
+    'STALE_TTL': 24 * 3600,
+    'MAX_ENTRY_BYTES': 64 * 1024,
+    # Results fetched with a user's own API key are shared with other
+    # users of the same service unless this is enabled
+    'ISOLATE_API_KEY_RESULTS': False,
+    'REFRESH_WORKERS': 2,
+    'REFRESH_LOCK_SECONDS': 30,
+}
+
+# Keys deleted per Redis DEL when clearing
+CLEAR_BATCH_SIZE = 1000
+
+_refresh_executor = None
+_refresh_tasks = set()
+_refreshing_lock = threading.Lock()
+_refreshing = set()
+
+
+def get_cache_settings():
+    """Return TRANSLATION_CACHE merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'TRANSLATION_CACHE', {}))
+    return config
+
+
+def get_backend(config=None):
+    config = config or get_cache_settings()
+    try:
+        return caches[config['CACHE_ALIAS']]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+class ClearNotSupported(Exception):
+    pass
+
+
+def clear(config=None):
+    """Delete the cached translations and refresh locks, and nothing else
+
+    Redis's clear() is FLUSHDB, which ignores KEY_PREFIX and would also drop
+    the usage counters, breaker state and replica pins kept in the same
+    database, so on Redis only this module's keys are deleted. Memcached can
+    only be flushed as a whole and raises ClearNotSupported. Other backends
+    keep each alias in its own directory, table or memory and are cleared.
+    Raises InvalidCacheBackendError when the alias is not configured rather
+    than clearing the default cache. Returns the number of keys deleted, or
+    None when the whole alias was cleared.
+    """
+    config = config or get_cache_settings()
+    backend = caches[config['CACHE_ALIAS']]
+    if isinstance(backend, RedisCache):
+        client = backend._cache.get_client(write=True)
+        deleted = 0
+        batch = []
+        for key in client.scan_iter(match=backend.make_key(f"{KEY_PREFIX}:*"), count=CLEAR_BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= CLEAR_BATCH_SIZE:
+                deleted += client.delete(*batch)
+                batch = []
+        if batch:
+            deleted += client.delete(*batch)
+        return deleted
+    if isinstance(backend, BaseMemcachedCache):
+        raise ClearNotSupported(
+            f"The {config['CACHE_ALIAS']!r} cache is Memcached, which can only be flushed as a whole; "
+            "change TRANSLATION_CACHE['CACHE_ALIAS'] or the cache VERSION instead"
+        )
+    backend.clear()
+    return None
+
+
+def make_cache_key(text, source_language, target_language, service, api_key=None, config=None):
+    """Build the cache key for one translation request"""
+    config = config or get_cache_settings()
+    scope = 'shared'
+    if api_key and config['ISOLATE_API_KEY_RESULTS']:
+        scope = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+    parts = [
+        normalize_text(text),
+        (source_language or 'auto').lower(),
+        (target_language or '').lower(),
+        service,
+        scope,
+    ]
+    digest = hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+    return f"{KEY_PREFIX}:{service}:{digest}"
+
+
+def _count(name, delta=1):
+    metrics.inc('api_cache_lookups_total', ('translation', name), delta)
+
+
+def get_stats():
+    """Return hit/stale/miss counts since each worker process started, from the metrics files"""
+    stats = {CACHE_HIT: 0, CACHE_STALE: 0, CACHE_MISS: 0}
+    for snapshot in metrics.read_snapshots():
+        for name, labels, value in snapshot['counters']:
+            if name == 'api_cache_lookups_total' and labels[0] == 'translation' and labels[1] in stats:
+                stats[labels[1]] += value
+    lookups = sum(stats.values())
+    stats['hit_ratio'] = (stats[CACHE_HIT] + stats[CACHE_STALE]) / lookups if lookups else 0.0
+    return stats
+
+
+def _lock_key(key):
+    return f"{key}:refreshing"
+
+
+def _acquire_local(key):
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+        return True
+
+
+def _acquire_refresh(backend, key, config):
+    """Return True for the one caller that should refresh a stale entry"""
+    if shared_cache.is_atomic(backend):
+        return backend.add(_lock_key(key), 1, timeout=config['REFRESH_LOCK_SECONDS'])
+    return _acquire_local(key)
+
+
+async def _aacquire_refresh(backend, key, config):
+    if shared_cache.is_atomic(backend):
+        return await backend.aadd(_lock_key(key), 1, timeout=config['REFRESH_LOCK_SECONDS'])
+    return _acquire_local(key)
+
+
+def _release_local(keys):
+    with _refreshing_lock:
+        _refreshing.difference_update(keys)
+
+
+def _release_refresh(backend, keys):
+    if shared_cache.is_atomic(backend):
+        backend.delete_many([_lock_key(key) for key in keys])
+    else:
+        _release_local(keys)
+
+
+async def _arelease_refresh(backend, key):
+    if shared_cache.is_atomic(backend):
+        await backend.adelete(_lock_key(key))
+    else:
+        _release_local([key])
+
+
+def _store(backend, key, translation, config):
+    if len(translation.encode('utf-8')) > config['MAX_ENTRY_BYTES']:
+        return
+    entry = {'translation': translation, 'stored_at': time.time()}
+    backend.set(key, entry, timeout=config['TTL'] + config['STALE_TTL'])
+
+
+async def _astore(backend, key, translation, config):
+    if len(translation.encode('utf-8')) > config['MAX_ENTRY_BYTES']:
+        return
+    entry = {'translation': translation, 'stored_at': time.time()}
+    await backend.aset(key, entry, timeout=config['TTL'] + config['STALE_TTL'])
+
+
+def _get_refresh_executor(config):
+    global _refresh_executor
+    if _refresh_executor is None:
+        _refresh_executor = ThreadPoolExecutor(
+            max_workers=config['REFRESH_WORKERS'],
+            thread_name_prefix='translation-refresh',
+        )
+    return _refresh_executor
+
+
+def _refresh(backend, key, translate, config):
+    try:
+        translation = translate()
+        if translation:
+            _store(backend, key, translation, config)
+    except Exception:
+        logger.exception("Translation cache refresh failed")
+    finally:
+        _release_refresh(backend, [key])
+
+
+def get_or_translate(service, text, source_language, target_language, translate, api_key=None):
+    """Return (translation, cache_status) for one provider call
+
+    translate() is only called on a miss. Stale entries are returned
+    immediately and refreshed in the background by one worker at a time.
+    """
+    config = get_cache_settings()
+    if not config['ENABLED']:
+        return translate(), CACHE_MISS
+
+    backend = get_backend(config)
+    key = make_cache_key(text, source_language, target_language, service, api_key, config)
+
+    entry = backend.get(key)
+    if entry is not None:
+        age = time.time() - entry['stored_at']
+        if age < config['TTL']:
+            _count(CACHE_HIT)
+            return entry['translation'], CACHE_HIT
+
+        _count(CACHE_STALE)
+        if _acquire_refresh(backend, key, config):
+            _get_refresh_executor(config).submit(_refresh, backend, key, translate, config)
+        return entry['translation'], CACHE_STALE
+
+    _count(CACHE_MISS)
+    translation = translate()
+    if translation:
+        _store(backend, key, translation, config)
+    return translation, CACHE_MISS
+
+
+def _refresh_many(backend, keys, texts, translate_many, config):
+    try:
+        translations = translate_many(texts)
+        for key, translation in zip(keys, translations):
+            if translation:
+                _store(backend, key, translation, config)
+    except Exception:
+        logger.exception("Translation cache batch refresh failed")
+    finally:
+        _release_refresh(backend, keys)
+
+
+def get_many_or_translate(service, texts, source_language, target_language, translate_many, api_key=None):
+    """Batch get_or_translate over distinct texts
+
+    translate_many(list of texts) returns a list of translations in the same
+    order, with None for any it could not translate; it is called once with
+    every miss. Returns {text: (translation or None, cache_status)}.
+    """
+    config = get_cache_settings()
+    if not config['ENABLED']:
+        return {text: (translation, CACHE_MISS) for text, translation in zip(texts, translate_many(list(texts)))}
+
+    backend = get_backend(config)
+    keys = {text: make_cache_key(text, source_language, target_language, service, api_key, config) for text in texts}
+    entries = backend.get_many(list(keys.values()))
+
+    results = {}
+    misses = []
+    stale = []
+    now = time.time()
+    for text, key in keys.items():
+        entry = entries.get(key)
+        if entry is None:
+            misses.append(text)
+        elif now - entry['stored_at'] < config['TTL']:
+            results[text] = (entry['translation'], CACHE_HIT)
+        else:
+            results[text] = (entry['translation'], CACHE_STALE)
+            if _acquire_refresh(backend, key, config):
+                stale.append(text)
+
+    for status in (CACHE_HIT, CACHE_STALE):
+        count = sum(1 for _, cache_status in results.values() if cache_status == status)
+        if count:
+            _count(status, count)
+    if stale:
+        _get_refresh_executor(config).submit(
+            _refresh_many, backend, [keys[text] for text in stale], stale, translate_many, config
+        )
+
+    if misses:
+        _count(CACHE_MISS, len(misses))
+        for text, translation in zip(misses, translate_many(misses)):
+            if translation:
+                _store(backend, keys[text], translation, config)
+            results[text] = (translation, CACHE_MISS)
+    return results
+
+
+async def _arefresh(backend, key, translate, config):
+    try:
+        translation = await translate()
+        if translation:
+            await _astore(backend, key, translation, config)
+    except Exception:
+        logger.exception("Translation cache refresh failed")
+    finally:
+        await _arelease_refresh(backend, key)
+
+
+async def aget_or_translate(service, text, source_language, target_language, translate, api_key=None):
+    """Async get_or_translate; translate must be a coroutine function"""
+    config = get_cache_settings()
+    if not config['ENABLED']:
+        return await translate(), CACHE_MISS
+
+    backend = get_backend(config)
+    key = make_cache_key(text, source_language, target_language, service, api_key, config)
+
+    entry = await backend.aget(key)
+    if entry is not None:
+        age = time.time() - entry['stored_at']
+        if age < config['TTL']:
+            _count(CACHE_HIT)
+            return entry['translation'], CACHE_HIT
+
+        _count(CACHE_STALE)
+        if await _aacquire_refresh(backend, key, config):
+            # Keep a reference so the refresh task is not garbage collected
+            task = asyncio.create_task(_arefresh(backend, key, translate, config))
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+        return entry['translation'], CACHE_STALE
+
+    _count(CACHE_MISS)
+    translation = await translate()
+    if translation:
+        await _astore(backend, key, translation, config)
+    return translation, CACHE_MISS
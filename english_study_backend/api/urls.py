@@ -1,5 +1,14 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, batch_views, views
+
+# Under ASGI the main TTS/translate routes can be served by the async views
+if getattr(settings, 'ASYNC_PROVIDER_VIEWS', False):
+    text_to_speech_view = async_views.text_to_speech_async
+    translate_text_view = async_views.translate_text_async
+else:
+    text_to_speech_view = views.text_to_speech
+    translate_text_view = views.translate_text
 
 urlpatterns = [
     # Authentication endpoints
@@ -8,12 +17,18 @@ urlpatterns = [
     path('auth/profile/', views.user_profile, name='user_profile'),
     
     # TTS and Translation services
-    path('text-to-speech/', views.text_to_speech, name='text_to_speech'),
-    path('translate/', views.translate_text, name='translate_text'),
+    path('text-to-speech/', text_to_speech_view, name='text_to_speech'),
+    path('text-to-speech/stream/', views.text_to_speech_stream, name='text_to_speech_stream'),
+    path('text-to-speech/async/', async_views.text_to_speech_async, name='text_to_speech_async'),
+    path('translate/', translate_text_view, name='translate_text'),
+    path('translate/async/', async_views.translate_text_async, name='translate_text_async'),
+    path('translate/batch/', batch_views.translate_batch, name='translate_batch'),
+    path('providers/health/', views.provider_health, name='provider_health'),
     
     # Study History management
     path('study/history/', views.get_study_history, name='get_study_history'),
     path('study/save/', views.save_study_item, name='save_study_item'),
+    path('study/import/', views.import_study_history, name='import_study_history'),
     path('study/delete-all/', views.delete_all_study_history, name='delete_all_study_history'),
     path('study/delete-selected/', views.delete_study_history_items, name='delete_study_history_items'),
 ]
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""
+Write-behind character usage metering.
+
+TTS and translation requests from signed-in users are metered without
+touching the database on the request path:
+
+- the day's running total per user lives in a cache as a counter, so quota
+  checks are one incr; it is seeded from UserProfile on first use
+- the characters are also added to an in-process buffer, which a
+  background thread flushes every FLUSH_INTERVAL seconds as one UPDATE per
+  user and day, with F() expressions for the counters
+
+Daily rollover happens in that UPDATE: a row whose last_usage_date is older
+than the buffered day has its daily counter replaced rather than added to.
+
+When the ``usage`` cache alias is Redis or Memcached (see api.shared_cache)
+the counters are shared by every worker and the limit holds exactly.
+Otherwise each process keeps its own counters in a local-memory cache and
+re-reads them from the database every FLUSH_INTERVAL, so a user can
+overshoot the limit by what other workers metered since their last flush.
+
+Only upstream work is metered: views give the characters back with
+refund() when the result came from a cache or a local fallback.
+"""
+import atexit
+import datetime
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Case, F, Value, When
+
+from . import shared_cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'usage'
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'usage',
+    'FLUSH_INTERVAL': 30,
+    # Characters per user per day; None disables the quota
+    'DAILY_CHARACTER_LIMIT': None,
+    # Users whose counters are kept in the per-process cache used without a
+    # shared atomic one; least recently used entries are re-read when needed
+    'LOCAL_MAX_ENTRIES': 10000,
+}
+
+# Shared counters outlive the day they count
+SHARED_COUNTER_TIMEOUT = 2 * 24 * 3600
+
+_lock = threading.Lock()
+_pending = {}
+_flusher = None
+_local_backend = None
+
+
+def get_usage_settings():
+    """Return USAGE_METERING merged over the defaults"""
+    config = dict(DEFAULT_SETTINGS)
+    config.update(getattr(settings, 'USAGE_METERING', {}))
+    return config
+
+
+def get_backend(config=None):
+    """Return the shared counter cache, or this process's own when none is configured"""
+    global _local_backend
+    config = config or get_usage_settings()
+    backend = shared_cache.get_atomic_cache(config['CACHE_ALIAS'])
+    if backend is not None:
+        return backend
+    if _local_backend is None:
+        _local_backend = LocMemCache(KEY_PREFIX, {'OPTIONS': {'MAX_ENTRIES': config['LOCAL_MAX_ENTRIES']}})
+    return _local_backend
+
+
+def _counter_timeout(backend, config):
+    # Local counters expire after a flush interval so other workers' usage is picked up
+    return SHARED_COUNTER_TIMEOUT if shared_cache.is_atomic(backend) else config['FLUSH_INTERVAL']
+
+
+def _daily_key(user_id, day):
+    return f"{KEY_PREFIX}:{day.isoformat()}:{user_id}"
+
+
+def _pending_for(user_id, day=None):
+    with _lock:
+        return sum(count for (pending_user, pending_day), count in _pending.items()
+                   if pending_user == user_id and (day is None or pending_day == day))
+
+
+def _load_daily_usage(user_id, day, profile=None):
+    """Read the stored daily usage, used when the cache counter is missing"""
+    if profile is None:
+        from accounts.models import UserProfile
+        profile = UserProfile.objects.filter(user_id=user_id).only('daily_character_usage', 'last_usage_date').first()
+    stored = profile.daily_character_usage if profile and profile.last_usage_date == day else 0
+    return stored + _pending_for(user_id, day)
+
+
+def _add_daily(backend, user_id, day, characters, config):
+    key = _daily_key(user_id, day)
+    try:
+        return backend.incr(key, characters)
+    except ValueError:
+        # First use today, or the counter expired; add() keeps concurrent seeders safe
+        seeded = _load_daily_usage(user_id, day) + characters
+        if backend.add(key, seeded, timeout=_counter_timeout(backend, config)):
+            return seeded
+        return backend.incr(key, characters)
+
+
+def get_daily_usage(user_id, profile=None):
+    """Return today's characters for a user"""
+    day = datetime.date.today()
+    used = get_backend().get(_daily_key(user_id, day))
+    if used is not None:
+        return used
+    return _load_daily_usage(user_id, day, profile)
+
+
+def get_total_usage(profile):
+    """Return a profile's all-time characters including this process's unflushed counts"""
+    return profile.total_characters_used + _pending_for(profile.user_id)
+
+
+def consume(user_id, characters):
+    """Meter characters for a user; return False, recording nothing, if it would exceed the daily limit"""
+    config = get_usage_settings()
+    if not config['ENABLED'] or characters <= 0:
+        return True
+    day = datetime.date.today()
+    limit = config['DAILY_CHARACTER_LIMIT']
+    if limit is not None and characters > limit:
+        return False
+    backend = get_backend(config)
+    try:
+        used = _add_daily(backend, user_id, day, characters, config)
+    except DatabaseError as e:
+        # Seeding the counter failed; metering must not fail the request itself
+        logger.warning("Could not read usage for user %s: %s", user_id, e)
+        return True
+    if limit is not None and used > limit:
+        backend.decr(_daily_key(user_id, day), characters)
+        return False
+    with _lock:
+        _pending[(user_id, day)] = _pending.get((user_id, day), 0) + characters
+    _start_flusher(config)
+    return True
+
+
+def refund(user_id, characters):
+    """Give back characters consumed for a request that no upstream provider served"""
+    config = get_usage_settings()
+    if user_id is None or not config['ENABLED'] or characters <= 0:
+        return
+    day = datetime.date.today()
+    try:
+        get_backend(config).decr(_daily_key(user_id, day), characters)
+    except ValueError:
+        pass  # Expired; it is re-seeded from the database and the buffer below
+    with _lock:
+        _pending[(user_id, day)] = _pending.get((user_id, day), 0) - characters
+
+
+def _usage_update(day, characters):
+    """UPDATE arguments adding characters to a profile's counters for day"""
+    return {
+        'daily_character_usage': Case(
+            When(last_usage_date=day, then=F('daily_character_usage') + characters),
+            When(last_usage_date__lt=day, then=Value(characters)),
+            default=F('daily_character_usage'),
+        ),
+        'last_usage_date': Case(
+            When(last_usage_date__lt=day, then=Value(day)),
+            default=F('last_usage_date'),
+        ),
+        'total_characters_used': F('total_characters_used') + characters,
+    }
+
+
+def flush():
+    """Write buffered counts to UserProfile, one UPDATE per user and day; return the rows updated"""
+    from accounts.models import UserProfile
+
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+    updated = 0
+    for (user_id, day), characters in sorted(pending.items(), key=lambda item: item[0][1]):
+        try:
+            updated += UserProfile.objects.filter(user_id=user_id).update(**_usage_update(day, characters))
+        except DatabaseError as e:
+            logger.warning("Usage flush failed for user %s, keeping %s characters buffered: %s", user_id, characters, e)
+            with _lock:
+                _pending[(user_id, day)] = _pending.get((user_id, day), 0) + characters
+    return updated
+
+
+def _flush_forever(interval):
+    while True:
+        time.sleep(interval)
+        close_old_connections()
+        try:
+            flush()
+        except Exception as e:
+            logger.warning("Usage flush error: %s", e)
+        finally:
+            close_old_connections()
+
+
+def _start_flusher(config):
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(
+                target=_flush_forever, args=(config['FLUSH_INTERVAL'],),
+                name='usage-flush', daemon=True,
+            )
+            _flusher.start()
+            atexit.register(flush)
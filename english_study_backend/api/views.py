@@ -1,35 +1,74 @@
-from django.http import JsonResponse
+from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.db.models import Q
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.crypto import constant_time_compare
+from django.utils import timezone
 from accounts.models import UserProfile
+from .audio_cache import get_audio_cache, make_cache_key
+from .audio_stream import (
+    AUDIO_STREAM_CHUNK_SIZE, build_sized_audio_response, build_streamed_audio_response,
+    count_served_bytes, end_stream_on_error, iter_bytes_range, iter_file_range, tee_to_cache,
+)
+from . import auth, basic_translation, circuit_breaker, hedging, json_codec, language_detect, long_tts, metrics, presynthesis, provider_client, translation_cache, usage
+from .json_codec import JsonResponse
 import json
-import requests
 import base64
+import binascii
+import datetime
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+# Request bodies and provider responses; enable with the api.payloads logger at DEBUG
+payload_logger = logging.getLogger('api.payloads')
+
+# Default ElevenLabs voice (Rachel)
+ELEVENLABS_DEFAULT_VOICE_ID = "21m00Tcm4TlvDq8ikWAM"
+
+# Language code mapping for Google Cloud TTS
+GOOGLE_CLOUD_TTS_LANGUAGE_CODES = {
+    'ko': 'ko-KR',
+    'ja': 'ja-JP', 
+    'zh': 'zh-CN',
+    'es': 'es-ES',
+    'fr': 'fr-FR',
+    'de': 'de-DE',
+    'it': 'it-IT',
+    'pt': 'pt-PT',
+    'ru': 'ru-RU',
+    'ar': 'ar-XA',
+    'hi': 'hi-IN',
+    'th': 'th-TH',
+    'vi': 'vi-VN'
+}
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def user_login(request):
     try:
-        data = json.loads(request.body)
+        data = json_codec.parse_json_body(request)
         username = data.get('username')
         password = data.get('password')
         
         if not username or not password:
             return JsonResponse({'error': 'Username and password required'}, status=400)
         
-        print(f"Login attempt - Username: {username}")
+        logger.info("Login attempt - Username: %s", username)
         
         user = authenticate(username=username, password=password)
         if user:
             login(request, user)
-            print(f"Login successful for user: {username}")
+            logger.info("Login successful for user: %s", username)
             
             # Get or create user profile
             profile, created = UserProfile.objects.get_or_create(user=user)
             if created:
-                print(f"Created new profile for user: {username}")
+                logger.info("Created new profile for user: %s", username)
             
             return JsonResponse({
                 'success': True,
@@ -38,32 +77,34 @@ def user_login(request):
                     'username': user.username,
                     'email': user.email,
                 },
-                'token': f'token_{user.id}',  # Simple token for demo
+                'token': auth.issue_token(user),
                 'profile': {
                     'can_use_ai': profile.can_use_ai_services(),
                     'has_elevenlabs_key': bool(profile.elevenlabs_api_key),
                     'has_groq_key': bool(profile.groq_api_key),
                     'preferred_voice_speed': profile.preferred_voice_speed,
                     'preferred_tts_service': profile.preferred_tts_service,
-                    'daily_usage': profile.daily_character_usage,
-                    'total_usage': profile.total_characters_used,
+                    'daily_usage': usage.get_daily_usage(user.id, profile),
+                    'total_usage': usage.get_total_usage(profile),
                 }
             })
         else:
-            print(f"Login failed for user: {username}")
+            logger.warning("Login failed for user: %s", username)
             return JsonResponse({'error': 'Invalid credentials'}, status=401)
             
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
-    except Exception as e:
-        print(f"Login error: {e}")
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("Login error")
         return JsonResponse({'error': 'Login failed'}, status=500)
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def user_register(request):
     try:
-        data = json.loads(request.body)
+        data = json_codec.parse_json_body(request)
         username = data.get('username')
         email = data.get('email')
         password = data.get('password')
@@ -86,27 +127,28 @@ def user_register(request):
                 'username': user.username,
                 'email': user.email,
             },
-            'token': 'dummy_token',
+            'token': auth.issue_token(user),
             'message': 'User created successfully'
         })
         
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
-    except Exception as e:
-        print(f"Registration error: {e}")
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("Registration error")
         return JsonResponse({'error': 'Registration failed'}, status=500)
 
 @csrf_exempt
 @require_http_methods(["GET", "PUT"])
 def user_profile(request):
-    # Simple authentication check - in real app, use proper token authentication
-    user_id = request.headers.get('Authorization', '').replace('Token token_', '')
-    if not user_id.isdigit():
+    if request.token_user_id is None:
         return JsonResponse({'error': 'Authentication required'}, status=401)
     
     try:
-        user = User.objects.get(id=int(user_id))
-        profile, created = UserProfile.objects.get_or_create(user=user)
+        user, profile = get_request_profile(request)
+        if profile is None:
+            raise User.DoesNotExist
         
         if request.method == 'GET':
             return JsonResponse({
@@ -124,8 +166,8 @@ def user_profile(request):
                     'preferred_voice_speed': profile.preferred_voice_speed,
                     'preferred_tts_service': profile.preferred_tts_service,
                     'preferred_translation_service': profile.preferred_translation_service,
-                    'daily_usage': profile.daily_character_usage,
-                    'total_usage': profile.total_characters_used,
+                    'daily_usage': usage.get_daily_usage(user.id, profile),
+                    'total_usage': usage.get_total_usage(profile),
                     'elevenlabs_api_key': profile.elevenlabs_api_key or '',
                     'groq_api_key': profile.groq_api_key or '',
                     'google_translate_api_key': profile.google_translate_api_key or '',
@@ -135,24 +177,19 @@ def user_profile(request):
         
         elif request.method == 'PUT':
             # Update profile settings
-            data = json.loads(request.body)
+            data = json_codec.parse_json_body(request)
             
-            if 'elevenlabs_api_key' in data:
-                profile.elevenlabs_api_key = data['elevenlabs_api_key']
-            if 'groq_api_key' in data:
-                profile.groq_api_key = data['groq_api_key']
-            if 'google_translate_api_key' in data:
-                profile.google_translate_api_key = data['google_translate_api_key']
-            if 'google_tts_api_key' in data:
-                profile.google_tts_api_key = data['google_tts_api_key']
-            if 'preferred_tts_service' in data:
-                profile.preferred_tts_service = data['preferred_tts_service']
-            if 'preferred_voice_speed' in data:
-                profile.preferred_voice_speed = data['preferred_voice_speed']
-            if 'preferred_translation_service' in data:
-                profile.preferred_translation_service = data['preferred_translation_service']
-                
-            profile.save()
+            editable_fields = [
+                'elevenlabs_api_key', 'groq_api_key', 'google_translate_api_key', 'google_tts_api_key',
+                'preferred_tts_service', 'preferred_voice_speed', 'preferred_translation_service',
+            ]
+            changed_fields = [field for field in editable_fields if field in data]
+            for field in changed_fields:
+                setattr(profile, field, data[field])
+            
+            # Usage columns are left to the metering flush; a full save() would
+            # also bump last_usage_date (auto_now) and skip the daily rollover
+            profile.save(update_fields=changed_fields + ['updated_at'])
             
             return JsonResponse({
                 'success': True,
@@ -173,59 +210,125 @@ def user_profile(request):
         return JsonResponse({'error': 'User not found'}, status=404)
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
-    except Exception as e:
-        print(f"Profile error: {e}")
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("Profile error")
         return JsonResponse({'error': 'Profile operation failed'}, status=500)
 
+# Public history field name -> StudyHistory column, for the fields= parameter
+STUDY_HISTORY_FIELDS = {
+    'text': 'english_text',
+    'translation': 'korean_translation',
+    'target_language': 'target_language',
+    'source_language': 'source_language',
+    'tts_service': 'tts_service_used',
+    'voice_speed': 'voice_speed_used',
+    'accessed_count': 'accessed_count',
+}
+
+def get_history_page_size(request):
+    """Return the page size from ?limit=, clamped to STUDY_HISTORY['MAX_PAGE_SIZE']"""
+    config = getattr(settings, 'STUDY_HISTORY', {})
+    default = config.get('PAGE_SIZE', 50)
+    maximum = config.get('MAX_PAGE_SIZE', 200)
+    limit = request.GET.get('limit', '')
+    if not limit.isdigit() or int(limit) < 1:
+        return default
+    return min(int(limit), maximum)
+
+def encode_history_cursor(created_at, item_id):
+    """Encode the (created_at, id) keyset position after a page's last item"""
+    raw = f"{created_at.isoformat()}|{item_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_history_cursor(cursor):
+    """Return (created_at, id) from a cursor, or raise ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, item_id = raw.split('|')
+        return datetime.datetime.fromisoformat(created_at), int(item_id)
+    except (TypeError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_study_history(request):
-    # Simple authentication check
-    user_id = request.headers.get('Authorization', '').replace('Token token_', '')
-    if not user_id.isdigit():
+    """Return one page of the user's study history, newest first
+    
+    Query parameters: limit (page size), cursor (next_cursor from the
+    previous page) and fields (comma-separated subset of
+    STUDY_HISTORY_FIELDS). Responses carry an ETag; a matching
+    If-None-Match gets 304 Not Modified.
+    """
+    user_id = request.token_user_id
+    if user_id is None:
         return JsonResponse({'error': 'Authentication required'}, status=401)
     
     try:
         from accounts.models import StudyHistory
-        user = User.objects.get(id=int(user_id))
         
-        # Get user's study history from DB
-        history_items = StudyHistory.objects.filter(user=user).order_by('-created_at')[:50]
+        requested = request.GET.get('fields')
+        if requested:
+            fields = [name.strip() for name in requested.split(',') if name.strip()]
+            unknown = [name for name in fields if name not in STUDY_HISTORY_FIELDS]
+            if unknown:
+                return JsonResponse({'error': f"Unknown fields: {', '.join(unknown)}"}, status=400)
+        else:
+            fields = list(STUDY_HISTORY_FIELDS)
+        
+        limit = get_history_page_size(request)
+        history_items = StudyHistory.objects.filter(user_id=user_id).order_by('-created_at', '-id')
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = decode_history_cursor(cursor)
+            except ValueError:
+                return JsonResponse({'error': 'Invalid cursor'}, status=400)
+            history_items = history_items.filter(
+                Q(created_at__lt=cursor_created_at) | Q(created_at=cursor_created_at, id__lt=cursor_id)
+            )
+        
+        # Only the requested columns are read; one extra row tells us if there is a next page
+        columns = ['id', 'created_at'] + [STUDY_HISTORY_FIELDS[name] for name in fields]
+        rows = list(history_items.values(*columns)[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
         history_data = []
-        for item in history_items:
-            history_data.append({
-                'id': int(item.created_at.timestamp() * 1000),  # Convert to JS timestamp
-                'text': item.english_text,
-                'translation': item.korean_translation,
-                'target_language': item.target_language,
-                'source_language': getattr(item, 'source_language', 'auto'),  # Safe access for backward compatibility
-                'date': item.created_at.strftime('%m/%d/%Y, %I:%M:%S %p'),
-                'tts_service': item.tts_service_used,
-                'voice_speed': item.voice_speed_used,
-                'accessed_count': item.accessed_count
-            })
+        for row in rows:
+            item = {
+                'id': row['id'],
+                'created_at': row['created_at'].isoformat(),
+            }
+            for name in fields:
+                item[name] = row[STUDY_HISTORY_FIELDS[name]]
+            history_data.append(item)
         
-        print(f"Loading {len(history_data)} study history items for user {user.username}")
+        logger.info("Loading %s study history items for user %s", len(history_data), user_id)
         
-        return JsonResponse({
+        response = JsonResponse({
             'success': True,
-            'history': history_data
+            'history': history_data,
+            'has_more': has_more,
+            'next_cursor': encode_history_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_more else None
         })
-        
-    except User.DoesNotExist:
-        return JsonResponse({'error': 'User not found'}, status=404)
-    except Exception as e:
-        print(f"Study history error: {e}")
+        # Clients must revalidate, but an unchanged page costs no body
+        response['Cache-Control'] = 'private, no-cache'
+        etag = quote_etag(hashlib.md5(response.content, usedforsecurity=False).hexdigest())
+        response['ETag'] = etag
+        return get_conditional_response(request, etag=etag, response=response)
+        
+    except Exception:
+        logger.exception("Study history error")
         return JsonResponse({'error': 'Failed to load study history'}, status=500)
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def save_study_item(request):
     try:
-        print(f"Save study item request body: {request.body}")
-        data = json.loads(request.body)
-        print(f"Parsed data: {data}")
+        payload_logger.debug("Save study item request body: %s", request.body)
+        data = json_codec.parse_json_body(request)
         text = data.get('text', '')
         translation = data.get('translation', '')
         target_language = data.get('target_language', 'ko')
@@ -234,64 +337,45 @@ def save_study_item(request):
         voice_speed = data.get('voice_speed', 'normal')
         
         if not text:
-            print(f"Error: Text is empty - received: '{text}'")
+            logger.info("Save study item rejected: text is empty")
             return JsonResponse({'error': 'Text is required'}, status=400)
         
         # Check if user is authenticated
-        user_id = request.headers.get('Authorization', '').replace('Token token_', '')
-        if user_id.isdigit():
+        if request.token_user_id is not None:
             try:
                 from accounts.models import StudyHistory
-                user = User.objects.get(id=int(user_id))
+                user, profile = get_request_profile(request)
+                if user is None:
+                    raise User.DoesNotExist
                 
-                # Check if this text already exists for this user
-                existing_item = StudyHistory.objects.filter(
-                    user=user, 
-                    english_text=text
-                ).first()
+                # One atomic upsert keyed on (user, text_hash)
+                item_id, created_at, created = StudyHistory.objects.upsert(
+                    user, text,
+                    korean_translation=translation,
+                    target_language=target_language,
+                    source_language=source_language,
+                    tts_service_used=tts_service,
+                    voice_speed_used=voice_speed
+                )
                 
-                if existing_item:
-                    # Update existing item
-                    existing_item.korean_translation = translation
-                    existing_item.target_language = target_language
-                    existing_item.source_language = source_language
-                    existing_item.tts_service_used = tts_service
-                    existing_item.voice_speed_used = voice_speed
-                    existing_item.accessed_count += 1
-                    existing_item.save()
-                    
-                    print(f"Updated existing study item for user {user.username}: {text[:50]}...")
-                    
-                    return JsonResponse({
-                        'success': True,
-                        'message': 'Study item updated in database',
-                        'item_id': int(existing_item.created_at.timestamp() * 1000)
-                    })
+                if created:
+                    logger.info("Saved new study item %s for user %s", item_id, user.id)
+                    # Replays from history at any speed are then served from the audio cache
+                    presynthesis.enqueue(user.id, text, source_language)
                 else:
-                    # Create new item
-                    study_item = StudyHistory.objects.create(
-                        user=user,
-                        english_text=text,
-                        korean_translation=translation,
-                        target_language=target_language,
-                        source_language=source_language,
-                        tts_service_used=tts_service,
-                        voice_speed_used=voice_speed
-                    )
-                    
-                    print(f"Saved new study item for user {user.username}: {text[:50]}...")
-                    
-                    return JsonResponse({
-                        'success': True,
-                        'message': 'Study item saved to database',
-                        'item_id': int(study_item.created_at.timestamp() * 1000)
-                    })
+                    logger.info("Updated existing study item %s for user %s", item_id, user.id)
+                
+                return JsonResponse({
+                    'success': True,
+                    'message': 'Study item saved to database' if created else 'Study item updated in database',
+                    'item_id': item_id
+                })
                     
             except User.DoesNotExist:
                 pass
         
         # Guest user - return success but let frontend handle localStorage
-        print(f"Guest user study save request: {text[:50]}...")
+        logger.info("Guest user study save request")
         return JsonResponse({
             'success': True,
             'message': 'Use localStorage for guest users',
@@ -300,40 +384,124 @@ def save_study_item(request):
         
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
-    except Exception as e:
-        print(f"Save study item error: {e}")
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("Save study item error")
         return JsonResponse({'error': 'Failed to save study item'}, status=500)
 
+# Guest timestamps before this are not real saves
+IMPORT_EARLIEST = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+def parse_import_timestamp(item, now):
+    """Return when a guest item was saved, or None if it carries no plausible time
+    
+    Uses created_at (ISO 8601 with a UTC offset) when present, else id, which
+    the frontend sets to Date.now() milliseconds.
+    """
+    value = item.get('created_at')
+    created_at = None
+    try:
+        if isinstance(value, str):
+            created_at = datetime.datetime.fromisoformat(value)
+        elif isinstance(item.get('id'), (int, float)) and not isinstance(item['id'], bool):
+            created_at = datetime.datetime.fromtimestamp(item['id'] / 1000, datetime.timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        return None
+    if created_at is None or created_at.tzinfo is None or not IMPORT_EARLIEST <= created_at <= now:
+        return None
+    return created_at
+
+def parse_import_item(item, now=None):
+    """Return StudyHistory fields for one guest history item, or None if it has no text"""
+    if not isinstance(item, dict) or not isinstance(item.get('text'), str) or not item['text'].strip():
+        return None
+    translation = item.get('translation')
+    fields = {'english_text': item['text'], 'korean_translation': translation if isinstance(translation, str) else ''}
+    for field, key, default, max_length in (
+        ('target_language', 'target_language', 'ko', 10),
+        ('source_language', 'source_language', 'auto', 10),
+        ('tts_service_used', 'tts_service', '', 20),
+        ('voice_speed_used', 'voice_speed', '', 10),
+    ):
+        value = item.get(key)
+        fields[field] = value if isinstance(value, str) and len(value) <= max_length else default
+    created_at = parse_import_timestamp(item, now or timezone.now())
+    if created_at is not None:
+        fields['created_at'] = created_at
+    return fields
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def import_study_history(request):
+    """Merge a guest's local history into the authenticated user's study history"""
+    try:
+        if request.token_user_id is None:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        
+        # Whole guest histories are larger than other request bodies
+        data = json_codec.parse_json_body(request, max_bytes=settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+        items = data.get('items')
+        config = getattr(settings, 'STUDY_HISTORY', {})
+        max_items = config.get('IMPORT_MAX_ITEMS', 10000)
+        
+        if not isinstance(items, list):
+            return JsonResponse({'error': 'items must be a list'}, status=400)
+        if len(items) > max_items:
+            return JsonResponse({'error': f'At most {max_items} items per import'}, status=400)
+        
+        from accounts.models import StudyHistory
+        
+        now = timezone.now()
+        fields = [parsed for parsed in (parse_import_item(item, now) for item in items) if parsed is not None]
+        inserted, merged, repeated = StudyHistory.objects.import_items(
+            request.token_user_id, fields, batch_size=config.get('IMPORT_BATCH_SIZE', 500)
+        )
+        skipped = len(items) - len(fields)
+        
+        logger.info("Imported study history for user %s: %s inserted, %s merged, %s repeated, %s skipped",
+                    request.token_user_id, inserted, merged, repeated, skipped)
+        
+        return JsonResponse({
+            'success': True,
+            'inserted': inserted,
+            'merged': merged,
+            'repeated': repeated,
+            'skipped': skipped
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("Import study history error")
+        return JsonResponse({'error': 'Failed to import study history'}, status=500)
+
 @csrf_exempt
 @require_http_methods(["DELETE"])
 def delete_all_study_history(request):
     """Delete all study history for the authenticated user"""
     try:
         # Check if user is authenticated
-        user_id = request.headers.get('Authorization', '').replace('Token token_', '')
-        if not user_id.isdigit():
+        if request.token_user_id is None:
             return JsonResponse({'error': 'Authentication required'}, status=401)
         
-        try:
-            from accounts.models import StudyHistory
-            user = User.objects.get(id=int(user_id))
-            
-            # Delete all study history for this user
-            deleted_count, _ = StudyHistory.objects.filter(user=user).delete()
-            
-            print(f"Deleted {deleted_count} study history items for user {user.username}")
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'Deleted {deleted_count} study records',
-                'deleted_count': deleted_count
-            })
-            
-        except User.DoesNotExist:
-            return JsonResponse({'error': 'User not found'}, status=404)
+        from accounts.models import StudyHistory
+        
+        # Delete all study history for this user
+        deleted_count, _ = StudyHistory.objects.filter(user_id=request.token_user_id).delete()
+        
+        logger.info("Deleted %s study history items for user %s", deleted_count, request.token_user_id)
+        
+        return JsonResponse({
+            'success': True,
+            'message': f'Deleted {deleted_count} study records',
+            'deleted_count': deleted_count
+        })
             
-    except Exception as e:
-        print(f"Delete study history error: {e}")
+    except Exception:
+        logger.exception("Delete study history error")
         return JsonResponse({'error': 'Failed to delete study history'}, status=500)
 
 @csrf_exempt
@@ -342,756 +510,1005 @@ def delete_study_history_items(request):
     """Delete specific study history items by ID for the authenticated user"""
     try:
         # Check if user is authenticated
-        user_id = request.headers.get('Authorization', '').replace('Token token_', '')
-        if not user_id.isdigit():
+        if request.token_user_id is None:
             return JsonResponse({'error': 'Authentication required'}, status=401)
         
-        try:
-            data = json.loads(request.body)
-            item_ids = data.get('item_ids', [])
-            
-            if not item_ids:
-                return JsonResponse({'error': 'No item IDs provided'}, status=400)
-            
-            from accounts.models import StudyHistory
-            user = User.objects.get(id=int(user_id))
-            
-            # Convert timestamp IDs back to datetime for querying
-            import datetime
-            deleted_count = 0
-            for item_id in item_ids:
-                try:
-                    # Convert JS timestamp (milliseconds) to datetime
-                    timestamp = datetime.datetime.fromtimestamp(int(item_id) / 1000)
-                    # Find item by user and approximate timestamp (within 1 second)
-                    items = StudyHistory.objects.filter(
-                        user=user,
-                        created_at__range=[
-                            timestamp - datetime.timedelta(seconds=1),
-                            timestamp + datetime.timedelta(seconds=1)
-                        ]
-                    )
-                    deleted_count += items.count()
-                    items.delete()
-                except (ValueError, StudyHistory.DoesNotExist):
-                    continue
-            
-            print(f"Deleted {deleted_count} selected study history items for user {user.username}")
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'Deleted {deleted_count} selected study records',
-                'deleted_count': deleted_count
-            })
-            
-        except User.DoesNotExist:
-            return JsonResponse({'error': 'User not found'}, status=404)
+        data = json_codec.parse_json_body(request)
+        item_ids = data.get('item_ids', [])
+        
+        if not item_ids or not isinstance(item_ids, list):
+            return JsonResponse({'error': 'No item IDs provided'}, status=400)
+        
+        from accounts.models import StudyHistory
+        
+        # Primary keys, or JS timestamp ids from clients loaded before the switch
+        deleted_count = StudyHistory.objects.delete_selected(request.token_user_id, item_ids)
+        
+        logger.info("Deleted %s selected study history items for user %s", deleted_count, request.token_user_id)
+        
+        return JsonResponse({
+            'success': True,
+            'message': f'Deleted {deleted_count} selected study records',
+            'deleted_count': deleted_count
+        })
             
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
-    except Exception as e:
-        print(f"Delete selected study history error: {e}")
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("Delete selected study history error")
         return JsonResponse({'error': 'Failed to delete selected study history'}, status=500)
 
+def synthesize_with_cache(service, text, language, speed, voice, synthesize):
+    """Return (base64 audio, cache_hit), calling synthesize() only on a cache miss"""
+    audio_cache = get_audio_cache()
+    cache_key = make_cache_key(text, language, speed, service, voice)
+    
+    audio_bytes = audio_cache.get(cache_key)
+    if audio_bytes is not None:
+        logger.info("TTS cache hit - Service: %s, Language: %s, Speed: %s", service, language, speed)
+        metrics.inc('api_cache_lookups_total', ('audio', 'hit'))
+        return base64.b64encode(audio_bytes).decode('utf-8'), True
+    
+    metrics.inc('api_cache_lookups_total', ('audio', 'miss'))
+    audio_data = synthesize()
+    if audio_data:
+        audio_cache.set(cache_key, base64.b64decode(audio_data))
+    return audio_data, False
+
+def base64_decoded_size(data):
+    """Return the number of bytes a base64 string decodes to"""
+    return len(data) * 3 // 4 - data[-2:].count('=')
+
+def get_request_profile(request):
+    """Return (user, profile) for the request's token, or (None, None) for guests"""
+    return auth.get_request_profile(request)
+
+def get_tts_provider_chain(text, speed, service, source_language, profile=None):
+    """Return the TTS providers to try, in fallback order
+    
+    Each entry describes one provider: the cache key parts it produces audio
+    for, a synthesize() callable returning base64 audio and a stream()
+    callable returning (chunk iterator, content length) or None.
+    """
+    if profile is None:
+        # Guest user - Google TTS via proxy only
+        return apply_long_text_mode([{
+            'service': 'google',
+            'provider': provider_client.GOOGLE_TTS,
+            'label': 'Guest Google TTS',
+            'api_key': None,
+            'language': 'en',
+            'voice': '',
+            'synthesize': lambda: call_google_tts_api(text, speed),
+            'stream': lambda: stream_google_tts_api(text, speed),
+            'message': 'Using Google TTS for guest user',
+        }], text, speed)
+    
+    # Determine the actual service to use
+    actual_service = service
+    if service == 'auto':
+        actual_service = profile.preferred_tts_service or 'auto'
+        logger.info("Auto mode - using preferred TTS service: %s", actual_service)
+    
+    chain = []
+    
+    # Use ElevenLabs API if available and requested
+    if profile.elevenlabs_api_key and (actual_service == 'elevenlabs' or (actual_service == 'auto' and profile.elevenlabs_api_key)):
+        chain.append({
+            'service': 'elevenlabs',
+            'provider': provider_client.ELEVENLABS,
+            'api_key': profile.elevenlabs_api_key,
+            'label': 'ElevenLabs API',
+            'language': source_language,
+            'voice': ELEVENLABS_DEFAULT_VOICE_ID,
+            'synthesize': lambda: call_elevenlabs_api(text, profile.elevenlabs_api_key, speed),
+            'stream': lambda: stream_elevenlabs_api(text, profile.elevenlabs_api_key, speed),
+            'message': 'ElevenLabs TTS generated successfully',
+        })
+    
+    # Use Google Cloud TTS API if available and requested
+    if profile.google_tts_api_key and (actual_service == 'google_cloud' or (actual_service == 'auto' and profile.google_tts_api_key and not profile.elevenlabs_api_key)):
+        chain.append({
+            'service': 'google_cloud',
+            'provider': provider_client.GOOGLE_CLOUD_TTS,
+            'api_key': profile.google_tts_api_key,
+            'label': 'Google Cloud TTS API',
+            'language': source_language,
+            'voice': get_google_cloud_voice(source_language)[1],
+            'synthesize': lambda: call_google_cloud_tts_api(text, profile.google_tts_api_key, speed, source_language),
+            'stream': lambda: stream_google_cloud_tts_api(text, profile.google_tts_api_key, speed, source_language),
+            'message': 'Google Cloud TTS generated successfully',
+        })
+    
+    # Use Groq API if available and requested (placeholder - not implemented yet)
+    if profile.groq_api_key and (actual_service == 'groq'):
+        chain.append({
+            'service': 'groq',
+            'provider': provider_client.GROQ,
+            'api_key': profile.groq_api_key,
+            'label': 'Groq API',
+            'language': source_language,
+            'voice': '',
+            'synthesize': lambda: call_groq_tts_api(text, profile.groq_api_key, speed),
+            'stream': lambda: None,
+            'message': 'Groq TTS generated successfully',
+        })
+    
+    # Fallback to Google TTS via Django proxy (to avoid CORS)
+    chain.append({
+        'service': 'google',
+        'provider': provider_client.GOOGLE_TTS,
+        'label': 'Google TTS proxy',
+        'api_key': None,
+        'language': source_language,
+        'voice': '',
+        'synthesize': lambda: call_google_tts_api(text, speed, source_language),
+        'stream': lambda: stream_google_tts_api(text, speed, source_language),
+        'message': f'Using Google TTS via proxy (User has: ElevenLabs={bool(profile.elevenlabs_api_key)}, Groq={bool(profile.groq_api_key)})',
+    })
+    
+    return apply_long_text_mode(chain, text, speed)
+
+def get_chunk_synthesizer(provider, speed):
+    """Return synthesize(chunk) -> base64 audio for a TTS chain entry, caching each chunk"""
+    service = provider['service']
+    api_key = provider['api_key']
+    language = provider['language']
+    if service == 'elevenlabs':
+        call = lambda chunk: call_elevenlabs_api(chunk, api_key, speed)
+    elif service == 'google_cloud':
+        call = lambda chunk: call_google_cloud_tts_api(chunk, api_key, speed, language)
+    elif service == 'google':
+        call = lambda chunk: call_google_tts_api(chunk, speed, language)
+    else:
+        return None
+    
+    def synthesize(chunk):
+        audio_data, cached = synthesize_with_cache(service, chunk, language, speed, provider['voice'], lambda: call(chunk))
+        return audio_data
+    return synthesize
+
+def apply_long_text_mode(chain, text, speed):
+    """Switch chain entries to chunked synthesis when text exceeds the provider's limit"""
+    for provider in chain:
+        max_chars = long_tts.get_chunk_limit(provider['service'])
+        if not max_chars or len(text) <= max_chars:
+            continue
+        synthesize_chunk = get_chunk_synthesizer(provider, speed)
+        if synthesize_chunk is None:
+            continue
+        provider['chunked'] = True
+        provider['synthesize'] = lambda max_chars=max_chars, synthesize_chunk=synthesize_chunk: long_tts.synthesize_long(text, max_chars, synthesize_chunk)
+        provider['stream'] = lambda max_chars=max_chars, synthesize_chunk=synthesize_chunk: long_tts.stream_long(text, max_chars, synthesize_chunk)
+    return chain
+
+def skip_open_circuits(chain):
+    """Drop chain entries whose provider (or API key) circuit breaker is open"""
+    allowed = []
+    for provider in chain:
+        if circuit_breaker.allow_request(provider['provider'], provider['api_key']):
+            allowed.append(provider)
+        else:
+            logger.info("Skipping %s - circuit breaker open", provider['label'])
+    return allowed
+
+def make_tts_attempt(provider, text, speed):
+    """Wrap a TTS chain entry as a hedging attempt returning (audio, cached) or None"""
+    def attempt():
+        audio_data, cached = synthesize_with_cache(
+            provider['service'], text, provider['language'], speed, provider['voice'],
+            provider['synthesize']
+        )
+        return (audio_data, cached) if audio_data else None
+    return attempt
+
+def parse_tts_request(request):
+    """Read TTS parameters from a JSON body (POST) or the query string (GET)"""
+    if request.method == 'GET':
+        data = request.GET
+    else:
+        data = json_codec.parse_json_body(request)
+    text = data.get('text', '')
+    speed = data.get('speed', 'normal')
+    service = data.get('service', 'google')
+    source_language = data.get('source_language', 'auto')  # Get source language for TTS
+    return text, speed, service, source_language
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def text_to_speech(request):
     try:
-        data = json.loads(request.body)
-        text = data.get('text', '')
-        speed = data.get('speed', 'normal')
-        service = data.get('service', 'google')
-        source_language = data.get('source_language', 'auto')  # Get source language for TTS
+        text, speed, service, source_language = parse_tts_request(request)
         
         if not text:
             return JsonResponse({'error': 'Text is required'}, status=400)
         
+        if request.token_user_id is not None and not usage.consume(request.token_user_id, len(text)):
+            return JsonResponse({'error': 'Daily character limit reached'}, status=429)
+        
         # Auto-detect language for TTS if not specified
         if source_language == 'auto':
-            detected_lang = detect_text_language(text)
-            source_language = detected_lang or 'en'  # Default to English if detection fails
+            source_language = detect_source_language(text)
         
-        print(f"TTS Request - Text: '{text}', Language: {source_language}, Service: {service}, Speed: {speed}")
+        logger.info("TTS Request - Characters: %s, Language: %s, Service: %s, Speed: %s", len(text), source_language, service, speed)
+        payload_logger.debug("TTS request text: %r", text)
         
         # Check if user is authenticated and has API keys
-        user_id = request.headers.get('Authorization', '').replace('Token token_', '')
-        if user_id.isdigit():
-            try:
-                user = User.objects.get(id=int(user_id))
-                profile, created = UserProfile.objects.get_or_create(user=user)
-                
-                print(f"User: {user.username}, Has ElevenLabs: {bool(profile.elevenlabs_api_key)}")
-                print(f"User preferred TTS service: {profile.preferred_tts_service}, Requested service: {service}")
-                
-                # Determine the actual service to use
-                actual_service = service
-                if service == 'auto':
-                    actual_service = profile.preferred_tts_service or 'auto'
-                    print(f"Auto mode - using preferred TTS service: {actual_service}")
-                
-                # Use ElevenLabs API if available and requested
-                if profile.elevenlabs_api_key and (actual_service == 'elevenlabs' or (actual_service == 'auto' and profile.elevenlabs_api_key)):
-                    try:
-                        audio_data = call_elevenlabs_api(text, profile.elevenlabs_api_key, speed)
-                        if audio_data:
-                            return JsonResponse({
-                                'success': True,
-                                'service': 'elevenlabs',
-                                'audio_data': audio_data,
-                                'message': 'ElevenLabs TTS generated successfully'
-                            })
-                    except Exception as e:
-                        print(f"ElevenLabs API error: {e}")
-                        # Continue to try next service
-                
-                # Use Google Cloud TTS API if available and requested
-                if profile.google_tts_api_key and (actual_service == 'google_cloud' or (actual_service == 'auto' and profile.google_tts_api_key and not profile.elevenlabs_api_key)):
-                    try:
-                        audio_data = call_google_cloud_tts_api(text, profile.google_tts_api_key, speed, source_language)
-                        if audio_data:
-                            return JsonResponse({
-                                'success': True,
-                                'service': 'google_cloud',
-                                'audio_data': audio_data,
-                                'message': 'Google Cloud TTS generated successfully'
-                            })
-                    except Exception as e:
-                        print(f"Google Cloud TTS API error: {e}")
-                        # Continue to try next service
-                
-                # Use Groq API if available and requested (placeholder - not implemented yet)
-                if profile.groq_api_key and (actual_service == 'groq'):
-                    try:
-                        audio_data = call_groq_tts_api(text, profile.groq_api_key, speed)
-                        if audio_data:
-                            return JsonResponse({
-                                'success': True,
-                                'service': 'groq',
-                                'audio_data': audio_data,
-                                'message': 'Groq TTS generated successfully'
-                            })
-                    except Exception as e:
-                        print(f"Groq API error: {e}")
-                        # Continue to try next service
-                
-                # Fallback to Google TTS via Django proxy (to avoid CORS)
-                try:
-                    audio_data = call_google_tts_api(text, speed, source_language)
-                    if audio_data:
-                        return JsonResponse({
-                            'success': True,
-                            'service': 'google',
-                            'audio_data': audio_data,
-                            'message': f'Using Google TTS via proxy (User has: ElevenLabs={bool(profile.elevenlabs_api_key)}, Groq={bool(profile.groq_api_key)})'
-                        })
-                except Exception as e:
-                    print(f"Google TTS proxy error: {e}")
-                
-                # Final fallback - return URL for browser TTS
-                return JsonResponse({
-                    'success': True,
-                    'service': 'browser',
-                    'use_browser_tts': True,
-                    'message': 'Use browser TTS fallback'
-                })
-                
-            except User.DoesNotExist:
-                pass
+        user, profile = get_request_profile(request)
+        if profile:
+            logger.info("User: %s, Has ElevenLabs: %s", user.username, bool(profile.elevenlabs_api_key))
+            logger.info("User preferred TTS service: %s, Requested service: %s", profile.preferred_tts_service, service)
+        
+        chain = skip_open_circuits(get_tts_provider_chain(text, speed, service, source_language, profile))
+        hedging_settings = hedging.get_hedging_settings()
+        index, result = hedging.run_hedged(
+            [(provider['label'], make_tts_attempt(provider, text, speed)) for provider in chain],
+            hedge_delay=hedging.get_hedge_delay(hedging_settings),
+            no_hedge=hedging.paid_attempts(chain),
+            deadline=hedging_settings['TTS_DEADLINE']
+        )
+        if result:
+            provider = chain[index]
+            audio_data, cached = result
+            if cached:
+                # Served from the audio cache: no upstream work to charge for
+                usage.refund(request.token_user_id, len(text))
+            metrics.inc('api_fallback_depth_total', ('tts', index, provider['service']))
+            metrics.inc('api_audio_bytes_served_total', (provider['service'],), base64_decoded_size(audio_data))
+            return JsonResponse({
+                'success': True,
+                'service': provider['service'],
+                'audio_data': audio_data,
+                'cached': cached,
+                'message': provider['message']
+            })
         
-        # Guest user - try Google TTS via proxy
-        try:
-            audio_data = call_google_tts_api(text, speed)
-            if audio_data:
-                return JsonResponse({
-                    'success': True,
-                    'service': 'google',
-                    'audio_data': audio_data,
-                    'message': 'Using Google TTS for guest user'
-                })
-        except Exception as e:
-            print(f"Guest Google TTS error: {e}")
+        # Final fallback - browser TTS; no provider was used, so nothing is charged
+        usage.refund(request.token_user_id, len(text))
+        metrics.inc('api_fallback_depth_total', ('tts', len(chain), 'browser'))
+        return JsonResponse({
+            'success': True,
+            'service': 'browser',
+            'use_browser_tts': True,
+            'message': 'Use browser TTS fallback' if profile else 'Use browser TTS for guest'
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("TTS error")
+        return JsonResponse({'error': 'TTS failed'}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def text_to_speech_stream(request):
+    """Stream TTS audio as audio/mpeg bytes instead of base64 inside JSON
+    
+    Cached clips are served with HTTP Range support. On a cache miss the
+    provider's response is passed through chunk by chunk and written to the
+    cache as it goes. When every provider fails a JSON browser-TTS fallback
+    is returned, exactly like text_to_speech.
+    """
+    try:
+        text, speed, service, source_language = parse_tts_request(request)
         
-        # Final fallback for guests - browser TTS
+        if not text:
+            return JsonResponse({'error': 'Text is required'}, status=400)
+        
+        if source_language == 'auto':
+            source_language = detect_source_language(text)
+        
+        logger.info("TTS stream request - Language: %s, Service: %s, Speed: %s", source_language, service, speed)
+        
+        user, profile = get_request_profile(request)
+        audio_cache = get_audio_cache()
+        range_header = request.headers.get('Range')
+        
+        chain = skip_open_circuits(get_tts_provider_chain(text, speed, service, source_language, profile))
+        # Cached clips (and every Range request for them) are not charged; the
+        # characters are metered when the first provider is actually called
+        charged = False
+        for depth, provider in enumerate(chain):
+            cache_key = make_cache_key(text, provider['language'], speed, provider['service'], provider['voice'])
+            headers = {'X-TTS-Service': provider['service']}
+            
+            audio_bytes, audio_path = audio_cache.open(cache_key)
+            if audio_bytes is not None:
+                headers['X-TTS-Cache'] = 'hit'
+                metrics.inc('api_cache_lookups_total', ('audio', 'hit'))
+                metrics.inc('api_fallback_depth_total', ('tts_stream', depth, provider['service']))
+                return build_sized_audio_response(
+                    len(audio_bytes),
+                    lambda start, end: count_served_bytes(iter_bytes_range(audio_bytes, start, end), provider['service']),
+                    range_header, headers
+                )
+            if audio_path is not None:
+                try:
+                    size = audio_path.stat().st_size
+                except FileNotFoundError:
+                    size = None  # Evicted between lookup and stat
+                if size:
+                    headers['X-TTS-Cache'] = 'hit'
+                    metrics.inc('api_cache_lookups_total', ('audio', 'hit'))
+                    metrics.inc('api_fallback_depth_total', ('tts_stream', depth, provider['service']))
+                    return build_sized_audio_response(
+                        size,
+                        lambda start, end: count_served_bytes(iter_file_range(audio_path, start, end), provider['service']),
+                        range_header, headers
+                    )
+            metrics.inc('api_cache_lookups_total', ('audio', 'miss'))
+            
+            if not charged and request.token_user_id is not None:
+                if not usage.consume(request.token_user_id, len(text)):
+                    return JsonResponse({'error': 'Daily character limit reached'}, status=429)
+                charged = True
+            try:
+                upstream = provider['stream']()
+            except Exception as e:
+                logger.warning("%s stream error: %s", provider['label'], e)
+                upstream = None
+            if not upstream:
+                continue
+            
+            chunks, content_length = upstream
+            headers['X-TTS-Cache'] = 'miss'
+            metrics.inc('api_fallback_depth_total', ('tts_stream', depth, provider['service']))
+            return build_streamed_audio_response(
+                count_served_bytes(
+                    end_stream_on_error(tee_to_cache(chunks, audio_cache.open_writer(cache_key)), provider['label']),
+                    provider['service']
+                ),
+                content_length, headers
+            )
+        
+        if charged:
+            usage.refund(request.token_user_id, len(text))
+        metrics.inc('api_fallback_depth_total', ('tts_stream', len(chain), 'browser'))
         return JsonResponse({
             'success': True,
             'service': 'browser',
             'use_browser_tts': True,
-            'message': 'Use browser TTS for guest'
+            'message': 'Use browser TTS fallback' if profile else 'Use browser TTS for guest'
         })
         
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
-    except Exception as e:
-        print(f"TTS error: {e}")
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("TTS stream error")
         return JsonResponse({'error': 'TTS failed'}, status=500)
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def provider_health(request):
+    """Report each upstream provider's circuit breaker state"""
+    providers = [
+        provider_client.ELEVENLABS,
+        provider_client.GOOGLE_CLOUD_TTS,
+        provider_client.GOOGLE_TTS,
+        provider_client.GROQ,
+        provider_client.GOOGLE_TRANSLATE,
+        provider_client.GOOGLE_TRANSLATE_FREE,
+        provider_client.LANGUAGE_DETECT,
+    ]
+    try:
+        return JsonResponse({
+            'success': True,
+            'providers': circuit_breaker.get_health(providers)
+        })
+    except Exception:
+        logger.exception("Provider health error")
+        return JsonResponse({'error': 'Failed to load provider health'}, status=500)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def prometheus_metrics(request):
+    """Serve every worker process's metrics in the Prometheus text format"""
+    token = metrics.get_metrics_settings()['AUTH_TOKEN']
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.collect(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def get_translation_providers(service, profile=None):
+    """Return the translation providers to try, in fallback order
+    
+    Each entry names the provider and the user's API key it needs (None for
+    free services). Callers translating a single text want
+    get_translation_provider_chain instead.
+    """
+    chain = []
+    
+    if profile is not None:
+        # Determine the actual service to use
+        actual_service = service
+        if service == 'auto':
+            actual_service = profile.preferred_translation_service or 'auto'
+            logger.info("Auto mode - using preferred service: %s", actual_service)
+        
+        # Use Groq API if requested and available
+        if profile.groq_api_key and (actual_service == 'groq' or (actual_service == 'auto' and profile.groq_api_key)):
+            chain.append({
+                'service': 'groq',
+                'provider': provider_client.GROQ,
+                'label': 'Groq translation',
+                'api_key': profile.groq_api_key,
+            })
+        
+        # Use user's Google Translate API if requested and available
+        if profile.google_translate_api_key and (actual_service == 'google' or (actual_service == 'auto' and profile.google_translate_api_key)):
+            chain.append({
+                'service': 'google_official',
+                'provider': provider_client.GOOGLE_TRANSLATE,
+                'label': 'Official Google translation',
+                'api_key': profile.google_translate_api_key,
+            })
+    
+    # Try Google Translate API (for guests or fallback)
+    chain.append({
+        'service': 'google',
+        'provider': provider_client.GOOGLE_TRANSLATE_FREE,
+        'label': 'Google translation',
+        'api_key': None,
+    })
+    
+    return chain
+
+def get_translation_provider_chain(text, service, target_language, source_language, profile=None):
+    """Return get_translation_providers() entries with a translate() callable returning text's translation"""
+    chain = get_translation_providers(service, profile)
+    for provider in chain:
+        api_key = provider['api_key']
+        if provider['service'] == 'groq':
+            translate = lambda api_key=api_key: call_groq_translation_api(text, api_key, target_language, source_language)
+        elif provider['service'] == 'google_official':
+            translate = lambda api_key=api_key: call_official_google_translate_api(text, api_key, target_language, source_language)
+        else:
+            translate = lambda: handle_google_translation(text, target_language, source_language)
+        provider['translate'] = translate
+    return chain
+
+def make_translation_attempt(provider, text, target_language, source_language):
+    """Wrap a translation chain entry as a hedging attempt returning (translation, cache status) or None"""
+    def attempt():
+        translation, cache_status = translation_cache.get_or_translate(
+            provider['service'], text, source_language, target_language,
+            provider['translate'], api_key=provider['api_key']
+        )
+        return (translation, cache_status) if translation else None
+    return attempt
+
+def parse_translate_request(request):
+    data = json_codec.parse_json_body(request)
+    text = data.get('text', '')
+    service = data.get('service', 'auto')  # auto, groq, google
+    target_language = data.get('target_language', 'ko')  # default to Korean
+    source_language = data.get('source_language', 'auto')  # default to auto-detect
+    return text, service, target_language, source_language
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def translate_text(request):
     try:
-        data = json.loads(request.body)
-        text = data.get('text', '')
-        service = data.get('service', 'auto')  # auto, groq, google
-        target_language = data.get('target_language', 'ko')  # default to Korean
-        source_language = data.get('source_language', 'auto')  # default to auto-detect
+        text, service, target_language, source_language = parse_translate_request(request)
         
         if not text:
             return JsonResponse({'error': 'Text is required'}, status=400)
         
-        print(f"Translation request - Text: '{text}', From: {source_language}, To: {target_language}, Service: {service}")
+        if request.token_user_id is not None and not usage.consume(request.token_user_id, len(text)):
+            return JsonResponse({'error': 'Daily character limit reached'}, status=429)
         
-        # Check if user is authenticated for premium services
-        user_id = request.headers.get('Authorization', '').replace('Token token_', '')
-        if user_id.isdigit():
-            try:
-                user = User.objects.get(id=int(user_id))
-                profile, created = UserProfile.objects.get_or_create(user=user)
-                
-                print(f"User: {user.username}, Has Groq: {bool(profile.groq_api_key)}, Has Google: {bool(profile.google_translate_api_key)}")
-                print(f"User preferred service: {profile.preferred_translation_service}, Requested service: {service}")
-                
-                # Determine the actual service to use
-                actual_service = service
-                if service == 'auto':
-                    actual_service = profile.preferred_translation_service or 'auto'
-                    print(f"Auto mode - using preferred service: {actual_service}")
-                
-                # Use Groq API if requested and available
-                if profile.groq_api_key and (actual_service == 'groq' or (actual_service == 'auto' and profile.groq_api_key)):
-                    try:
-                        translation = call_groq_translation_api(text, profile.groq_api_key, target_language, source_language)
-                        if translation:
-                            return JsonResponse({
-                                'success': True,
-                                'service': 'groq',
-                                'translation': translation
-                            })
-                    except Exception as e:
-                        print(f"Groq translation error: {e}")
-                        # Continue to try next service
-                
-                # Use user's Google Translate API if requested and available
-                if profile.google_translate_api_key and (actual_service == 'google' or (actual_service == 'auto' and profile.google_translate_api_key)):
-                    try:
-                        translation = call_official_google_translate_api(text, profile.google_translate_api_key, target_language, source_language)
-                        if translation:
-                            return JsonResponse({
-                                'success': True,
-                                'service': 'google_official',
-                                'translation': translation
-                            })
-                    except Exception as e:
-                        print(f"Official Google translation error: {e}")
-                        # Continue to free Google API
-                        
-            except User.DoesNotExist:
-                pass
+        logger.info("Translation request - Characters: %s, From: %s, To: %s, Service: %s", len(text), source_language, target_language, service)
+        payload_logger.debug("Translation request text: %r", text)
         
-        # Try Google Translate API (for guests or fallback)
-        try:
-            translation = handle_google_translation(text, target_language, source_language)
-            if translation:
-                return JsonResponse({
-                    'success': True,
-                    'service': 'google',
-                    'translation': translation
-                })
-        except Exception as e:
-            print(f"Google translation error: {e}")
+        # Check if user is authenticated for premium services
+        user, profile = get_request_profile(request)
+        if profile:
+            logger.info("User: %s, Has Groq: %s, Has Google: %s", user.username, bool(profile.groq_api_key), bool(profile.google_translate_api_key))
+            logger.info("User preferred service: %s, Requested service: %s", profile.preferred_translation_service, service)
+        
+        chain = skip_open_circuits(get_translation_provider_chain(text, service, target_language, source_language, profile))
+        hedging_settings = hedging.get_hedging_settings()
+        index, result = hedging.run_hedged(
+            [(provider['label'], make_translation_attempt(provider, text, target_language, source_language)) for provider in chain],
+            hedge_delay=hedging.get_hedge_delay(hedging_settings),
+            no_hedge=hedging.paid_attempts(chain),
+            deadline=hedging_settings['TRANSLATION_DEADLINE']
+        )
+        if result:
+            translation, cache_status = result
+            if cache_status != translation_cache.CACHE_MISS:
+                # Served from the translation cache: no upstream work to charge for
+                usage.refund(request.token_user_id, len(text))
+            metrics.inc('api_fallback_depth_total', ('translation', index, chain[index]['service']))
+            return JsonResponse({
+                'success': True,
+                'service': chain[index]['service'],
+                'translation': translation,
+                'cache': cache_status
+            })
         
-        # Fallback to basic dictionary translation
+        # Fallback to basic dictionary translation; no provider was used, so nothing is charged
+        usage.refund(request.token_user_id, len(text))
+        metrics.inc('api_fallback_depth_total', ('translation', len(chain), 'basic'))
         return JsonResponse({
             'success': True,
             'service': 'basic',
-            'translation': get_basic_translation(text),
+            'translation': get_basic_translation(text, target_language, source_language),
             'message': 'Using basic translation dictionary'
         })
         
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
-    except Exception as e:
-        print(f"Translation error: {e}")
+    except json_codec.RequestBodyTooLarge as e:
+        return json_codec.too_large_response(e)
+    except Exception:
+        logger.exception("Translation error")
         return JsonResponse({'error': 'Translation failed'}, status=500)
 
+def build_free_google_translate_url(text, target_language='ko', source_language='auto'):
+    """Return the free Google Translate URL for text"""
+    import urllib.parse
+    encoded_text = urllib.parse.quote(text)
+    return f'https://translate.googleapis.com/translate_a/single?client=gtx&sl={source_language}&tl={target_language}&dt=t&q={encoded_text}'
+
+def parse_free_google_translation(data):
+    """Extract translation from Google's response format"""
+    if data and data[0]:
+        full_translation = ''
+        for segment in data[0]:
+            if segment and segment[0]:
+                full_translation += segment[0]
+        
+        return full_translation.strip()
+    return None
+
 def handle_google_translation(text, target_language='ko', source_language='auto'):
     """Use free Google Translate API (for guests or fallback)"""
     # Use free Google Translate API
     try:
-        import urllib.parse
-        encoded_text = urllib.parse.quote(text)
-        
-        response = requests.get(
-            f'https://translate.googleapis.com/translate_a/single?client=gtx&sl={source_language}&tl={target_language}&dt=t&q={encoded_text}',
-            timeout=10
+        response = provider_client.get(
+            provider_client.GOOGLE_TRANSLATE_FREE,
+            build_free_google_translate_url(text, target_language, source_language)
         )
         
         if response.status_code == 200:
-            data = response.json()
-            
-            # Extract translation from Google's response format
-            if data and data[0]:
-                full_translation = ''
-                for segment in data[0]:
-                    if segment and segment[0]:
-                        full_translation += segment[0]
-                
-                return full_translation.strip()
+            return parse_free_google_translation(response.json())
                 
     except Exception as e:
-        print(f"Free Google translation failed: {e}")
+        logger.warning("Free Google translation failed: %s", e)
         return None
     
     return None
 
+OFFICIAL_GOOGLE_TRANSLATE_URL = "https://translation.googleapis.com/language/translate/v2"
+
+def build_official_google_translate_params(text, api_key, target_language='ko', source_language='auto'):
+    """Return the query parameters for an official Google Translate request"""
+    return {
+        'key': api_key,
+        'q': text,
+        'source': source_language if source_language != 'auto' else None,
+        'target': target_language
+    }
+
 def call_official_google_translate_api(text, api_key, target_language='ko', source_language='auto'):
     """Call official Google Translate API with user's API key"""
     try:
         if not api_key:
             return None
             
-        url = "https://translation.googleapis.com/language/translate/v2"
+        url = OFFICIAL_GOOGLE_TRANSLATE_URL
+        params = build_official_google_translate_params(text, api_key, target_language, source_language)
         
-        params = {
-            'key': api_key,
-            'q': text,
-            'source': source_language if source_language != 'auto' else None,
-            'target': target_language
-        }
+        logger.debug("Calling official Google Translate API with user key to translate to %s...", target_language)
         
-        print(f"Calling official Google Translate API with user key to translate to {target_language}...")
-        
-        response = requests.get(url, params=params, timeout=15)
+        response = provider_client.get(provider_client.GOOGLE_TRANSLATE, url, params=params, breaker_scope=api_key)
         
         if response.status_code == 200:
             result = response.json()
             translation = result['data']['translations'][0]['translatedText']
-            print(f"Official Google Translate success: '{translation}'")
+            payload_logger.debug("Official Google Translate success: %r", translation)
             return translation
         else:
-            print(f"Official Google Translate API error: {response.status_code} - {response.text}")
+            logger.warning("Official Google Translate API error: %s", response.status_code)
+            payload_logger.debug("Official Google Translate API error response: %s", response.text)
             return None
             
     except Exception as e:
-        print(f"Official Google Translate API exception: {e}")
+        logger.warning("Official Google Translate API exception: %s", e)
         return None
 
-def get_basic_translation(text):
+def get_basic_translation(text, target_language='ko', source_language='auto'):
     """Fallback basic translation dictionary"""
-    # Enhanced vocabulary with more context-aware translations
-    smart_translations = {
-        # Common phrases
-        'hello world': '안녕, 세상',
-        'good morning': '좋은 아침',
-        'good evening': '좋은 저녁', 
-        'good night': '잘 자',
-        'thank you': '감사합니다',
-        'how are you': '어떻게 지내세요',
-        'i am fine': '저는 괜찮습니다',
-        'what is your name': '이름이 뭐예요',
-        'nice to meet you': '만나서 반갑습니다',
-        'see you later': '나중에 봐요',
-        'have a good day': '좋은 하루 보내세요',
-        
-        # Single words with better context
-        'hello': '안녕하세요',
-        'hi': '안녕',
-        'world': '세상',
-        'good': '좋은',
-        'bad': '나쁜',
-        'morning': '아침',
-        'afternoon': '오후', 
-        'evening': '저녁',
-        'night': '밤',
-        'today': '오늘',
-        'tomorrow': '내일',
-        'yesterday': '어제',
-        'now': '지금',
-        'later': '나중에',
-        'here': '여기',
-        'there': '저기',
-        'this': '이것',
-        'that': '저것',
-        'these': '이것들',
-        'those': '저것들',
-        
-        # Pronouns
-        'i': '나는',
-        'you': '당신은',
-        'he': '그는',
-        'she': '그녀는',
-        'we': '우리는',
-        'they': '그들은',
-        'my': '나의',
-        'your': '당신의',
-        'his': '그의',
-        'her': '그녀의',
-        'our': '우리의',
-        'their': '그들의',
-        'me': '나를',
-        'him': '그를',
-        'us': '우리를',
-        'them': '그들을',
-        
-        # Verbs
-        'am': '입니다',
-        'is': '입니다',
-        'are': '입니다',
-        'was': '였습니다',
-        'were': '였습니다',
-        'have': '가지고 있다',
-        'has': '가지고 있다',
-        'do': '하다',
-        'does': '하다',
-        'did': '했다',
-        'will': '할 것이다',
-        'would': '할 것이다',
-        'can': '할 수 있다',
-        'could': '할 수 있었다',
-        'should': '해야 한다',
-        'must': '해야 한다',
-        'go': '가다',
-        'come': '오다',
-        'see': '보다',
-        'look': '보다',
-        'hear': '듣다',
-        'listen': '듣다',
-        'speak': '말하다',
-        'talk': '이야기하다',
-        'say': '말하다',
-        'tell': '말하다',
-        'know': '알다',
-        'think': '생각하다',
-        'want': '원하다',
-        'need': '필요하다',
-        'like': '좋아하다',
-        'love': '사랑하다',
-        'eat': '먹다',
-        'drink': '마시다',
-        'sleep': '자다',
-        'work': '일하다',
-        'play': '놀다',
-        'study': '공부하다',
-        'learn': '배우다',
-        'teach': '가르치다',
-        'read': '읽다',
-        'write': '쓰다',
-        
-        # Common words
-        'the': '',
-        'a': '',
-        'an': '',
-        'and': '그리고',
-        'or': '또는',
-        'but': '하지만',
-        'so': '그래서',
-        'if': '만약',
-        'when': '언제',
-        'where': '어디',
-        'what': '무엇',
-        'who': '누구',
-        'why': '왜',
-        'how': '어떻게',
-        'yes': '네',
-        'no': '아니오',
-        'not': '않다',
-        'very': '매우',
-        'really': '정말',
-        'please': '부탁합니다',
-        'sorry': '죄송합니다',
-        'excuse': '실례합니다',
-        'thank': '감사',
-        'welcome': '환영합니다'
+    return basic_translation.translate(text, target_language, source_language)
+
+def build_elevenlabs_request(text, api_key, speed='normal', stream=False):
+    """Return the (url, headers, payload) for an ElevenLabs TTS request"""
+    voice_id = ELEVENLABS_DEFAULT_VOICE_ID
+    
+    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+    if stream:
+        url += "/stream"
+    
+    headers = {
+        "Accept": "audio/mpeg",
+        "Content-Type": "application/json",
+        "xi-api-key": api_key
     }
     
-    # First try to find complete phrases
-    lower_text = text.lower().strip()
-    if lower_text in smart_translations:
-        return smart_translations[lower_text]
+    # Convert speed to stability and similarity_boost values
+    if speed == 'slow':
+        stability = 0.75
+        similarity_boost = 0.75
+    elif speed == 'fast':
+        stability = 0.50
+        similarity_boost = 0.85
+    else:  # normal
+        stability = 0.65
+        similarity_boost = 0.80
     
-    # Then try sentence by sentence
-    import re
-    sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
-    if sentences:
-        translated_sentences = []
-        for sentence in sentences:
-            lower_sentence = sentence.strip().lower()
-            if lower_sentence in smart_translations:
-                translated_sentences.append(smart_translations[lower_sentence])
-            else:
-                # Word by word translation with better grammar
-                words = sentence.strip().split()
-                translated_words = []
-                for word in words:
-                    clean_word = re.sub(r'[.,!?;:()]', '', word.lower())
-                    translated_words.append(smart_translations.get(clean_word, word))
-                
-                translated_sentences.append(' '.join([w for w in translated_words if w]))
-        
-        return '. '.join(translated_sentences)
+    data = {
+        "text": text,
+        "model_id": "eleven_monolingual_v1",
+        "voice_settings": {
+            "stability": stability,
+            "similarity_boost": similarity_boost
+        }
+    }
     
-    # Single word fallback
-    import re
-    clean_text = re.sub(r'[.,!?;:()]', '', text.lower().strip())
-    return smart_translations.get(clean_text, text)
+    return url, headers, data
 
 def call_elevenlabs_api(text, api_key, speed='normal'):
     """Call ElevenLabs API to generate TTS"""
     try:
-        # Default voice ID for Rachel
-        voice_id = "21m00Tcm4TlvDq8ikWAM"
-        
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-        
-        headers = {
-            "Accept": "audio/mpeg",
-            "Content-Type": "application/json",
-            "xi-api-key": api_key
-        }
-        
-        # Convert speed to stability and similarity_boost values
-        if speed == 'slow':
-            stability = 0.75
-            similarity_boost = 0.75
-        elif speed == 'fast':
-            stability = 0.50
-            similarity_boost = 0.85
-        else:  # normal
-            stability = 0.65
-            similarity_boost = 0.80
-        
-        data = {
-            "text": text,
-            "model_id": "eleven_monolingual_v1",
-            "voice_settings": {
-                "stability": stability,
-                "similarity_boost": similarity_boost
-            }
-        }
+        url, headers, data = build_elevenlabs_request(text, api_key, speed)
         
-        print(f"Calling ElevenLabs API with voice_id: {voice_id}")
+        logger.debug("Calling ElevenLabs API with voice_id: %s", ELEVENLABS_DEFAULT_VOICE_ID)
         
-        response = requests.post(url, json=data, headers=headers, timeout=30)
+        response = provider_client.post(provider_client.ELEVENLABS, url, json=data, headers=headers, breaker_scope=api_key)
         
         if response.status_code == 200:
             # Convert audio to base64
             audio_base64 = base64.b64encode(response.content).decode('utf-8')
-            print(f"ElevenLabs API success - Audio length: {len(audio_base64)} chars")
+            logger.info("ElevenLabs API success - Audio length: %s chars", len(audio_base64))
             return audio_base64
         else:
-            print(f"ElevenLabs API error: {response.status_code} - {response.text}")
+            logger.warning("ElevenLabs API error: %s", response.status_code)
+            payload_logger.debug("ElevenLabs API error response: %s", response.text)
             return None
             
     except Exception as e:
-        print(f"ElevenLabs API exception: {e}")
+        logger.warning("ElevenLabs API exception: %s", e)
         return None
 
+def stream_elevenlabs_api(text, api_key, speed='normal'):
+    """Open a streaming ElevenLabs TTS request
+    
+    Returns (chunk iterator, content length or None), or None on failure.
+    """
+    try:
+        url, headers, data = build_elevenlabs_request(text, api_key, speed, stream=True)
+        
+        logger.debug("Streaming ElevenLabs API with voice_id: %s", ELEVENLABS_DEFAULT_VOICE_ID)
+        
+        response = provider_client.post(provider_client.ELEVENLABS, url, json=data, headers=headers, stream=True, breaker_scope=api_key)
+        
+        if response.status_code == 200:
+            return open_audio_stream(response)
+        logger.warning("ElevenLabs stream error: %s", response.status_code)
+        payload_logger.debug("ElevenLabs stream error response: %s", response.text)
+        response.close()
+        return None
+        
+    except Exception as e:
+        logger.warning("ElevenLabs stream exception: %s", e)
+        return None
+
+def open_audio_stream(response, min_bytes=1):
+    """Wrap a streaming upstream response as (chunk iterator, content length)
+    
+    The first min_bytes are read up front so that short error bodies can be
+    rejected before any audio is sent to the client. Returns None when the
+    response ends before min_bytes.
+    """
+    chunks = response.iter_content(chunk_size=AUDIO_STREAM_CHUNK_SIZE)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= min_bytes:
+            break
+    if len(head) < min_bytes:
+        response.close()
+        return None
+    
+    # requests transparently decompresses, so the upstream length is only
+    # meaningful for identity-encoded bodies
+    content_length = None
+    if not response.headers.get('Content-Encoding') and response.headers.get('Content-Length', '').isdigit():
+        content_length = int(response.headers['Content-Length'])
+    
+    def generate():
+        try:
+            yield head
+            yield from chunks
+        finally:
+            response.close()
+    
+    return generate(), content_length
+
 def call_groq_tts_api(text, api_key, speed='normal'):
     """Call Groq API for TTS (placeholder - Groq doesn't have TTS API yet)"""
     try:
         # Groq doesn't have TTS API yet, so this is a placeholder
-        print(f"Groq TTS not implemented yet - API key available: {bool(api_key)}")
+        logger.info("Groq TTS not implemented yet - API key available: %s", bool(api_key))
         return None
     except Exception as e:
-        print(f"Groq TTS API exception: {e}")
+        logger.warning("Groq TTS API exception: %s", e)
         return None
 
+def build_google_tts_url(text, speed='normal', language='en'):
+    """Return the free Google TTS URL for text"""
+    import urllib.parse
+    encoded_text = urllib.parse.quote(text)
+    
+    # Use Google TTS API with specified language
+    slow_param = "1" if speed == "slow" else "0"
+    return f'https://translate.google.com/translate_tts?ie=UTF-8&q={encoded_text}&tl={language}&client=tw-ob&slow={slow_param}'
+
+GOOGLE_TTS_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# Responses shorter than this are error pages rather than audio
+GOOGLE_TTS_MIN_AUDIO_BYTES = 1000
+
 def call_google_tts_api(text, speed='normal', language='en'):
     """Call Google TTS API via proxy to avoid CORS issues"""
     try:
-        import urllib.parse
-        encoded_text = urllib.parse.quote(text)
+        url = build_google_tts_url(text, speed, language)
         
-        # Use Google TTS API with specified language
-        slow_param = "1" if speed == "slow" else "0"
-        url = f'https://translate.google.com/translate_tts?ie=UTF-8&q={encoded_text}&tl={language}&client=tw-ob&slow={slow_param}'
+        logger.debug("Calling Google TTS API via proxy - Language: %s, Speed: %s", language, speed)
         
-        print(f"Calling Google TTS API via proxy - Language: {language}, Speed: {speed}")
-        
-        response = requests.get(url, timeout=15, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        response = provider_client.get(provider_client.GOOGLE_TTS, url, headers=GOOGLE_TTS_HEADERS)
         
-        if response.status_code == 200 and len(response.content) > 1000:  # Valid audio file
+        if response.status_code == 200 and len(response.content) > GOOGLE_TTS_MIN_AUDIO_BYTES:  # Valid audio file
             # Convert audio to base64
             audio_base64 = base64.b64encode(response.content).decode('utf-8')
-            print(f"Google TTS proxy success - Audio length: {len(audio_base64)} chars")
+            logger.info("Google TTS proxy success - Audio length: %s chars", len(audio_base64))
             return audio_base64
         else:
-            print(f"Google TTS proxy error: {response.status_code} - Content length: {len(response.content)}")
+            logger.warning("Google TTS proxy error: %s - Content length: %s", response.status_code, len(response.content))
             return None
             
     except Exception as e:
-        print(f"Google TTS proxy exception: {e}")
+        logger.warning("Google TTS proxy exception: %s", e)
         return None
 
-def call_groq_translation_api(text, api_key, target_language='ko', source_language='auto'):
-    """Call Groq API for translation"""
+def stream_google_tts_api(text, speed='normal', language='en'):
+    """Open a streaming Google TTS request via proxy
+    
+    Returns (chunk iterator, content length or None), or None on failure.
+    """
     try:
-        url = "https://api.groq.com/openai/v1/chat/completions"
+        url = build_google_tts_url(text, speed, language)
         
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+        logger.debug("Streaming Google TTS API via proxy - Language: %s, Speed: %s", language, speed)
         
-        # Language code to full language name mapping
-        language_names = {
-            'ko': 'Korean',
-            'ja': 'Japanese', 
-            'zh': 'Chinese',
-            'es': 'Spanish',
-            'fr': 'French',
-            'de': 'German',
-            'it': 'Italian',
-            'pt': 'Portuguese',
-            'ru': 'Russian',
-            'ar': 'Arabic',
-            'hi': 'Hindi',
-            'th': 'Thai',
-            'vi': 'Vietnamese'
-        }
+        response = provider_client.get(provider_client.GOOGLE_TTS, url, headers=GOOGLE_TTS_HEADERS, stream=True)
         
-        target_lang_name = language_names.get(target_language, target_language)
-        source_lang_name = language_names.get(source_language, source_language) if source_language != 'auto' else 'auto-detected language'
+        if response.status_code == 200:
+            upstream = open_audio_stream(response, min_bytes=GOOGLE_TTS_MIN_AUDIO_BYTES + 1)
+            if upstream:
+                return upstream
+            logger.warning("Google TTS stream error: response too short to be audio")
+            return None
+        logger.warning("Google TTS stream error: %s", response.status_code)
+        response.close()
+        return None
         
-        # Create prompt based on source language
-        if source_language == 'auto':
-            prompt = f"Translate this text to {target_lang_name}. Return only the {target_lang_name} translation without any additional text:\n\n{text}"
-        else:
-            prompt = f"Translate this {source_lang_name} text to {target_lang_name}. Return only the {target_lang_name} translation without any additional text:\n\n{text}"
-        
-        data = {
-            "model": "llama3-70b-8192",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "max_tokens": 1000,
-            "temperature": 0.1
-        }
+    except Exception as e:
+        logger.warning("Google TTS stream exception: %s", e)
+        return None
+
+# Language code to full language name mapping
+LANGUAGE_NAMES = {
+    'ko': 'Korean',
+    'ja': 'Japanese', 
+    'zh': 'Chinese',
+    'es': 'Spanish',
+    'fr': 'French',
+    'de': 'German',
+    'it': 'Italian',
+    'pt': 'Portuguese',
+    'ru': 'Russian',
+    'ar': 'Arabic',
+    'hi': 'Hindi',
+    'th': 'Thai',
+    'vi': 'Vietnamese'
+}
+
+GROQ_CHAT_COMPLETIONS_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+def build_groq_translation_request(text, api_key, target_language='ko', source_language='auto'):
+    """Return the (url, headers, payload) for a Groq translation request"""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    
+    target_lang_name = LANGUAGE_NAMES.get(target_language, target_language)
+    source_lang_name = LANGUAGE_NAMES.get(source_language, source_language) if source_language != 'auto' else 'auto-detected language'
+    
+    # Create prompt based on source language
+    if source_language == 'auto':
+        prompt = f"Translate this text to {target_lang_name}. Return only the {target_lang_name} translation without any additional text:\n\n{text}"
+    else:
+        prompt = f"Translate this {source_lang_name} text to {target_lang_name}. Return only the {target_lang_name} translation without any additional text:\n\n{text}"
+    
+    data = {
+        "model": "llama3-70b-8192",
+        "messages": [
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "max_tokens": 1000,
+        "temperature": 0.1
+    }
+    
+    return GROQ_CHAT_COMPLETIONS_URL, headers, data
+
+def call_groq_translation_api(text, api_key, target_language='ko', source_language='auto'):
+    """Call Groq API for translation"""
+    try:
+        url, headers, data = build_groq_translation_request(text, api_key, target_language, source_language)
+        target_lang_name = LANGUAGE_NAMES.get(target_language, target_language)
         
-        print(f"Calling Groq translation API to translate to {target_lang_name}...")
+        logger.debug("Calling Groq translation API to translate to %s...", target_lang_name)
         
-        response = requests.post(url, json=data, headers=headers, timeout=30)
+        response = provider_client.post(provider_client.GROQ, url, json=data, headers=headers, breaker_scope=api_key)
         
         if response.status_code == 200:
             result = response.json()
             translation = result['choices'][0]['message']['content'].strip()
-            print(f"Groq translation success: '{translation}'")
+            payload_logger.debug("Groq translation success: %r", translation)
             return translation
         else:
-            print(f"Groq translation API error: {response.status_code} - {response.text}")
+            logger.warning("Groq translation API error: %s", response.status_code)
+            payload_logger.debug("Groq translation API error response: %s", response.text)
             return None
             
     except Exception as e:
-        print(f"Groq translation API exception: {e}")
+        logger.warning("Groq translation API exception: %s", e)
         return None
 
+def get_google_cloud_voice(language='en'):
+    """Return the (language_code, voice_name) Google Cloud TTS uses for a language"""
+    language_code = GOOGLE_CLOUD_TTS_LANGUAGE_CODES.get(language, 'en-US')
+    
+    # Select appropriate voice based on language
+    voice_name = f"{language_code}-Standard-A"  # Default voice
+    if language_code == 'en-US':
+        voice_name = "en-US-Neural2-D"
+    elif language_code == 'ko-KR':
+        voice_name = "ko-KR-Neural2-A"
+    elif language_code == 'ja-JP':
+        voice_name = "ja-JP-Neural2-B"
+    
+    return language_code, voice_name
+
+def build_google_cloud_tts_request(text, api_key, speed='normal', language='en'):
+    """Return the (url, headers, payload) for a Google Cloud TTS request"""
+    # Use API key as URL parameter (not Bearer token)
+    url = f"https://texttospeech.googleapis.com/v1/text:synthesize?key={api_key}"
+    
+    # Convert speed to speaking rate
+    speaking_rate = 1.0
+    if speed == 'fast':
+        speaking_rate = 1.25
+    elif speed == 'slow':
+        speaking_rate = 0.75
+    
+    headers = {
+        "Content-Type": "application/json"
+    }
+    
+    language_code, voice_name = get_google_cloud_voice(language)
+    
+    data = {
+        "input": {
+            "text": text
+        },
+        "voice": {
+            "languageCode": language_code,
+            "name": voice_name,
+            "ssmlGender": "MALE"
+        },
+        "audioConfig": {
+            "audioEncoding": "MP3",
+            "speakingRate": speaking_rate,
+            "pitch": 0.0,
+            "volumeGainDb": 0.0
+        }
+    }
+    
+    return url, headers, data
+
 def call_google_cloud_tts_api(text, api_key, speed='normal', language='en'):
     """Call Google Cloud Text-to-Speech API"""
     try:
         if not api_key:
             return None
             
-        # Use API key as URL parameter (not Bearer token)
-        url = f"https://texttospeech.googleapis.com/v1/text:synthesize?key={api_key}"
-        
-        # Convert speed to speaking rate
-        speaking_rate = 1.0
-        if speed == 'fast':
-            speaking_rate = 1.25
-        elif speed == 'slow':
-            speaking_rate = 0.75
-        
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        # Language code mapping for Google Cloud TTS
-        tts_lang_mapping = {
-            'ko': 'ko-KR',
-            'ja': 'ja-JP', 
-            'zh': 'zh-CN',
-            'es': 'es-ES',
-            'fr': 'fr-FR',
-            'de': 'de-DE',
-            'it': 'it-IT',
-            'pt': 'pt-PT',
-            'ru': 'ru-RU',
-            'ar': 'ar-XA',
-            'hi': 'hi-IN',
-            'th': 'th-TH',
-            'vi': 'vi-VN'
-        }
-        
-        language_code = tts_lang_mapping.get(language, 'en-US')
-        
-        # Select appropriate voice based on language
-        voice_name = f"{language_code}-Standard-A"  # Default voice
-        if language_code == 'en-US':
-            voice_name = "en-US-Neural2-D"
-        elif language_code == 'ko-KR':
-            voice_name = "ko-KR-Neural2-A"
-        elif language_code == 'ja-JP':
-            voice_name = "ja-JP-Neural2-B"
-        
-        data = {
-            "input": {
-                "text": text
-            },
-            "voice": {
-                "languageCode": language_code,
-                "name": voice_name,
-                "ssmlGender": "MALE"
-            },
-            "audioConfig": {
-                "audioEncoding": "MP3",
-                "speakingRate": speaking_rate,
-                "pitch": 0.0,
-                "volumeGainDb": 0.0
-            }
-        }
+        url, headers, data = build_google_cloud_tts_request(text, api_key, speed, language)
+        voice = data['voice']
         
-        print(f"Calling Google Cloud TTS API - Language: {language_code}, Voice: {voice_name}, Rate: {speaking_rate}")
+        logger.debug("Calling Google Cloud TTS API - Language: %s, Voice: %s, Rate: %s", voice['languageCode'], voice['name'], data['audioConfig']['speakingRate'])
         
-        response = requests.post(url, json=data, headers=headers, timeout=30)
+        response = provider_client.post(provider_client.GOOGLE_CLOUD_TTS, url, json=data, headers=headers, breaker_scope=api_key)
         
         if response.status_code == 200:
             result = response.json()
             audio_content = result.get('audioContent')
             if audio_content:
-                print(f"Google Cloud TTS success - Audio length: {len(audio_content)} chars")
+                logger.info("Google Cloud TTS success - Audio length: %s chars", len(audio_content))
                 return audio_content
         else:
-            print(f"Google Cloud TTS API error: {response.status_code} - {response.text}")
+            logger.warning("Google Cloud TTS API error: %s", response.status_code)
+            payload_logger.debug("Google Cloud TTS API error response: %s", response.text)
             return None
             
     except Exception as e:
-        print(f"Google Cloud TTS API exception: {e}")
+        logger.warning("Google Cloud TTS API exception: %s", e)
         return None
 
+def stream_google_cloud_tts_api(text, api_key, speed='normal', language='en'):
+    """Google Cloud TTS returns base64 inside JSON, so decode it into one chunk
+    
+    Returns (chunk iterator, content length), or None on failure.
+    """
+    audio_content = call_google_cloud_tts_api(text, api_key, speed, language)
+    if not audio_content:
+        return None
+    audio_bytes = base64.b64decode(audio_content)
+    return iter([audio_bytes]), len(audio_bytes)
+
+def build_language_detect_url(text):
+    """Return the free Google Translate URL used for language detection"""
+    # Limit text length for detection
+    return build_free_google_translate_url(text[:100], target_language='en', source_language='auto')
+
+def parse_detected_language(data):
+    """Google returns detected language in data[2]"""
+    if data and len(data) > 2 and data[2]:
+        return data[2]
+    return None
+
 def detect_text_language(text):
     """Detect language of text using Google Translate API"""
     try:
-        import urllib.parse
-        encoded_text = urllib.parse.quote(text[:100])  # Limit text length for detection
-        
-        response = requests.get(
-            f'https://translate.googleapis.com/translate_a/single?client=gtx&sl=auto&tl=en&dt=t&q={encoded_text}',
-            timeout=5
-        )
+        response = provider_client.get(provider_client.LANGUAGE_DETECT, build_language_detect_url(text))
         
         if response.status_code == 200:
-            data = response.json()
-            # Google returns detected language in data[2]
-            if data and len(data) > 2 and data[2]:
-                detected_lang = data[2]
-                print(f"Detected language: {detected_lang}")
+            detected_lang = parse_detected_language(response.json())
+            if detected_lang:
+                logger.info("Detected language: %s", detected_lang)
                 return detected_lang
                 
     except Exception as e:
-        print(f"Language detection failed: {e}")
+        logger.warning("Language detection failed: %s", e)
     
-    return None
\ No newline at end of file
+    return None
+
+def detect_source_language(text):
+    """Detect language locally, asking Google only when the local guess is unsure"""
+    language, confident = language_detect.guess_language(text)
+    if not confident:
+        language = detect_text_language(text) or language
+    return language or 'en'  # Default to English if detection fails
@@ -0,0 +1,7 @@
+"""
+Offline benchmarks for the English Study backend.
+
+Run from the english_study_backend directory, e.g.::
+
+    python -m benchmarks.bench_provider_pool
+"""
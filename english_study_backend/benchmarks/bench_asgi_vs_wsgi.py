@@ -0,0 +1,130 @@
+"""
+Compare concurrent throughput of the sync (WSGI) and async (ASGI) views.
+
+Starts the stub providers with a fixed upstream latency, then serves the
+project once through a WSGI server with a bounded thread pool (like one
+gunicorn gthread worker) and once through a single uvicorn ASGI worker, and
+fires the same burst of concurrent translate requests at each.
+
+    python -m benchmarks.bench_asgi_vs_wsgi --concurrency 200 --latency 0.5
+
+Requires httpx (client and async views) and uvicorn (ASGI server).
+"""
+import argparse
+import asyncio
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from benchmarks.setup import configure_django
+from benchmarks.stub_server import StubServer
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledWSGIServer(ThreadingMixIn, WSGIServer):
+    """WSGI server that handles requests on a fixed-size thread pool"""
+
+    request_queue_size = 1024
+
+    def __init__(self, address, threads):
+        super().__init__(address, QuietHandler)
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def fire(base_url, path, concurrency):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        async def one(index):
+            start = time.perf_counter()
+            response = await client.post(path, json={'text': f'benchmark sentence {index}', 'target_language': 'ko'})
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one(index) for index in range(concurrency)))
+        return time.perf_counter() - start, latencies
+
+
+def report(label, elapsed, latencies):
+    ordered = sorted(latencies)
+    print(
+        f"{label:<28} {len(latencies) / elapsed:8.1f} req/s  "
+        f"p50={statistics.median(ordered) * 1000:8.1f} ms  "
+        f"max={ordered[-1] * 1000:8.1f} ms  wall={elapsed:6.2f} s"
+    )
+
+
+def run_wsgi(path, concurrency, threads):
+    from django.core.wsgi import get_wsgi_application
+
+    server = PooledWSGIServer(('127.0.0.1', free_port()), threads)
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        base_url = f'http://127.0.0.1:{server.server_address[1]}'
+        return asyncio.run(fire(base_url, path, concurrency))
+    finally:
+        server.shutdown()
+        server.executor.shutdown(wait=False)
+
+
+def run_asgi(path, concurrency):
+    import uvicorn
+    from django.core.asgi import get_asgi_application
+
+    port = free_port()
+    config = uvicorn.Config(
+        get_asgi_application(), host='127.0.0.1', port=port, log_level='warning', lifespan='off', backlog=1024
+    )
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        return asyncio.run(fire(f'http://127.0.0.1:{port}', path, concurrency))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=200, help='Simultaneous requests in the burst')
+    parser.add_argument('--latency', type=float, default=0.5, help='Stub provider latency (seconds)')
+    parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+    args = parser.parse_args()
+
+    with StubServer(latency=args.latency) as stub:
+        configure_django(
+            PROVIDER_HTTP={'HOST_OVERRIDES': stub.host_overrides(), 'ASYNC_MAX_CONNECTIONS': args.concurrency},
+            # Measure the provider path, not cache hits
+            TRANSLATION_CACHE={'ENABLED': False},
+        )
+        print(f"{args.concurrency} concurrent translate requests, upstream latency {args.latency * 1000:.0f} ms")
+        report(f'WSGI ({args.threads} threads)', *run_wsgi('/api/translate/', args.concurrency, args.threads))
+        report('ASGI (1 worker, async)', *run_asgi('/api/translate/async/', args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
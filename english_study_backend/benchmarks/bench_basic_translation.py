@@ -0,0 +1,97 @@
+"""
+Micro-benchmark for the basic translation fallback.
+
+Times the compiled trie translator against the previous implementation,
+which rebuilt its dictionary and re-ran the regular expressions on every
+call, then loads a large synthetic dictionary to show load time and that
+per-call cost does not grow with dictionary size.
+
+    python -m benchmarks.bench_basic_translation --entries 50000
+"""
+import argparse
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.setup import configure_django
+
+SAMPLES = [
+    'Hello world',
+    'Good morning, how are you?',
+    'I want to learn and study English every morning.',
+    'Thank you very much. See you later!',
+    'They were going to the station when it started to rain.',
+]
+
+
+def legacy_basic_translation(text, entries):
+    """The pre-trie algorithm: copy the dictionary, split and clean per call"""
+    smart_translations = dict(entries)
+    lower_text = text.lower().strip()
+    if lower_text in smart_translations:
+        return smart_translations[lower_text]
+    sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
+    translated_sentences = []
+    for sentence in sentences:
+        lower_sentence = sentence.strip().lower()
+        if lower_sentence in smart_translations:
+            translated_sentences.append(smart_translations[lower_sentence])
+        else:
+            words = sentence.strip().split()
+            translated_words = [smart_translations.get(re.sub(r'[.,!?;:()]', '', word.lower()), word) for word in words]
+            translated_sentences.append(' '.join([w for w in translated_words if w]))
+    return '. '.join(translated_sentences)
+
+
+def time_per_call(call, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in SAMPLES:
+            call(text)
+    return (time.perf_counter() - start) / (iterations * len(SAMPLES)) * 1e6
+
+
+def write_synthetic_dictionary(directory, count):
+    path = Path(directory) / 'en-xx.tsv'
+    with open(path, 'w', encoding='utf-8') as handle:
+        for index in range(count):
+            handle.write(f"phrase {index} word{index % 997}\ttranslation {index}\n")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--entries', type=int, default=50000, help='Size of the synthetic dictionary')
+    args = parser.parse_args()
+
+    configure_django()
+    from api import basic_translation
+
+    translator = basic_translation.get_translator('en', 'ko')
+    entries = list(basic_translation.iter_dictionary_entries(
+        Path(basic_translation.DEFAULT_SETTINGS['DIRS'][0]) / 'en-ko.tsv'))
+
+    legacy = time_per_call(lambda text: legacy_basic_translation(text, entries), args.iterations)
+    trie = time_per_call(translator.translate, args.iterations)
+    print(f"legacy per call          {legacy:8.2f} us")
+    print(f"trie per call            {trie:8.2f} us   ({legacy / trie:.1f}x faster)")
+
+    start = time.perf_counter()
+    translator.translate_many(SAMPLES * args.iterations)
+    batch = (time.perf_counter() - start) / (len(SAMPLES) * args.iterations) * 1e6
+    print(f"trie translate_many      {batch:8.2f} us per text")
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_synthetic_dictionary(directory, args.entries)
+        start = time.perf_counter()
+        large = basic_translation.load_translator('en', 'xx', {'DIRS': [directory]})
+        load_ms = (time.perf_counter() - start) * 1000
+        large_trie = time_per_call(large.translate, args.iterations)
+        print(f"load {large.size} entries  {load_ms:8.1f} ms")
+        print(f"large trie per call      {large_trie:8.2f} us")
+
+
+if __name__ == '__main__':
+    main()
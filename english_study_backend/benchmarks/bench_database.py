@@ -0,0 +1,156 @@
+"""
+Measure concurrent study history reads and writes with each SQLite profile.
+
+Serves the project through a pooled WSGI server on a scratch SQLite file
+and runs reader clients (GET /api/study/history/) alongside writer clients
+(POST /api/study/save/) for several users with existing history. Each
+profile runs in its own process:
+
+    plain   the previous settings: default journal, no busy handling,
+            a new connection per request
+    tuned   the project's DATABASES: WAL, synchronous=NORMAL, IMMEDIATE
+            transactions with a busy timeout, mmap/cache pragmas and
+            persistent connections
+
+    python -m benchmarks.bench_database --readers 8 --writers 8 --requests 200
+"""
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmarks.bench_asgi_vs_wsgi import PooledWSGIServer, free_port
+from benchmarks.bench_endpoints import percentile
+from benchmarks.bench_translate_batch import LOCMEM_CACHES
+from benchmarks.setup import BACKEND_DIR, configure_django, project_setting
+
+PROFILES = ('plain', 'tuned')
+
+
+def database_settings(profile, path):
+    if profile == 'plain':
+        return {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}}
+    default = project_setting('DATABASES')['default']
+    if default['ENGINE'] != 'django.db.backends.sqlite3':
+        raise SystemExit("The tuned profile measures the SQLite settings; unset DJANGO_DB_ENGINE")
+    return {'default': dict(default, NAME=path)}
+
+
+def run_profile(profile, args):
+    """Run the workload in this process and return its results"""
+    import requests as http
+
+    with tempfile.TemporaryDirectory(prefix='bench-database-') as directory:
+        configure_django(
+            ALLOWED_HOSTS=['*'],
+            DATABASES=database_settings(profile, Path(directory) / 'db.sqlite3'),
+            CACHES=LOCMEM_CACHES,
+            METRICS={'ENABLED': False},
+        )
+        logging.disable(logging.CRITICAL)
+
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+        from django.core.wsgi import get_wsgi_application
+
+        from accounts.models import StudyHistory, UserProfile
+        from api.auth import issue_token
+
+        call_command('migrate', verbosity=0)
+        tokens = []
+        for index in range(args.users):
+            user = User.objects.create_user(f'bench-{index}')
+            UserProfile.objects.get_or_create(user=user)
+            StudyHistory.objects.import_items(user.id, [
+                {'english_text': f"Existing history sentence {item}.", 'korean_translation': 'translation'}
+                for item in range(args.history)
+            ])
+            tokens.append(issue_token(user))
+
+        server = PooledWSGIServer(('127.0.0.1', free_port()), args.threads)
+        server.set_app(get_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        def client(kind, number):
+            session = http.Session()
+            session.headers['Authorization'] = f'Token {tokens[number % len(tokens)]}'
+            results = []
+            for index in range(args.requests):
+                start = time.perf_counter()
+                try:
+                    if kind == 'read':
+                        response = session.get(f'{base_url}/api/study/history/', timeout=120)
+                    else:
+                        response = session.post(f'{base_url}/api/study/save/', timeout=120, json={
+                            'text': f"Client {number} sentence {index % 50}.", 'translation': 'translation',
+                        })
+                    ok = response.status_code == 200
+                except http.RequestException:
+                    ok = False
+                results.append((kind, time.perf_counter() - start, ok))
+            return kind, time.perf_counter(), results
+
+        clients = [('read', number) for number in range(args.readers)] + [('write', number) for number in range(args.writers)]
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+                finished = list(executor.map(lambda spec: client(*spec), clients))
+        finally:
+            server.shutdown()
+            server.executor.shutdown(wait=False)
+
+    summary = {'profile': profile}
+    for kind in ('read', 'write'):
+        # Each kind's rate is over the time until its last client finished
+        elapsed = max(end for client_kind, end, results in finished if client_kind == kind) - start
+        outcomes = [(seconds, ok) for client_kind, end, results in finished if client_kind == kind
+                    for result_kind, seconds, ok in results]
+        latencies = sorted(seconds for seconds, ok in outcomes)
+        succeeded = sum(1 for seconds, ok in outcomes if ok)
+        summary[kind] = {
+            'per_second': round(succeeded / elapsed, 1),
+            'errors': len(latencies) - succeeded,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8, help='Clients fetching history')
+    parser.add_argument('--writers', type=int, default=8, help='Clients saving items')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per client')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--history', type=int, default=1000, help='Existing history items per user')
+    parser.add_argument('--threads', type=int, default=16, help='WSGI worker threads')
+    parser.add_argument('--profile', choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        print(json.dumps(run_profile(args.profile, args)))
+        return
+
+    print(f"{args.readers} readers and {args.writers} writers, {args.requests} requests each, {args.threads} server threads")
+    print(f"{'profile':<8} {'reads/s':>9} {'read p95':>10} {'errors':>7} {'writes/s':>9} {'write p95':>10} {'errors':>7}")
+    for profile in PROFILES:
+        # Django is configured once per process, so each profile gets its own
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_database', *sys.argv[1:], '--profile', profile],
+            check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        read, write = result['read'], result['write']
+        print(f"{profile:<8} {read['per_second']:>9.1f} {read['p95_ms']:>7.1f} ms {read['errors']:>7} "
+              f"{write['per_second']:>9.1f} {write['p95_ms']:>7.1f} ms {write['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
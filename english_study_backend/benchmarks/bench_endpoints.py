@@ -0,0 +1,365 @@
+"""
+Load-test every API endpoint offline and compare runs against a JSON baseline.
+
+Serves the project through a pooled WSGI server backed by a throwaway SQLite
+database, with every provider host pointed at the local stub server, and
+drives each endpoint in api/urls.py (plus /metrics) with a fixed number of
+requests at a fixed concurrency. For each endpoint it reports throughput,
+p50/p95/p99 latency, the share of non-2xx responses and database queries
+per request.
+
+    python -m benchmarks.bench_endpoints --requests 200 --concurrency 16 --save benchmarks/baselines/local.json
+    python -m benchmarks.bench_endpoints --compare benchmarks/baselines/local.json
+
+With --compare the run exits with status 1 when an endpoint's p95 latency or
+throughput is worse than the baseline by more than --tolerance, or when it
+makes more queries per request. Only compare runs made with the same options
+on the same machine; the options are stored in the baseline and checked.
+Login and register hash a password per request, so they get a tenth of the
+requests.
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmarks.bench_asgi_vs_wsgi import PooledWSGIServer, free_port
+from benchmarks.bench_translate_batch import LOCMEM_CACHES
+from benchmarks.setup import configure_django, project_setting
+from benchmarks.stub_server import StubServer
+
+PASSWORD = 'benchmark-password'
+IMPORT_ITEMS_PER_REQUEST = 50
+
+# Options that must match for two runs to be comparable
+COMPARED_OPTIONS = ('requests', 'concurrency', 'threads', 'latency', 'error_rate', 'payload_bytes')
+
+
+class QueryCounter:
+    """Count queries on every database connection, installed via connection_created"""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(int(round(fraction * len(ordered))) - 1, 0))]
+
+
+def sentence(kind, index):
+    return f"Load test {kind} sentence number {index} for the study site."
+
+
+# Each scenario returns the (method, path, request kwargs) of every request to send.
+# setup() runs first, outside the timing, for scenarios that need rows to exist.
+
+def scenario_login(context, count):
+    body = {'username': context['username'], 'password': PASSWORD}
+    return [('POST', '/api/auth/login/', {'json': body, 'auth': False})] * count
+
+
+def scenario_register(context, count):
+    return [
+        ('POST', '/api/auth/register/', {'json': {
+            'username': f"bench-{context['run_id']}-{index}",
+            'email': f"bench-{context['run_id']}-{index}@example.com",
+            'password': PASSWORD,
+        }, 'auth': False})
+        for index in range(count)
+    ]
+
+
+def scenario_profile(context, count):
+    return [('GET', '/api/auth/profile/', {})] * count
+
+
+def scenario_tts(context, count):
+    return [('POST', '/api/text-to-speech/', {'json': {'text': sentence('tts', index), 'source_language': 'en'}})
+            for index in range(count)]
+
+
+def scenario_tts_stream(context, count):
+    return [('GET', '/api/text-to-speech/stream/', {'params': {'text': sentence('stream', index), 'source_language': 'en'}})
+            for index in range(count)]
+
+
+def scenario_tts_async(context, count):
+    return [('POST', '/api/text-to-speech/async/', {'json': {'text': sentence('async tts', index), 'source_language': 'en'}})
+            for index in range(count)]
+
+
+def scenario_translate(context, count):
+    return [('POST', '/api/translate/', {'json': {'text': sentence('translate', index), 'target_language': 'ko'}})
+            for index in range(count)]
+
+
+def scenario_translate_async(context, count):
+    return [('POST', '/api/translate/async/', {'json': {'text': sentence('async translate', index), 'target_language': 'ko'}})
+            for index in range(count)]
+
+
+def scenario_translate_batch(context, count):
+    return [('POST', '/api/translate/batch/', {'json': {
+        'segments': [sentence(f'batch {index}', segment) for segment in range(10)],
+        'target_language': 'ko',
+    }}) for index in range(count)]
+
+
+def scenario_provider_health(context, count):
+    return [('GET', '/api/providers/health/', {})] * count
+
+
+def scenario_history(context, count):
+    return [('GET', '/api/study/history/', {})] * count
+
+
+def scenario_save(context, count):
+    return [('POST', '/api/study/save/', {'json': {
+        'text': sentence('save', index % max(count // 2, 1)),  # Half are repeats, which update the existing row
+        'translation': 'translation',
+    }}) for index in range(count)]
+
+
+def scenario_import(context, count):
+    return [('POST', '/api/study/import/', {'json': {'items': [
+        {'text': sentence(f'import {index}', item), 'translation': 'translation'}
+        for item in range(IMPORT_ITEMS_PER_REQUEST)
+    ]}}) for index in range(count)]
+
+
+def setup_delete_selected(context, count):
+    from accounts.models import StudyHistory
+
+    StudyHistory.objects.import_items(context['user_id'], [
+        {'english_text': sentence('delete', index), 'korean_translation': ''} for index in range(count * 5)
+    ])
+    context['delete_ids'] = list(StudyHistory.objects.filter(
+        user_id=context['user_id'], english_text__startswith='Load test delete',
+    ).values_list('id', flat=True))
+
+
+def scenario_delete_selected(context, count):
+    ids = context['delete_ids']
+    return [('DELETE', '/api/study/delete-selected/', {'json': {'item_ids': ids[index * 5:index * 5 + 5]}})
+            for index in range(count)]
+
+
+def scenario_delete_all(context, count):
+    return [('DELETE', '/api/study/delete-all/', {})] * count
+
+
+def scenario_metrics(context, count):
+    return [('GET', '/metrics', {'auth': False})] * count
+
+
+# (name, URL name in api/urls.py, build requests, setup, share of --requests)
+SCENARIOS = [
+    ('login', 'user_login', scenario_login, None, 0.1),
+    ('register', 'user_register', scenario_register, None, 0.1),
+    ('profile', 'user_profile', scenario_profile, None, 1),
+    ('tts', 'text_to_speech', scenario_tts, None, 1),
+    ('tts_stream', 'text_to_speech_stream', scenario_tts_stream, None, 1),
+    ('tts_async', 'text_to_speech_async', scenario_tts_async, None, 1),
+    ('translate', 'translate_text', scenario_translate, None, 1),
+    ('translate_async', 'translate_text_async', scenario_translate_async, None, 1),
+    ('translate_batch', 'translate_batch', scenario_translate_batch, None, 1),
+    ('provider_health', 'provider_health', scenario_provider_health, None, 1),
+    ('study_save', 'save_study_item', scenario_save, None, 1),
+    ('study_import', 'import_study_history', scenario_import, None, 0.25),
+    ('study_history', 'get_study_history', scenario_history, None, 1),
+    ('study_delete_selected', 'delete_study_history_items', scenario_delete_selected, setup_delete_selected, 1),
+    ('study_delete_all', 'delete_all_study_history', scenario_delete_all, None, 1),
+    ('metrics', None, scenario_metrics, None, 1),
+]
+
+
+def check_coverage():
+    """Warn about routes in api/urls.py that no scenario drives"""
+    from api.urls import urlpatterns
+
+    covered = {url_name for name, url_name, build, setup, share in SCENARIOS}
+    for pattern in urlpatterns:
+        if pattern.name not in covered:
+            print(f"warning: no scenario for api/{pattern.pattern} ({pattern.name})", file=sys.stderr)
+
+
+def run_scenario(base_url, token, requests_to_send, concurrency, counter):
+    import requests as http
+
+    local = threading.local()
+
+    def send(request):
+        method, path, options = request
+        options = dict(options)
+        headers = {'Authorization': f'Token {token}'} if options.pop('auth', True) else {}
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = http.Session()
+        start = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, headers=headers, timeout=120, **options)
+            response.content  # Include the body, streamed audio in particular
+            ok = 200 <= response.status_code < 300
+        except http.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    queries_before = counter.count
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, requests_to_send))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(seconds for seconds, ok in results)
+    errors = sum(1 for seconds, ok in results if not ok)
+    return {
+        'requests': len(results),
+        'errors': errors,
+        'error_rate': round(errors / len(results), 4),
+        'throughput': round(len(results) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries_per_request': round((counter.count - queries_before) / len(results), 2),
+    }
+
+
+def report(name, result):
+    print(
+        f"{name:<22} {result['throughput']:8.1f} req/s  p50={result['p50_ms']:8.1f}  p95={result['p95_ms']:8.1f}  "
+        f"p99={result['p99_ms']:8.1f} ms  errors={result['error_rate'] * 100:5.1f}%  "
+        f"queries/req={result['queries_per_request']:6.2f}"
+    )
+
+
+def compare(results, baseline, tolerance):
+    """Return a description of every regression against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {result['p95_ms']} ms")
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput']} -> {result['throughput']} req/s")
+        if result['queries_per_request'] > base['queries_per_request'] + 0.5:
+            regressions.append(f"{name}: queries/request {base['queries_per_request']} -> {result['queries_per_request']}")
+        if result['error_rate'] > base['error_rate'] + tolerance * max(base['error_rate'], 0.01):
+            regressions.append(f"{name}: error rate {base['error_rate']} -> {result['error_rate']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight at once')
+    parser.add_argument('--threads', type=int, default=16, help='WSGI worker threads')
+    parser.add_argument('--latency', type=float, default=0.02, help='Stub provider latency (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of provider calls answered with 503')
+    parser.add_argument('--payload-bytes', type=int, default=16 * 1024, help='Size of stub audio responses')
+    parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='Run only these scenarios')
+    parser.add_argument('--save', type=Path, help='Write the results to this JSON file')
+    parser.add_argument('--compare', type=Path, help='Baseline JSON file to check the results against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown before failing')
+    args = parser.parse_args()
+
+    options = {name: getattr(args, name) for name in COMPARED_OPTIONS}
+    baseline = json.loads(args.compare.read_text(encoding='utf-8')) if args.compare else None
+    if baseline and baseline['options'] != options:
+        parser.error(f"baseline was recorded with different options: {baseline['options']}")
+
+    stub = StubServer(latency=args.latency, error_rate=args.error_rate, payload_bytes=args.payload_bytes, seed=1)
+    with tempfile.TemporaryDirectory(prefix='bench-endpoints-') as directory, stub:
+        directory = Path(directory)
+        configure_django(
+            ALLOWED_HOSTS=['*'],
+            # The project's SQLite options (journal mode, busy timeout) on a scratch file
+            DATABASES={'default': dict(project_setting('DATABASES')['default'], NAME=directory / 'db.sqlite3')},
+            CACHES=LOCMEM_CACHES,
+            PROVIDER_HTTP={'HOST_OVERRIDES': stub.host_overrides(), 'POOL_MAXSIZE': args.concurrency},
+            TTS_AUDIO_CACHE={'ENABLED': True, 'DIR': directory / 'audio_cache'},
+            METRICS={'ENABLED': True, 'DIRECTORY': directory / 'metrics'},
+            # Keep the background usage flush out of the per-request query counts
+            USAGE_METERING={'ENABLED': True, 'FLUSH_INTERVAL': 24 * 3600},
+        )
+        logging.disable(logging.CRITICAL)
+
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+        from django.core.wsgi import get_wsgi_application
+        from django.db.backends.signals import connection_created
+
+        from accounts.models import UserProfile
+        from api.auth import issue_token
+
+        call_command('migrate', verbosity=0)
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+
+        user = User.objects.create_user('bench-user', 'bench-user@example.com', PASSWORD)
+        UserProfile.objects.get_or_create(user=user)
+        context = {'username': user.username, 'user_id': user.id, 'run_id': int(time.time())}
+        token = issue_token(user)
+
+        check_coverage()
+        server = PooledWSGIServer(('127.0.0.1', free_port()), args.threads)
+        server.set_app(get_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+        print(f"{args.requests} requests per endpoint, concurrency {args.concurrency}, "
+              f"provider latency {args.latency * 1000:.0f} ms, provider errors {args.error_rate * 100:.0f}%")
+        results = {}
+        try:
+            for name, url_name, build, setup, share in SCENARIOS:
+                if args.only and name not in args.only:
+                    continue
+                count = max(int(args.requests * share), 1)
+                if setup:
+                    setup(context, count)
+                results[name] = run_scenario(base_url, token, build(context, count), args.concurrency, counter)
+                report(name, results[name])
+        finally:
+            server.shutdown()
+            server.executor.shutdown(wait=False)
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(json.dumps({
+            'options': options,
+            'python': platform.python_version(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'scenarios': results,
+        }, indent=2) + '\n', encoding='utf-8')
+        print(f"Saved results to {args.save}")
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance * 100:.0f}%)")
+
+
+if __name__ == '__main__':
+    main()
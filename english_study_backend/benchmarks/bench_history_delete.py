@@ -0,0 +1,111 @@
+"""
+Cost of deleting selected study history items.
+
+Fills a scratch SQLite database with one user's history and deletes a
+selection of it twice: with the previous loop (one ranged count and one
+delete per timestamp id) and with StudyHistory.objects.delete_selected
+over primary keys. Reports time and the number of SQL queries for each.
+
+    python -m benchmarks.bench_history_delete --rows 10000 --selected 1000
+"""
+import argparse
+import datetime
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.setup import configure_django
+
+
+def legacy_delete(StudyHistory, user, item_ids):
+    """The pre-primary-key loop: ids were created_at as JS timestamps"""
+    deleted_count = 0
+    for item_id in item_ids:
+        timestamp = datetime.datetime.fromtimestamp(item_id / 1000, tz=datetime.timezone.utc)
+        items = StudyHistory.objects.filter(
+            user=user,
+            created_at__gte=timestamp - datetime.timedelta(seconds=1),
+            created_at__lte=timestamp + datetime.timedelta(seconds=1),
+        )
+        count = items.count()
+        if count > 0:
+            items.delete()
+            deleted_count += count
+    return deleted_count
+
+
+def fill_history(StudyHistory, hash_study_text, user, rows):
+    # One row per second, so the legacy one-second window matches a single item
+    start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    StudyHistory.objects.bulk_create(
+        (StudyHistory(user=user, english_text=f"history sentence {index}",
+                      text_hash=hash_study_text(f"history sentence {index}"))
+         for index in range(rows)),
+        batch_size=5000,
+    )
+    items = list(StudyHistory.objects.filter(user=user).order_by('id'))
+    for index, item in enumerate(items):
+        item.created_at = start + datetime.timedelta(seconds=index * 3)
+    StudyHistory.objects.bulk_update(items, ['created_at'], batch_size=5000)
+
+
+def measure(connection, call):
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        deleted = call()
+        elapsed = (time.perf_counter() - start) * 1000
+    return deleted, elapsed, len(queries.captured_queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--selected', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_django(DATABASES={'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': str(Path(directory) / 'bench.sqlite3'),
+        }})
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+        from django.db import connection
+
+        from accounts.models import StudyHistory, hash_study_text
+
+        call_command('migrate', verbosity=0)
+        user = User.objects.create_user('bench')
+        step = max(1, args.rows // args.selected)
+
+        fill_history(StudyHistory, hash_study_text, user, args.rows)
+        selected = StudyHistory.objects.filter(user=user).order_by('id')[::step][:args.selected]
+        timestamp_ids = [int(item.created_at.timestamp() * 1000) for item in selected]
+        legacy = measure(connection, lambda: legacy_delete(StudyHistory, user, timestamp_ids))
+
+        StudyHistory.objects.all().delete()
+        fill_history(StudyHistory, hash_study_text, user, args.rows)
+        selected = StudyHistory.objects.filter(user=user).order_by('id')[::step][:args.selected]
+        primary_keys = [item.id for item in selected]
+        set_based = measure(connection, lambda: StudyHistory.objects.delete_selected(user.id, primary_keys))
+
+        StudyHistory.objects.all().delete()
+        fill_history(StudyHistory, hash_study_text, user, args.rows)
+        selected = StudyHistory.objects.filter(user=user).order_by('id')[::step][:args.selected]
+        timestamp_ids = [int(item.created_at.timestamp() * 1000) for item in selected]
+        compatible = measure(connection, lambda: StudyHistory.objects.delete_selected(user.id, timestamp_ids))
+
+        print(f"{args.selected} of {args.rows} rows selected")
+        print(f"{'':<24}{'deleted':>8}  {'time':>11}  {'queries':>7}")
+        for label, (deleted, elapsed, queries) in (
+            ('legacy loop', legacy),
+            ('delete_selected (pk)', set_based),
+            ('delete_selected (ms id)', compatible),
+        ):
+            print(f"{label:<24}{deleted:>8}  {elapsed:>8.1f} ms  {queries:>7}")
+
+
+if __name__ == '__main__':
+    main()
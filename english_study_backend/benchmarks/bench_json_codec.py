@@ -0,0 +1,110 @@
+"""
+Time JSON encoding of typical API responses and decoding of request bodies.
+
+Encodes a TTS response (base64 audio of --audio-kb) and study history pages
+of 50 and 200 items, shaped like the views build them, with
+django.http.JsonResponse and with api.json_codec.JsonResponse on each
+backend. Also decodes a guest history import body of --import-items items.
+
+    python -m benchmarks.bench_json_codec --audio-kb 300 --repeat 200
+"""
+import argparse
+import base64
+import datetime
+import json
+import os
+import statistics
+import time
+
+from benchmarks.setup import configure_django
+
+
+def tts_payload(audio_kb):
+    return {
+        'success': True,
+        'service': 'google',
+        'audio_data': base64.b64encode(os.urandom(audio_kb * 1024)).decode('utf-8'),
+        'cached': False,
+        'language': 'en',
+    }
+
+
+def history_payload(items):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        'success': True,
+        'history': [{
+            'id': index + 1,
+            'created_at': (now - datetime.timedelta(minutes=index)).isoformat(),
+            'text': f"History sentence number {index} used for daily conversation practice.",
+            'translation': f"일상 회화 연습에 사용하는 {index}번째 학습 문장입니다.",
+            'target_language': 'ko',
+            'source_language': 'en',
+            'tts_service': 'google',
+            'voice_speed': 'normal',
+            'accessed_count': index % 7 + 1,
+        } for index in range(items)],
+        'has_more': True,
+        'next_cursor': 'MjAyNi0xMC0xOFQwNzoxNjozOC40NTgyMTgrMDA6MDB8MTIz',
+    }
+
+
+def time_call(call, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--audio-kb', type=int, default=300, help='Size of the synthesized clip before base64')
+    parser.add_argument('--import-items', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    configure_django()
+    from django.http import JsonResponse as DjangoJsonResponse
+    from django.test import override_settings
+
+    from api import json_codec
+
+    if json_codec.orjson is None:
+        print("orjson is not installed; the 'orjson' rows use the stdlib encoder")
+
+    payloads = [
+        (f'TTS response ({args.audio_kb} KB audio)', tts_payload(args.audio_kb)),
+        ('history page (50 items)', history_payload(50)),
+        ('history page (200 items)', history_payload(200)),
+    ]
+    print(f"{'response':<30} {'django JsonResponse':>20} {'codec, json':>12} {'codec, orjson':>14} {'body KB (json/orjson)':>22}")
+    for label, payload in payloads:
+        django_ms = time_call(lambda: DjangoJsonResponse(payload), args.repeat)
+        sizes = []
+        timings = []
+        for backend in ('json', 'orjson'):
+            with override_settings(JSON_CODEC={'BACKEND': backend}):
+                timings.append(time_call(lambda: json_codec.JsonResponse(payload), args.repeat))
+                sizes.append(len(json_codec.JsonResponse(payload).content) / 1024)
+        print(f"{label:<30} {django_ms:>17.3f} ms {timings[0]:>9.3f} ms {timings[1]:>11.3f} ms "
+              f"{sizes[0]:>10.1f} / {sizes[1]:.1f}")
+
+    body = json.dumps({'items': [
+        {'text': f"Guest sentence {index} saved before signing in.", 'translation': f"{index}번째 문장",
+         'target_language': 'ko', 'source_language': 'en'}
+        for index in range(args.import_items)
+    ]}).encode('utf-8')
+    print(f"\n{'request body':<30} {'json.loads':>20} {'codec, json':>12} {'codec, orjson':>14}")
+    stdlib_ms = time_call(lambda: json.loads(body), args.repeat // 10 or 1)
+    timings = []
+    for backend in ('json', 'orjson'):
+        with override_settings(JSON_CODEC={'BACKEND': backend}):
+            timings.append(time_call(lambda: json_codec.loads(body), args.repeat // 10 or 1))
+    print(f"{f'import ({args.import_items} items, {len(body) // 1024} KB)':<30} {stdlib_ms:>17.3f} ms "
+          f"{timings[0]:>9.3f} ms {timings[1]:>11.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
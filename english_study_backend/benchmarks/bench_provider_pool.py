@@ -0,0 +1,71 @@
+"""
+Compare bare requests calls with the pooled provider client.
+
+Runs the same sequence of free Google Translate calls against the local stub
+server twice: once with a fresh requests.get per call (a new TCP connection
+each time, as the views used to do) and once through api.provider_client.
+
+    python -m benchmarks.bench_provider_pool --requests 500
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+from benchmarks.setup import configure_django
+from benchmarks.stub_server import StubServer
+
+TRANSLATE_URL = 'https://translate.googleapis.com/translate_a/single?client=gtx&sl=en&tl=ko&dt=t&q=hello'
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run(label, call, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = call()
+        response.content
+        samples.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{label:<22} p50={statistics.median(samples):6.3f} ms  "
+        f"p95={percentile(samples, 0.95):6.3f} ms  mean={statistics.mean(samples):6.3f} ms"
+    )
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.0, help='Stub server delay per response (seconds)')
+    args = parser.parse_args()
+
+    with StubServer(latency=args.latency) as server:
+        configure_django(PROVIDER_HTTP={'HOST_OVERRIDES': server.host_overrides()})
+        from api import provider_client
+
+        bare_url = provider_client.resolve_url(TRANSLATE_URL)
+        connections_before = server.config.connection_count
+        bare_p50 = run('bare requests.get', lambda: requests.get(bare_url, timeout=10), args.requests)
+        bare_connections = server.config.connection_count - connections_before
+
+        connections_before = server.config.connection_count
+        pooled_p50 = run(
+            'pooled provider_client',
+            lambda: provider_client.get(provider_client.GOOGLE_TRANSLATE_FREE, TRANSLATE_URL),
+            args.requests,
+        )
+        pooled_connections = server.config.connection_count - connections_before
+        provider_client.close_sessions()
+
+    print(f"TCP connections opened: bare={bare_connections} pooled={pooled_connections}")
+    print(f"p50 improvement: {(1 - pooled_p50 / bare_p50) * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
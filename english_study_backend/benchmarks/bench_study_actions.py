@@ -0,0 +1,170 @@
+"""
+Count requests and bytes per study action as the browser frontend sees them.
+
+Replays what script.js does for a signed-in user, against the local stub
+providers: translate a sentence, listen to it, save it (which reloads the
+history), and every fifth action delete two items (which reloads it
+again). A small browser model sits in front of the test client:
+
+- every request carries an Authorization header, so it needs a CORS
+  preflight unless one for that URL is cached (Access-Control-Max-Age,
+  five seconds when absent, as in Chrome)
+- GET responses with an ETag are kept and revalidated with If-None-Match
+- Accept-Encoding is "gzip, deflate, br"
+
+The session runs twice: with the previous response handling (no preflight
+caching, compression or conditional GET middleware) and with the current
+settings. Bytes include the status line and headers.
+
+    python -m benchmarks.bench_study_actions --actions 50 --history 100 --think-time 20
+"""
+import argparse
+import gzip
+import json
+import logging
+
+from benchmarks.bench_translate_batch import LOCMEM_CACHES
+from benchmarks.setup import configure_django
+from benchmarks.stub_server import StubServer
+
+ORIGIN = 'http://localhost:8001'
+DEFAULT_PREFLIGHT_MAX_AGE = 5
+NEW_MIDDLEWARE = ('api.middleware.CompressionMiddleware', 'api.middleware.ConditionalGetMiddleware')
+
+
+class Browser:
+    """Just enough of a browser's CORS preflight cache and HTTP cache"""
+
+    def __init__(self, client, token):
+        self.client = client
+        self.token = token
+        self.clock = 0.0
+        self.preflights = {}  # (method, path) -> expiry time
+        self.http_cache = {}  # path -> (etag, body)
+        self.requests = 0
+        self.preflight_requests = 0
+        self.bytes_up = 0
+        self.bytes_down = 0
+
+    def _send(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        self.requests += 1
+        self.bytes_up += len(f"{method} {path} HTTP/1.1\r\n") + sum(len(f"{name}: {value}\r\n") for name, value in headers.items())
+        self.bytes_up += len(body or b'')
+        extra = {f"HTTP_{name.upper().replace('-', '_')}": value for name, value in headers.items()
+                 if name != 'Content-Type'}
+        response = self.client.generic(method, path, body or b'', content_type=headers.get('Content-Type'), **extra)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        self.bytes_down += len(f"HTTP/1.1 {response.status_code} {response.reason_phrase}\r\n")
+        self.bytes_down += sum(len(f"{name}: {value}\r\n") for name, value in response.items()) + len(content)
+        return response, content
+
+    def fetch(self, method, path, payload=None):
+        """Send a request the way fetch() in script.js does; return the decoded JSON or raw bytes"""
+        if self.preflights.get((method, path), -1) <= self.clock:
+            self.preflight_requests += 1
+            response, content = self._send('OPTIONS', path, headers={
+                'Origin': ORIGIN,
+                'Access-Control-Request-Method': method,
+                'Access-Control-Request-Headers': 'authorization,content-type',
+            })
+            max_age = int(response.get('Access-Control-Max-Age', DEFAULT_PREFLIGHT_MAX_AGE))
+            self.preflights[(method, path)] = self.clock + max_age
+
+        headers = {'Origin': ORIGIN, 'Authorization': f'Token {self.token}', 'Accept-Encoding': 'gzip, deflate, br'}
+        body = None
+        if payload is not None:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(payload).encode('utf-8')
+        cached = self.http_cache.get(path) if method == 'GET' else None
+        if cached:
+            headers['If-None-Match'] = cached[0]
+        response, content = self._send(method, path, body, headers)
+        if response.get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+        elif response.get('Content-Encoding') == 'br':
+            import brotli  # Only sent when the server has it installed
+            content = brotli.decompress(content)
+        if response.status_code == 304:
+            return json.loads(cached[1])
+        if method == 'GET' and response.has_header('ETag'):
+            self.http_cache[path] = (response['ETag'], content)
+        if response.get('Content-Type', '').startswith('application/json'):
+            return json.loads(content)
+        return content
+
+
+def run_session(token, actions, think_time):
+    from django.test import Client
+
+    browser = Browser(Client(), token)
+    browser.fetch('GET', '/api/auth/profile/')
+    history = browser.fetch('GET', '/api/study/history/')['history']
+    for index in range(actions):
+        browser.clock += think_time
+        text = f"Study action sentence number {index} about daily conversation practice."
+        translation = browser.fetch('POST', '/api/translate/', {
+            'text': text, 'service': 'auto', 'target_language': 'ko', 'source_language': 'en',
+        })['translation']
+        browser.fetch('POST', '/api/text-to-speech/stream/', {
+            'text': text, 'speed': 'normal', 'source_language': 'en', 'service': 'auto',
+        })
+        browser.fetch('POST', '/api/study/save/', {
+            'text': text, 'translation': translation, 'target_language': 'ko', 'source_language': 'en',
+        })
+        history = browser.fetch('GET', '/api/study/history/')['history']
+        if index % 5 == 4:
+            browser.fetch('DELETE', '/api/study/delete-selected/', {'item_ids': [item['id'] for item in history[-2:]]})
+            history = browser.fetch('GET', '/api/study/history/')['history']
+    return browser
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--actions', type=int, default=50)
+    parser.add_argument('--history', type=int, default=100, help='Items already in the history')
+    parser.add_argument('--think-time', type=float, default=20, help='Seconds between actions')
+    args = parser.parse_args()
+
+    with StubServer() as stub:
+        configure_django(
+            ALLOWED_HOSTS=['*'],
+            DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+            CACHES=LOCMEM_CACHES,
+            PROVIDER_HTTP={'HOST_OVERRIDES': stub.host_overrides()},
+            METRICS={'ENABLED': False},
+        )
+        logging.disable(logging.CRITICAL)
+
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+        from django.test import override_settings
+
+        from accounts.models import StudyHistory, UserProfile
+        from api.auth import issue_token
+
+        call_command('migrate', verbosity=0)
+        previous = override_settings(
+            MIDDLEWARE=[name for name in settings.MIDDLEWARE if name not in NEW_MIDDLEWARE],
+            CORS=dict(settings.CORS, PREFLIGHT_MAX_AGE=0),
+        )
+
+        print(f"{args.actions} study actions, {args.history} items of existing history, {args.think_time:.0f} s apart")
+        print(f"{'':<9} {'requests/action':>16} {'preflights/action':>18} {'KB down/action':>15} {'KB up/action':>13}")
+        for label, overrides in (('previous', previous), ('current', override_settings())):
+            user = User.objects.create_user(f'bench-{label}')
+            UserProfile.objects.get_or_create(user=user)
+            StudyHistory.objects.import_items(user.id, [
+                {'english_text': f"Existing history sentence {index} with a longer example.",
+                 'korean_translation': f"기존 학습 문장 {index} 번째 예문입니다."}
+                for index in range(args.history)
+            ])
+            with overrides:
+                browser = run_session(issue_token(user), args.actions, args.think_time)
+            print(f"{label:<9} {browser.requests / args.actions:>16.2f} {browser.preflight_requests / args.actions:>18.2f} "
+                  f"{browser.bytes_down / 1024 / args.actions:>15.1f} {browser.bytes_up / 1024 / args.actions:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Save latency of study history as one user's history grows.
+
+Fills a scratch SQLite database with one user's history at increasing
+sizes and times the previous save path (an unindexed english_text lookup,
+then a read-modify-write) against StudyHistory.objects.upsert, for texts
+that already exist and for new ones.
+
+    python -m benchmarks.bench_study_save --sizes 1000 10000 100000
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.setup import configure_django
+
+
+def legacy_save(StudyHistory, user, text):
+    existing_item = StudyHistory.objects.filter(user=user, english_text=text).first()
+    if existing_item:
+        existing_item.accessed_count += 1
+        existing_item.save()
+    else:
+        StudyHistory.objects.create(user=user, english_text=text)
+
+
+def time_calls(call, texts):
+    samples = []
+    for text in texts:
+        start = time.perf_counter()
+        call(text)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_django(DATABASES={'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': str(Path(directory) / 'bench.sqlite3'),
+        }})
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+
+        from accounts.models import StudyHistory, hash_study_text
+
+        call_command('migrate', verbosity=0)
+        user = User.objects.create_user('bench')
+        rows = 0
+        run = 0
+        print(f"{'rows':>8}  {'legacy existing':>16}  {'upsert existing':>16}  {'legacy new':>11}  {'upsert new':>11}")
+        for size in sorted(args.sizes):
+            StudyHistory.objects.bulk_create(
+                (StudyHistory(user=user, english_text=f"history sentence {index}",
+                              text_hash=hash_study_text(f"history sentence {index}"))
+                 for index in range(rows, size)),
+                batch_size=5000,
+            )
+            rows = size
+            # Existing texts spread over the whole history, new texts unique per run
+            existing = [f"history sentence {index * size // args.samples}" for index in range(args.samples)]
+            run += 1
+            new_legacy = [f"new legacy sentence {run}-{index}" for index in range(args.samples)]
+            new_upsert = [f"new upsert sentence {run}-{index}" for index in range(args.samples)]
+
+            legacy_existing = time_calls(lambda text: legacy_save(StudyHistory, user, text), existing)
+            upsert_existing = time_calls(lambda text: StudyHistory.objects.upsert(user, text), existing)
+            legacy_new = time_calls(lambda text: legacy_save(StudyHistory, user, text), new_legacy)
+            upsert_new = time_calls(lambda text: StudyHistory.objects.upsert(user, text), new_upsert)
+            # The new rows are cleaned up so every size starts from the same history
+            StudyHistory.objects.filter(english_text__startswith='new ').delete()
+            print(f"{size:>8}  {legacy_existing:>13.3f} ms  {upsert_existing:>13.3f} ms  "
+                  f"{legacy_new:>8.3f} ms  {upsert_new:>8.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
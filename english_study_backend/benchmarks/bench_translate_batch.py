@@ -0,0 +1,98 @@
+"""
+Compare one batch translation request with one request per sentence.
+
+Translates the same sentences against the local stub providers twice with a
+cold translation cache: once as separate POST /api/translate/ requests and
+once as a single POST /api/translate/batch/. Also times translate_segments
+directly for the keyed providers (official Google v2 and Groq), which a
+guest request never reaches.
+
+    python -m benchmarks.bench_translate_batch --sentences 500 --latency 0.02
+"""
+import argparse
+import json
+import time
+from types import SimpleNamespace
+
+from benchmarks.setup import configure_django
+from benchmarks.stub_server import StubServer
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'translations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bench-translations',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'providers': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-providers'},
+}
+
+
+def make_sentences(count):
+    # Every tenth sentence repeats an earlier one, as word lists and history do
+    return [f"Benchmark sentence number {index % (count - count // 10)} is here." for index in range(count)]
+
+
+def report(label, seconds, sentences, upstream_calls):
+    print(f"{label:<28} {seconds * 1000:9.1f} ms  {sentences / seconds:9.1f} sentences/s  upstream calls={upstream_calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sentences', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02, help='Stub server delay per response (seconds)')
+    args = parser.parse_args()
+
+    sentences = make_sentences(args.sentences)
+
+    with StubServer(latency=args.latency) as server:
+        configure_django(
+            ALLOWED_HOSTS=['*'],
+            CACHES=LOCMEM_CACHES,
+            PROVIDER_HTTP={'HOST_OVERRIDES': server.host_overrides()},
+        )
+        from django.core.cache import caches
+        from django.test import Client
+
+        from api.batch_views import translate_segments
+
+        client = Client()
+        translations = caches['translations']
+
+        translations.clear()
+        calls_before = server.config.request_count
+        start = time.perf_counter()
+        for sentence in sentences:
+            response = client.post('/api/translate/', json.dumps({'text': sentence, 'target_language': 'ko'}),
+                                   content_type='application/json')
+            assert response.status_code == 200
+        report('one request per sentence', time.perf_counter() - start, len(sentences),
+               server.config.request_count - calls_before)
+
+        translations.clear()
+        calls_before = server.config.request_count
+        start = time.perf_counter()
+        response = client.post('/api/translate/batch/', json.dumps({'segments': sentences, 'target_language': 'ko'}),
+                               content_type='application/json')
+        assert response.status_code == 200 and len(response.json()['translations']) == len(sentences)
+        report('batch (free Google)', time.perf_counter() - start, len(sentences),
+               server.config.request_count - calls_before)
+
+        for service, profile in [
+            ('google', SimpleNamespace(groq_api_key='', google_translate_api_key='bench-key',
+                                       preferred_translation_service='google')),
+            ('groq', SimpleNamespace(groq_api_key='bench-key', google_translate_api_key='',
+                                     preferred_translation_service='groq')),
+        ]:
+            translations.clear()
+            unique = list(dict.fromkeys(sentences))
+            calls_before = server.config.request_count
+            start = time.perf_counter()
+            results = translate_segments(unique, service, 'ko', 'auto', profile)
+            assert all(used_service != 'basic' for _, used_service, _ in results.values())
+            report(f'batch ({service}, keyed)', time.perf_counter() - start, len(sentences),
+                   server.config.request_count - calls_before)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def project_setting(name):
+    """Return a project setting as configured, before configure_django() overrides it"""
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'english_study_backend.settings')
+
+    from django.conf import settings
+    return getattr(settings, name)
+
+
+def configure_django(**overrides):
+    """Set up Django with the project settings plus overrides"""
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'english_study_backend.settings')
+
+    import django
+    from django.conf import settings
+
+    # Before setup, so database and cache connections see the overrides
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    django.setup()
@@ -0,0 +1,174 @@
+"""
+Local stub HTTP server imitating the upstream TTS and translation providers.
+
+One server answers every provider path, so HOST_OVERRIDES can point all
+provider hosts at it:
+
+    GET  /translate_a/single              free Google Translate / detection
+    GET  /translate_tts                   free Google TTS
+    GET  /language/translate/v2           official Google Translate
+    POST /language/translate/v2           official Google Translate (form body)
+    POST /v1/text-to-speech/<voice>[/stream]  ElevenLabs
+    POST /v1/text:synthesize              Google Cloud TTS
+    POST /openai/v1/chat/completions      Groq
+"""
+import base64
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PROVIDER_HOSTS = [
+    'translate.googleapis.com',
+    'translate.google.com',
+    'translation.googleapis.com',
+    'api.elevenlabs.io',
+    'texttospeech.googleapis.com',
+    'api.groq.com',
+]
+
+
+class StubConfig:
+    def __init__(self, latency=0.0, error_rate=0.0, payload_bytes=16 * 1024, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.payload_bytes = payload_bytes
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.connection_count = 0
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real providers
+    # Headers and body are written separately; without TCP_NODELAY kept-alive
+    # responses stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.config.lock:
+            self.server.config.connection_count += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload, status=200):
+        self._send(status, json.dumps(payload).encode('utf-8'), 'application/json')
+
+    def _audio(self):
+        return b'\xff\xfb' + b'\x00' * max(self.server.config.payload_bytes - 2, 0)
+
+    def _should_fail(self):
+        config = self.server.config
+        with config.lock:
+            config.request_count += 1
+            failed = config.random.random() < config.error_rate
+        if config.latency:
+            time.sleep(config.latency)
+        if failed:
+            self._send_json({'error': 'stub failure'}, status=503)
+        return failed
+
+    def do_GET(self):
+        if self._should_fail():
+            return
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        texts = query.get('q', [''])
+        if parts.path == '/translate_a/single':
+            self._send_json([[[f"[{query.get('tl', ['ko'])[0]}] {texts[0]}", texts[0], None, None]], None, 'en'])
+        elif parts.path == '/translate_tts':
+            self._send(200, self._audio(), 'audio/mpeg')
+        elif parts.path == '/language/translate/v2':
+            target = query.get('target', ['ko'])[0]
+            self._send_json({'data': {'translations': [{'translatedText': f"[{target}] {text}"} for text in texts]}})
+        else:
+            self._send_json({'error': 'not found'}, status=404)
+
+    def do_POST(self):
+        body = self._read_body()
+        if self._should_fail():
+            return
+        path = urlsplit(self.path).path
+        if path.startswith('/v1/text-to-speech/'):
+            self._send(200, self._audio(), 'audio/mpeg')
+        elif path == '/v1/text:synthesize':
+            self._send_json({'audioContent': base64.b64encode(self._audio()).decode('ascii')})
+        elif path == '/language/translate/v2':
+            form = parse_qs(body.decode('utf-8'))
+            target = form.get('target', ['ko'])[0]
+            self._send_json({'data': {'translations': [{'translatedText': f"[{target}] {text}"} for text in form.get('q', [])]}})
+        elif path == '/openai/v1/chat/completions':
+            prompt = json.loads(body or b'{}').get('messages', [{}])[-1].get('content', '')
+            self._send_json({'choices': [{'message': {'content': prompt.rsplit('\n\n', 1)[-1]}}]})
+        else:
+            self._send_json({'error': 'not found'}, status=404)
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections under benchmark bursts
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class StubServer:
+    """Run StubHandler on a background thread"""
+
+    def __init__(self, host='127.0.0.1', port=0, **config):
+        self.httpd = StubHTTPServer((host, port), StubHandler)
+        self.httpd.config = StubConfig(**config)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def config(self):
+        return self.httpd.config
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def host_overrides(self):
+        """Return a PROVIDER_HTTP['HOST_OVERRIDES'] mapping onto this server"""
+        return {host: self.base_url for host in PROVIDER_HOSTS}
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of delay per response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--payload-bytes', type=int, default=16 * 1024, help='Size of generated audio')
+    args = parser.parse_args()
+
+    with StubServer(port=args.port, latency=args.latency, error_rate=args.error_rate,
+                    payload_bytes=args.payload_bytes) as server:
+        print(f"Stub providers listening on {server.base_url}")
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            pass
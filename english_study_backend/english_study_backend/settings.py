@@ -43,12 +43,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'api.middleware.CorsMiddleware',  # Add CORS middleware first
+    'api.middleware.RequestLogMiddleware',  # First, so request timings cover every middleware
+    'api.middleware.ProfilingMiddleware',  # Opt-in, see REQUEST_PROFILING
+    'api.middleware.CorsMiddleware',  # Answers preflights before the rest of the stack runs
+    'api.middleware.CompressionMiddleware',  # Outside ConditionalGetMiddleware, so ETags are computed on the uncompressed body
+    'api.middleware.ConditionalGetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.TokenAuthMiddleware',  # Signed API tokens; after AuthenticationMiddleware
+    'api.middleware.ReplicaPinningMiddleware',  # Read-your-writes with a replica; after TokenAuthMiddleware
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -72,17 +78,123 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'english_study_backend.wsgi.application'
 
+# Serve /api/text-to-speech/ and /api/translate/ with the async views.
+# Enable when running under an ASGI server (e.g. uvicorn english_study_backend.asgi:application)
+ASYNC_PROVIDER_VIEWS = os.environ.get('DJANGO_ASYNC_PROVIDER_VIEWS', '').lower() in ('1', 'true', 'yes')
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite by default. DJANGO_DB_ENGINE=postgresql (requires psycopg) selects
+# PostgreSQL configured from the DJANGO_DB_* variables; DJANGO_DB_REPLICA_HOST
+# adds a read replica that api.db_router sends study history reads to.
+
+DB_ENGINE = os.environ.get('DJANGO_DB_ENGINE', 'sqlite').lower()
+# Seconds a connection is reused; 0 closes it after each request, which Django
+# recommends under ASGI where requests do not keep to one thread
+DB_CONN_MAX_AGE = int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', '0' if ASYNC_PROVIDER_VIEWS else '60'))
+
+if DB_ENGINE in ('postgres', 'postgresql'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DJANGO_DB_NAME', 'english_study'),
+            'USER': os.environ.get('DJANGO_DB_USER', 'english_study'),
+            'PASSWORD': os.environ.get('DJANGO_DB_PASSWORD', ''),
+            'HOST': os.environ.get('DJANGO_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DJANGO_DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': 5,
+                'options': '-c statement_timeout=30000',  # Milliseconds
+            },
+        }
+    }
+    if os.environ.get('DJANGO_DB_REPLICA_HOST'):
+        DATABASES['replica'] = dict(
+            DATABASES['default'],
+            HOST=os.environ['DJANGO_DB_REPLICA_HOST'],
+            PORT=os.environ.get('DJANGO_DB_REPLICA_PORT', DATABASES['default']['PORT']),
+            TEST={'MIRROR': 'default'},
+        )
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DJANGO_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Take the write lock at BEGIN so a busy writer waits for the
+                # timeout instead of failing with "database is locked"
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,  # Seconds to wait for the write lock
+                # WAL lets history reads run while a save is writing
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA mmap_size=134217728;'  # 128 MB
+                    'PRAGMA cache_size=-16000;'  # 16 MB per connection
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+        }
+    }
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
 
-DATABASES = {
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# The translations cache must be shared by every worker process. Its stale
+# entry refresh is single-flight across processes only on Redis or Memcached
+# (set DJANGO_REDIS_URL below); on the file cache it is single-flight per process
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'translations': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'translations',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
 
+# Counters shared by every worker process need atomic incr/add, which only
+# Redis and Memcached provide (api/shared_cache.py); set DJANGO_REDIS_URL,
+# e.g. redis://127.0.0.1:6379/0, to use Redis for them
+REDIS_URL = os.environ.get('DJANGO_REDIS_URL')
+if REDIS_URL:
+    CACHES['translations'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'translations',
+        'TIMEOUT': None,
+    }
+    # Circuit breaker state and counters; without it each process keeps its own
+    CACHES['providers'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'providers',
+    }
+    # Users recently pinned to the primary database (api/db_router.py)
+    CACHES['replica_pins'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'replica_pins',
+    }
+    # Per-user daily character counters read by quota checks; without it
+    # each process keeps its own and re-reads UserProfile every FLUSH_INTERVAL
+    CACHES['usage'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'usage',
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,3 +240,253 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Session settings
 SESSION_COOKIE_AGE = 86400  # 24 hours
 SESSION_SAVE_EVERY_REQUEST = True
+
+# TTS audio cache
+# Synthesized clips are cached in memory and on disk so replays skip the provider
+TTS_AUDIO_CACHE = {
+    'ENABLED': True,
+    'DIR': BASE_DIR / 'audio_cache',
+    'MAX_DISK_BYTES': 512 * 1024 * 1024,  # 512 MB
+    'MAX_MEMORY_BYTES': 32 * 1024 * 1024,  # 32 MB per worker process
+    'MAX_MEMORY_ITEM_BYTES': 1024 * 1024,  # Larger clips are served from disk only
+}
+
+# Translation result cache (uses the 'translations' entry in CACHES)
+TRANSLATION_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'translations',
+    'TTL': 7 * 24 * 3600,  # Fresh for a week
+    'STALE_TTL': 24 * 3600,  # Then served stale for a day while refreshing
+    'MAX_ENTRY_BYTES': 64 * 1024,
+    'ISOLATE_API_KEY_RESULTS': False,  # True keeps each user's keyed results private
+}
+
+# Upstream provider HTTP client
+# One pooled keep-alive session per provider host; timeouts are (connect, read) seconds
+PROVIDER_HTTP = {
+    'POOL_CONNECTIONS': 4,
+    'POOL_MAXSIZE': 32,  # Kept-alive connections per host
+    'ASYNC_MAX_CONNECTIONS': 500,  # In-flight upstream requests per ASGI worker
+    'DEFAULT_TIMEOUT': (5, 30),
+    'TIMEOUTS': {
+        'elevenlabs': (5, 30),
+        'google_cloud_tts': (5, 30),
+        'google_tts': (5, 15),
+        'groq': (5, 30),
+        'google_translate': (5, 15),
+        'google_translate_free': (5, 10),
+        'language_detect': (3, 5),
+    },
+    # Point provider hosts elsewhere, e.g. {'api.groq.com': 'http://127.0.0.1:8765'}
+    'HOST_OVERRIDES': {},
+}
+
+# Provider fallback execution
+# Each provider gets an equal share of the time left in the deadline before
+# the next one starts, so the free Google tier is always tried
+# 'sequential': no duplicate requests
+# 'hedged': resend a free provider's request still running after HEDGE_DELAY seconds
+# Hedging costs extra upstream calls and holds a thread per abandoned attempt;
+# providers on the user's own (paid) API key are never hedged
+PROVIDER_HEDGING = {
+    'MODE': 'sequential',
+    'HEDGE_DELAY': 2.0,
+    'TTS_DEADLINE': 20.0,  # Seconds before falling back to browser TTS
+    'TRANSLATION_DEADLINE': 15.0,  # Seconds before falling back to the basic dictionary
+    'MAX_WORKERS': 64,
+}
+
+# Provider circuit breakers (state is shared through the 'providers' entry in CACHES
+# when it is Redis or Memcached, and kept per process otherwise)
+PROVIDER_CIRCUIT_BREAKER = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'providers',
+    'WINDOW_SECONDS': 60,
+    'MIN_REQUESTS': 5,  # Calls in the window before the error rate counts
+    'ERROR_RATE_THRESHOLD': 0.5,
+    'TIMEOUT_THRESHOLD': 3,  # Timeouts in the window that open the breaker
+    'KEY_FAILURE_THRESHOLD': 3,  # 401/403/429 responses that open a key's breaker
+    'OPEN_SECONDS': 30,  # Time before a half-open probe is allowed
+    'PROBE_TIMEOUT': 35,
+    'LOCAL_MAX_ENTRIES': 10000,  # Per-process breaker cache size without Redis
+}
+
+# In-process language detection for TTS requests with source_language 'auto'
+LANGUAGE_DETECTION = {
+    'ENABLED': True,
+    'MIN_CONFIDENCE': 0.75,  # Below this the remote Google detector is asked
+    'REMOTE_FALLBACK': True,
+}
+
+# POST /api/translate/batch/ limits and per-provider chunk sizes
+TRANSLATION_BATCH = {
+    'MAX_SEGMENTS': 1000,
+    'MAX_SEGMENT_CHARS': 5000,
+    'GOOGLE_OFFICIAL_SEGMENTS': 128,
+    'GOOGLE_OFFICIAL_CHARS': 30000,
+    'GROQ_SEGMENTS': 40,
+    'GROQ_CHARS': 6000,
+    'GOOGLE_FREE_ENCODED_CHARS': 6000,  # Percent-encoded length of the free endpoint's q parameter
+}
+
+# Long-text TTS: split text over a provider's limit and synthesize chunks concurrently
+LONG_TEXT_TTS = {
+    'ENABLED': True,
+    'CHUNK_CHARS': {
+        'google': 200,
+        'elevenlabs': 1000,
+        'google_cloud': 1500,
+    },
+    'CONCURRENCY': 4,  # Chunks in flight per request
+    'MAX_WORKERS': 16,  # Threads shared by all long-text requests
+}
+
+# Offline basic translation dictionaries (<source>-<target>.tsv files)
+BASIC_TRANSLATION = {
+    'DIRS': [BASE_DIR / 'api' / 'dictionaries'],
+    'DEFAULT_SOURCE_LANGUAGE': 'en',
+}
+
+# Signed API tokens issued at login
+TOKEN_AUTH = {
+    'MAX_AGE': 30 * 24 * 3600,  # Seconds before a token expires and the user must log in again
+}
+
+# Guest history imports carry up to STUDY_HISTORY['IMPORT_MAX_ITEMS'] items in one body
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+
+# GET /api/study/history/ pagination
+STUDY_HISTORY = {
+    'PAGE_SIZE': 50,
+    'MAX_PAGE_SIZE': 200,
+    # Guest history import: items per request and rows per INSERT
+    'IMPORT_MAX_ITEMS': 10000,
+    'IMPORT_BATCH_SIZE': 500,
+}
+
+# Character usage metering (uses the 'usage' entry in CACHES when it is Redis or Memcached)
+# Counts are buffered per process and written to UserProfile every FLUSH_INTERVAL seconds;
+# without Redis each worker checks the limit against its own counters and may overshoot it
+# by what other workers metered since their last flush
+USAGE_METERING = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'usage',
+    'FLUSH_INTERVAL': 30,
+    'DAILY_CHARACTER_LIMIT': None,  # Characters per user per day; over it requests get 429
+    'LOCAL_MAX_ENTRIES': 10000,  # Per-process counter cache size without Redis
+}
+
+# Structured JSON logs, written to stderr by a background thread (api/log.py)
+# Levels are per logger: 'api' covers every api module, 'api.requests' has one
+# record per request, 'api.providers' one per upstream call. 'api.payloads'
+# logs request bodies, texts and provider responses; set it to DEBUG to enable.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'api.log.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'queued_json': {
+            '()': 'api.log.QueuedStreamHandler',
+            'formatter': 'json',
+            'max_queue': 10000,  # Records beyond this are dropped rather than blocking requests
+        },
+    },
+    'root': {
+        'handlers': ['queued_json'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'django': {
+            'level': 'INFO',
+        },
+        'api': {
+            'level': 'INFO',
+        },
+        'api.requests': {
+            'level': 'INFO',
+        },
+        'api.providers': {
+            'level': 'INFO',
+        },
+        'api.payloads': {
+            'level': 'WARNING',
+        },
+    },
+}
+
+# manage.py test keeps these logs out of its output (api/test_runner.py)
+TEST_RUNNER = 'api.test_runner.QuietLoggingRunner'
+
+# Prometheus metrics at GET /metrics (api/metrics.py)
+# Each worker process writes its values to DIRECTORY; a scrape sums them all
+METRICS = {
+    'ENABLED': True,
+    'DIRECTORY': BASE_DIR / 'cache' / 'metrics',
+    'WRITE_INTERVAL': 5,  # Seconds between each process's snapshot writes
+    'AUTH_TOKEN': None,  # Set to require "Authorization: Bearer <token>" on /metrics
+}
+
+# On-demand request profiling (api/profiling.py)
+# Requests with a signed X-Profile-Token header (manage.py profiles token) or
+# picked by SAMPLE_RATE are run under cProfile; inspect with manage.py profiles
+REQUEST_PROFILING = {
+    'ENABLED': False,
+    'DIRECTORY': BASE_DIR / 'cache' / 'profiles',
+    'SAMPLE_RATE': 0.0,  # e.g. 0.001 profiles one request in a thousand
+    'SAMPLE_MEMORY': False,  # Also run tracemalloc on sampled requests
+    'TOKEN_MAX_AGE': 3600,
+    'MAX_PROFILES': 200,
+}
+
+# Read replica routing (api.db_router)
+DATABASE_REPLICA = {
+    'ALIAS': 'replica',  # Used only when DATABASES has this alias
+    'MODELS': ['accounts.studyhistory'],  # Models whose reads go to the replica
+    'PIN_SECONDS': 10,  # A user's reads stay on the primary this long after they save or delete
+    'PIN_CACHE_ALIAS': 'replica_pins',  # Shared with DJANGO_REDIS_URL; per process otherwise
+}
+
+# CORS (api.middleware.CorsMiddleware)
+# Origins the frontend is served from; DJANGO_CORS_ALLOWED_ORIGINS adds more (comma-separated)
+CORS = {
+    'ALLOWED_ORIGINS': [
+        f'http://{host}{port}' for host in ('localhost', '127.0.0.1') for port in ('', ':8000', ':8001', ':3000')
+    ] + [origin.strip() for origin in os.environ.get('DJANGO_CORS_ALLOWED_ORIGINS', '').split(',') if origin.strip()],
+    'ALLOWED_ORIGIN_REGEXES': [r'^http://192\.168\.\d{1,3}\.\d{1,3}(:\d+)?$'],  # LAN devices, as in ALLOWED_HOSTS
+    'PREFLIGHT_MAX_AGE': 7200,  # Seconds; browsers skip the OPTIONS request while it is cached
+}
+
+# Response compression (api.middleware.CompressionMiddleware)
+# Brotli is used when the brotli package is installed, gzip otherwise
+RESPONSE_COMPRESSION = {
+    'ENABLED': True,
+    'MIN_BYTES': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+
+# JSON requests and responses (api/json_codec.py)
+# orjson is used when installed; the study import and batch translation
+# endpoints accept bodies up to DATA_UPLOAD_MAX_MEMORY_SIZE instead
+JSON_CODEC = {
+    'BACKEND': 'auto',  # 'auto', 'orjson' or 'json'
+    'MAX_BODY_BYTES': 256 * 1024,
+}
+
+# Background pre-synthesis of saved study items (api/presynthesis.py)
+# New items are queued at every speed; run the workers with manage.py presynthesis work
+PRESYNTHESIS = {
+    'ENABLED': True,
+    'SPEEDS': ['slow', 'normal', 'fast'],
+    'CONCURRENCY': 4,  # Jobs in flight per worker process
+    'POLL_INTERVAL': 2,  # Seconds between checks for new jobs when idle
+    'LEASE_SECONDS': 300,  # A running job is handed to another worker after this
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 60,  # Seconds, multiplied by the attempt number
+    'MAX_TEXT_CHARS': 1000,
+    'PAID_PROVIDERS': False,  # Free providers only; True meters jobs like requests
+}
@@ -128,7 +128,8 @@ async function playTTS(text, speed, forceLanguage = null) {
                 sourceLanguage = 'auto';
             }
             
-            const response = await fetch(`${API_BASE_URL}/text-to-speech/`, {
+            // Binary endpoint: audio comes back as audio/mpeg bytes, not base64 JSON
+            const response = await fetch(`${API_BASE_URL}/text-to-speech/stream/`, {
                 method: 'POST',
                 headers: headers,
                 body: JSON.stringify({
@@ -140,12 +141,26 @@ async function playTTS(text, speed, forceLanguage = null) {
             });
             
             if (response.ok) {
-                const data = await response.json();
+                const contentType = response.headers.get('Content-Type') || '';
+                let data;
+                let audioBlob = null;
                 
-                if (data.success && data.audio_data) {
+                if (contentType.startsWith('audio/')) {
+                    data = {
+                        success: true,
+                        service: response.headers.get('X-TTS-Service') || 'google'
+                    };
+                    audioBlob = await response.blob();
+                } else {
+                    data = await response.json();
+                    if (data.success && data.audio_data) {
+                        audioBlob = base64ToBlob(data.audio_data, data.content_type || 'audio/mpeg');
+                    }
+                }
+                
+                if (audioBlob) {
                     console.log(`TTS via ${data.service} (${speed})`);
                     // Play audio from Django backend (binary data)
-                    const audioBlob = base64ToBlob(data.audio_data, data.content_type || 'audio/mpeg');
                     const audioUrl = URL.createObjectURL(audioBlob);
                     const audio = new Audio(audioUrl);
                     
@@ -636,6 +651,45 @@ async function saveLocally(text, translation, targetLanguage = 'ko', sourceLangu
     loadHistory();
 }
 
+// Move history saved as a guest into the account in one request
+async function importGuestHistory() {
+    const guestHistory = JSON.parse(localStorage.getItem(STORAGE_KEY) || '[]');
+    if (guestHistory.length === 0) {
+        return;
+    }
+    
+    try {
+        const response = await fetch(`${API_BASE_URL}/study/import/`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': `Token ${authToken}`
+            },
+            body: JSON.stringify({ items: guestHistory })
+        });
+        
+        if (response.ok) {
+            const data = await response.json();
+            console.log(`Imported guest history: ${data.inserted} new, ${data.merged} merged, ${data.repeated} repeated`);
+            localStorage.removeItem(STORAGE_KEY);
+        } else {
+            console.error('Guest history import failed:', response.status, response.statusText);
+        }
+    } catch (error) {
+        console.error('Error importing guest history:', error);
+    }
+}
+
+// Forget a saved login the backend no longer accepts
+function clearExpiredSession() {
+    console.log('Saved login has expired - please log in again');
+    authToken = null;
+    currentUser = null;
+    localStorage.removeItem('authToken');
+    localStorage.removeItem('currentUser');
+    updateUIForLoggedOutUser();
+}
+
 // Load and display history on page load
 async function loadHistory() {
     console.log(`Loading history - User: ${currentUser ? currentUser.username : 'guest'}`);
@@ -650,6 +704,12 @@ async function loadHistory() {
                 }
             });
             
+            if (response.status === 401) {
+                // Saved token expired or predates signed tokens - continue as guest
+                clearExpiredSession();
+                return loadHistory();
+            }
+            
             const data = await response.json();
             if (data.success && data.history) {
                 console.log(`Loaded ${data.history.length} items from database`);
@@ -830,6 +890,7 @@ async function login(username, password) {
                 can_use_ai: data.profile.can_use_ai
             });
             
+            await importGuestHistory();
             updateUIForLoggedInUser();
             loadHistory(); // Load user's study history from database
             